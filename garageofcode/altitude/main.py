@@ -1,11 +1,13 @@
 import os
-import re
 from mpl_toolkits.mplot3d import Axes3D
 
 import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image
 
+from garageofcode.altitude.xyz import CHUNK_SIZE, read_chunks, load_points, in_box, \
+                                     bin_file, bin_files, to_uint16
+
 def sparsify(fn, out_fn, sparse_factor):
     with open(out_fn, "w") as fo:
         with open(fn, "r") as f:
@@ -15,73 +17,52 @@ def sparsify(fn, out_fn, sparse_factor):
 
 def filter_box(fn, out_fn, box_x0, box_x1, box_y0, box_y1):
     total_lines = 0
+    box = (box_x0, box_x1, box_y0, box_y1)
     with open(out_fn, "w") as fo:
-        with open(fn, "r") as f:
-            for line in f:
-                line = re.sub(",", ".", line)
-                x, y, z = line.split(" ")
-                x, y, z = float(x), float(y), float(z)
-                if box_x0 <= x <= box_x1 and box_y0 <= y <= box_y1:
-                    fo.write(line)
-                    total_lines += 1
+        for P in read_chunks(fn):
+            P = P[in_box(P, box)]
+            np.savetxt(fo, P, fmt="%.15g")
+            total_lines += len(P)
     print(fn, ":", total_lines)
 
 def join_texts(d):
-    filenames = [fn[:-1] for fn in os.popen("ls {}".format(d)) if ".xyz" in fn]
+    filenames = [fn for fn in os.listdir(d) if ".xyz" in fn]
     filenames = list(sorted(filenames))
 
-    s = "\n".join([open(os.path.join(d, fn), "r").read()[:-1] for fn in filenames])
-
     out_name = os.path.join(d, "out")
-    s = re.sub(",", ".", s)
-    f = open(out_name, "w")
-    f.write(s)
-
-
-def bin_map(fn, save_fn):    
-    eps = 1e-6
+    with open(out_name, "wb") as fo:
+        for fn in filenames:
+            block = b"\n"
+            with open(os.path.join(d, fn), "rb") as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    fo.write(block.replace(b",", b"."))
+            if not block.endswith(b"\n"):
+                fo.write(b"\n")
+
+
+def bin_map(fn, save_fn, processes=None):
+    """
+    fn can be a single .xyz file or a list of them
+    """
     min_x, max_x = 600000.0,  771701.6
     min_y, max_y = 6400000.0, 6700000.0
 
-    #min_x, max_x = np.min(X), np.max(X)
-    #min_y, max_y = np.min(Y), np.max(Y)
     res_x = 1000
     res_y = 1000
-    #diff_x = (max_x - min_x) / res
-    #diff_y = (max_y - min_y) / res
-
-    A = np.zeros([res_y, res_x])
-    N = np.ones([res_y, res_x])*eps
 
     box_x0, box_x1 = 650000,  700000
     box_y0, box_y1 = 6550000, 6600000
-    diff_x = (box_x1 - box_x0) / res_x
-    diff_y = (box_y1 - box_y0) / res_y
-
-    for line in open(fn, "r"):
-        x, y, z = line.split(" ")
-        x, y, z = float(x), float(y), float(z)
-        if box_x0 <= x <= box_x1 and box_y0 <= y <= box_y1:
-            #xi = int((x - min_x) / diff_x - eps)
-            #yi = int((y - min_y) / diff_y - eps)
-            xi = int((x - box_x0) / diff_x - eps)
-            yi = int((y - box_y0) / diff_y - eps)
-            #A[res - 1 - yi, xi] += z
-            #N[res - 1 - yi, xi] += 1
-            A[res_y - 1 - yi, xi] += z
-            N[res_y - 1 - yi, xi] += 1
-
-    b = 2**16 - 1
-    alt = np.divide(A, N)
-    max_z = np.max(alt)
-    alt = (alt - eps) / max_z * b
-    alt = alt.astype(np.uint16)
+    box = (box_x0, box_x1, box_y0, box_y1)
+
+    if isinstance(fn, str):
+        A, N = bin_file(fn, box, res_x, res_y)
+    else:
+        A, N = bin_files(fn, box, res_x, res_y, processes)
+
+    alt = to_uint16(A, N)
 
     #print(N[50:70, 50:70])
 
-    #fig = plt.figure()
-    #ax = fig.add_subplot(111, projection='3d')
-    #ax.scatter(x, y, z)
     #plt.imshow(alt[100:500, 100:600])
     #plt.show()
 
@@ -90,12 +71,8 @@ def bin_map(fn, save_fn):
 
 
 def scatter3d(fn):
-    def line2xyz(line):
-        x, y, z = line.split(" ")
-        return float(x), float(y), float(z)
-
-    x, y, _ = zip(*[line2xyz(line) for line in open(fn, "r")])
-    plt.scatter(x, y)
+    P = load_points(fn)
+    plt.scatter(P[:, 0], P[:, 1])
     plt.show()
 
 
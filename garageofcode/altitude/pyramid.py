@@ -0,0 +1,234 @@
+import os
+import json
+from itertools import groupby
+
+import numpy as np
+
+from garageofcode.altitude.xyz import iter_points
+
+INDEX_FN = "index.json"
+
+def _level_fns(d, level):
+    return (os.path.join(d, "mean_{}.npy".format(level)),
+            os.path.join(d, "count_{}.npy".format(level)),
+            os.path.join(d, "tiles_{}.npy".format(level)))
+
+class _TileStore:
+    """
+    Sums and counts of tiles in a scratch file, one slot per tile,
+    so that only the tiles being updated are held in memory
+    """
+    def __init__(self, fn, tile_size):
+        self.fn = fn
+        self.T = tile_size
+        self.key2slot = {}
+        open(fn, "wb").close()
+
+    def _slot(self, slot, mode):
+        size = 2 * self.T * self.T
+        return np.memmap(self.fn, dtype=np.float64, mode=mode,
+                         offset=slot * size * 8, shape=(2, self.T, self.T))
+
+    def add(self, key, sums, counts):
+        slot = self.key2slot.get(key)
+        if slot is None:
+            self.key2slot[key] = len(self.key2slot)
+            with open(self.fn, "ab") as f:
+                f.write(np.stack([sums, counts]).astype(np.float64).tobytes())
+        else:
+            bins = self._slot(slot, "r+")
+            bins[0] += sums
+            bins[1] += counts
+            bins.flush()
+            del bins
+
+    def keys(self):
+        return sorted(self.key2slot)
+
+    def __getitem__(self, key):
+        bins = self._slot(self.key2slot[key], "r")
+        return np.array(bins[0]), np.array(bins[1])
+
+    def remove(self):
+        os.remove(self.fn)
+
+def _bin_tiles(filenames, x0, y0, cell_size, tile_size, store, use_cache=True):
+    """
+    Bins all points into level 0 tiles in store, flushed after every file.
+    Only tiles that got any points are stored
+    """
+    T = tile_size
+    for fn in filenames:
+        tile2bins = {}
+        for P in iter_points(fn, use_cache=use_cache):
+            ix = np.floor((P[:, 0] - x0) / cell_size).astype(np.int64)
+            iy = np.floor((P[:, 1] - y0) / cell_size).astype(np.int64)
+            keep = (ix >= 0) & (iy >= 0)
+            ix, iy, z = ix[keep], iy[keep], P[keep, 2]
+            tx, ty = ix // T, iy // T
+            local = (iy % T) * T + (ix % T)
+
+            # group the chunk by tile, then one bincount per tile
+            tile_keys = np.stack([tx, ty], axis=1)
+            uniq, inverse = np.unique(tile_keys, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+            for k, (tx_k, ty_k) in enumerate(uniq):
+                sel = order[bounds[k]:bounds[k+1]]
+                sums = np.bincount(local[sel], weights=z[sel], minlength=T*T)
+                counts = np.bincount(local[sel], minlength=T*T)
+                key = (int(tx_k), int(ty_k))
+                if key in tile2bins:
+                    tile2bins[key][0] += sums
+                    tile2bins[key][1] += counts
+                else:
+                    tile2bins[key] = [sums, counts]
+        for key, (sums, counts) in tile2bins.items():
+            store.add(key, sums.reshape(T, T), counts.reshape(T, T))
+    return store
+
+def _coarsen(store, tile_size, parent_store):
+    """
+    Merges 2x2 blocks of tiles and 2x2 blocks of cells within them,
+    one parent tile at a time
+    """
+    T = tile_size
+    h = T // 2
+    keys = sorted(store.keys(), key=lambda key: (key[0] // 2, key[1] // 2))
+    for parent, children in groupby(keys, key=lambda key: (key[0] // 2, key[1] // 2)):
+        p_sums, p_counts = np.zeros([T, T]), np.zeros([T, T])
+        for tx, ty in children:
+            sums, counts = store[(tx, ty)]
+            r = (ty % 2) * h
+            c = (tx % 2) * h
+            p_sums[r:r+h, c:c+h] += sums.reshape(h, 2, h, 2).sum(axis=(1, 3))
+            p_counts[r:r+h, c:c+h] += counts.reshape(h, 2, h, 2).sum(axis=(1, 3))
+        parent_store.add(parent, p_sums, p_counts)
+    return parent_store
+
+def _write_level(d, level, store, tile_size):
+    mean_fn, count_fn, tiles_fn = _level_fns(d, level)
+    keys = store.keys()
+    shape = (len(keys), tile_size, tile_size)
+    means = np.lib.format.open_memmap(mean_fn, mode="w+", dtype=np.float32, shape=shape)
+    counts = np.lib.format.open_memmap(count_fn, mode="w+", dtype=np.uint32, shape=shape)
+    for slot, key in enumerate(keys):
+        s, n = store[key]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[slot] = np.where(n > 0, s / n, np.nan)
+        counts[slot] = n
+    means.flush()
+    counts.flush()
+    np.save(tiles_fn, np.array(keys, dtype=np.int64).reshape(-1, 2))
+
+def build_pyramid(filenames, d, origin, cell_size, tile_size=256, levels=6, use_cache=True):
+    """
+    Bins the point clouds in filenames once into tile_size x tile_size tiles,
+    and builds levels-1 coarser levels by halving the resolution each time.
+    Cells at level l are cell_size * 2**l wide, and the grid starts at origin.
+    Only tiles that contain points are stored.
+    """
+    if tile_size % 2:
+        raise ValueError("tile_size must be even")
+    if not os.path.exists(d):
+        os.makedirs(d)
+    x0, y0 = origin
+
+    # sums and counts go through scratch files, one level at a time
+    scratch_fn = lambda level: os.path.join(d, "scratch_{}.bin".format(level))
+    store = _TileStore(scratch_fn(0), tile_size)
+    _bin_tiles(filenames, x0, y0, cell_size, tile_size, store, use_cache)
+    for level in range(levels):
+        if level:
+            child_store = store
+            store = _coarsen(child_store, tile_size, _TileStore(scratch_fn(level), tile_size))
+            child_store.remove()
+        _write_level(d, level, store, tile_size)
+    store.remove()
+
+    index = {"origin": [x0, y0],
+             "cell_size": cell_size,
+             "tile_size": tile_size,
+             "levels": levels}
+    with open(os.path.join(d, INDEX_FN), "w") as f:
+        json.dump(index, f)
+    return TilePyramid(d)
+
+class TilePyramid:
+    """
+    Read side of a tile pyramid built by build_pyramid.
+    Tiles are memory mapped, so a query only reads
+    the tiles that overlap the requested box
+    """
+    def __init__(self, d):
+        with open(os.path.join(d, INDEX_FN), "r") as f:
+            index = json.load(f)
+        self.x0, self.y0 = index["origin"]
+        self.cell_size = index["cell_size"]
+        self.tile_size = index["tile_size"]
+        self.levels = index["levels"]
+
+        self.means = []
+        self.counts = []
+        self.tile2slot = []
+        for level in range(self.levels):
+            mean_fn, count_fn, tiles_fn = _level_fns(d, level)
+            self.means.append(np.load(mean_fn, mmap_mode="r"))
+            self.counts.append(np.load(count_fn, mmap_mode="r"))
+            tiles = np.load(tiles_fn)
+            self.tile2slot.append({(int(tx), int(ty)): slot
+                                   for slot, (tx, ty) in enumerate(tiles)})
+
+    def level_cell_size(self, level):
+        return self.cell_size * 2**level
+
+    def choose_level(self, box, max_cells):
+        """
+        Finest level at which box is covered by at most max_cells cells
+        """
+        x0, x1, y0, y1 = box
+        for level in range(self.levels):
+            cs = self.level_cell_size(level)
+            if (x1 - x0) / cs * (y1 - y0) / cs <= max_cells:
+                return level
+        return self.levels - 1
+
+    def query(self, box, level=None, max_cells=10**6, counts=False):
+        """
+        Mean altitude over box = (x0, x1, y0, y1) at the given level,
+        NaN where there are no points.
+        Row 0 is the northern edge, like bin_map.
+        If counts, returns the point counts as well
+        """
+        if level is None:
+            level = self.choose_level(box, max_cells)
+        T = self.tile_size
+        cs = self.level_cell_size(level)
+        x0, x1, y0, y1 = box
+        ix0 = int(np.floor((x0 - self.x0) / cs))
+        ix1 = int(np.ceil((x1 - self.x0) / cs))
+        iy0 = int(np.floor((y0 - self.y0) / cs))
+        iy1 = int(np.ceil((y1 - self.y0) / cs))
+
+        out = np.full([iy1 - iy0, ix1 - ix0], np.nan, dtype=np.float32)
+        out_n = np.zeros([iy1 - iy0, ix1 - ix0], dtype=np.uint32)
+        tile2slot = self.tile2slot[level]
+        means = self.means[level]
+        cnts = self.counts[level]
+        for ty in range(iy0 // T, (iy1 - 1) // T + 1):
+            for tx in range(ix0 // T, (ix1 - 1) // T + 1):
+                slot = tile2slot.get((tx, ty))
+                if slot is None:
+                    continue
+                # overlap in global cell coordinates
+                gx0, gx1 = max(ix0, tx*T), min(ix1, (tx+1)*T)
+                gy0, gy1 = max(iy0, ty*T), min(iy1, (ty+1)*T)
+                tile_sl = (slot, slice(gy0 - ty*T, gy1 - ty*T), slice(gx0 - tx*T, gx1 - tx*T))
+                out_sl = (slice(gy0 - iy0, gy1 - iy0), slice(gx0 - ix0, gx1 - ix0))
+                out[out_sl] = means[tile_sl]
+                if counts:
+                    out_n[out_sl] = cnts[tile_sl]
+        if counts:
+            return out[::-1], out_n[::-1]
+        return out[::-1]
@@ -0,0 +1,130 @@
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+CHUNK_SIZE = 2**26 # bytes of text per parsed chunk
+CACHE_EXT = ".f8"
+
+def parse_chunk(text):
+    """
+    Parses a block of 'x y z' lines, with decimal comma or point,
+    into an (n, 3) array
+    """
+    text = text.replace(b",", b".")
+    return np.fromstring(text, sep=" ").reshape(-1, 3)
+
+def read_chunks(fn, chunk_size=CHUNK_SIZE):
+    """
+    Yields the points of an .xyz file as (n, 3) arrays,
+    reading chunk_size bytes of text at a time
+    """
+    rest = b""
+    with open(fn, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            rest = block[cut:]
+            if cut:
+                yield parse_chunk(block[:cut])
+    if rest.strip():
+        yield parse_chunk(rest)
+
+def get_cache_fn(fn):
+    return fn + CACHE_EXT
+
+def cache_points(fn, cache_fn=None, chunk_size=CHUNK_SIZE):
+    """
+    Parses an .xyz file once and stores the points
+    as raw float64 triplets, which can be memory mapped
+    """
+    if cache_fn is None:
+        cache_fn = get_cache_fn(fn)
+    tmp_fn = cache_fn + ".tmp"
+    with open(tmp_fn, "wb") as fo:
+        for P in read_chunks(fn, chunk_size):
+            P.astype(np.float64).tofile(fo)
+    os.replace(tmp_fn, cache_fn)
+    return cache_fn
+
+def load_points(fn):
+    """
+    Returns all points of fn as a read-only memory mapped (n, 3) array,
+    building the binary cache if it is missing or older than fn
+    """
+    cache_fn = get_cache_fn(fn)
+    if not os.path.exists(cache_fn) or os.path.getmtime(cache_fn) < os.path.getmtime(fn):
+        cache_points(fn, cache_fn)
+    if not os.path.getsize(cache_fn):
+        return np.zeros([0, 3])
+    return np.memmap(cache_fn, dtype=np.float64, mode="r").reshape(-1, 3)
+
+def iter_points(fn, chunk_len=2**22, use_cache=True):
+    """
+    Yields (n, 3) chunks of points, from the binary cache if use_cache
+    """
+    if not use_cache:
+        yield from read_chunks(fn)
+        return
+    P = load_points(fn)
+    for i in range(0, len(P), chunk_len):
+        yield P[i:i+chunk_len]
+
+def in_box(P, box):
+    x0, x1, y0, y1 = box
+    x, y = P[:, 0], P[:, 1]
+    return (x0 <= x) & (x <= x1) & (y0 <= y) & (y <= y1)
+
+def bin_chunk(P, box, res_x, res_y, A, N, eps=1e-6):
+    """
+    Adds the altitudes of the points in P that fall in box
+    to the raster sums A and counts N, in place.
+    Row 0 is the northern edge
+    """
+    x0, x1, y0, y1 = box
+    diff_x = (x1 - x0) / res_x
+    diff_y = (y1 - y0) / res_y
+
+    P = P[in_box(P, box)]
+    xi = ((P[:, 0] - x0) / diff_x - eps).astype(int).clip(0, res_x - 1)
+    yi = ((P[:, 1] - y0) / diff_y - eps).astype(int).clip(0, res_y - 1)
+    flat = (res_y - 1 - yi) * res_x + xi
+    A += np.bincount(flat, weights=P[:, 2], minlength=res_x * res_y).reshape(res_y, res_x)
+    N += np.bincount(flat, minlength=res_x * res_y).reshape(res_y, res_x)
+
+def bin_file(fn, box, res_x, res_y, use_cache=True):
+    """
+    Returns the altitude sums and point counts of fn binned over box
+    """
+    A = np.zeros([res_y, res_x])
+    N = np.zeros([res_y, res_x])
+    for P in iter_points(fn, use_cache=use_cache):
+        bin_chunk(P, box, res_x, res_y, A, N)
+    return A, N
+
+def bin_files(filenames, box, res_x, res_y, processes=None, use_cache=True):
+    """
+    Bins each file in its own process and merges the partial rasters
+    """
+    work = partial(bin_file, box=box, res_x=res_x, res_y=res_y, use_cache=use_cache)
+    A = np.zeros([res_y, res_x])
+    N = np.zeros([res_y, res_x])
+    with Pool(processes) as pool:
+        for A_f, N_f in pool.imap_unordered(work, filenames):
+            A += A_f
+            N += N_f
+    return A, N
+
+def to_uint16(A, N, eps=1e-6):
+    """
+    Mean altitude per cell, scaled to the uint16 range
+    """
+    b = 2**16 - 1
+    alt = np.divide(A, N + eps)
+    max_z = np.max(alt)
+    alt = (alt - eps) / max_z * b
+    return alt.astype(np.uint16)
@@ -1,6 +1,6 @@
 import numpy as np
 from itertools import product
-from collections import Iterable
+from collections.abc import Iterable
 import networkx as nx
 
 class hashabledict(dict):
@@ -34,7 +34,8 @@ class Box(hashabledict):
             if not self.is_ordered():
                 self.clear()
 
-    def autodict(self, dim2val):
+    @staticmethod
+    def autodict(dim2val):
         if isinstance(dim2val, dict):
             return dim2val
         elif isinstance(dim2val, Iterable):
@@ -150,10 +151,126 @@ class Box(hashabledict):
         else:
             return ()
 
+class BoxIndex:
+    """
+    The nodes of a BoxTree as flat arrays.
+    lower[k, c] <= x < upper[k, c] for the points x of node k in dimension dims[c],
+    and an empty or missing dimension has lower=inf, upper=-inf.
+    The children of node k are children[indptr[k]:indptr[k+1]]
+    """
+    def __init__(self, T):
+        self.nodes = list(T.nodes())
+        node2idx = {node: k for k, node in enumerate(self.nodes)}
+        self.dim2col = {}
+        for node in self.nodes:
+            for dim in node:
+                self.dim2col.setdefault(dim, len(self.dim2col))
+
+        K, D = len(self.nodes), len(self.dim2col)
+        self.lower = np.full([K, D], np.inf)
+        self.upper = np.full([K, D], -np.inf)
+        for k, node in enumerate(self.nodes):
+            for dim, ij in node.items():
+                if len(ij):
+                    self.lower[k, self.dim2col[dim]], self.upper[k, self.dim2col[dim]] = ij
+
+        num_children = np.array([len(T[node]) for node in self.nodes], dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(num_children)])
+        self.children = np.array([node2idx[child] for node in self.nodes for child in T[node]],
+                                 dtype=np.int64)
+        self.leafs = np.flatnonzero(num_children == 0)
+        in_degree = np.bincount(self.children, minlength=K)
+        roots = np.flatnonzero(in_degree == 0)
+        self.root = roots[0] if len(roots) else None
+
+    def columns(self, dims):
+        """
+        Columns of dims, or None if some dim is in no box
+        """
+        try:
+            return np.array([self.dim2col[dim] for dim in dims], dtype=np.int64)
+        except KeyError:
+            return None
+
+    def contains(self, ks, cols, X):
+        """
+        Whether node ks[p] contains the point X[p] in the dimensions cols
+        """
+        lower = self.lower[ks[:, None], cols]
+        upper = self.upper[ks[:, None], cols]
+        return np.all((lower <= X) & (X < upper), axis=1)
+
+    def query(self, cols, x):
+        """
+        Leafs containing the point x, by one test against all leafs
+        """
+        if cols is None:
+            return self.leafs[:0]
+        inside = self.contains(self.leafs, cols, np.broadcast_to(x, [len(self.leafs), len(cols)]))
+        return self.leafs[inside]
+
+    def query_many(self, cols, X):
+        """
+        Leafs containing each row of X, as (row, leaf) pairs.
+        Descends the tree one level at a time for all points together
+        """
+        P = len(X)
+        if cols is None or self.root is None:
+            return np.zeros(0, dtype=np.int64), self.leafs[:0]
+        rows = np.arange(P)
+        ks = np.full(P, self.root)
+        found_rows, found_leafs = [], []
+        while len(ks):
+            inside = self.contains(ks, cols, X[rows])
+            rows, ks = rows[inside], ks[inside]
+            start, stop = self.indptr[ks], self.indptr[ks+1]
+            is_leaf = start == stop
+            found_rows.append(rows[is_leaf])
+            found_leafs.append(ks[is_leaf])
+            # expand every node to its children
+            num_children = stop - start
+            offsets = np.repeat(start - np.cumsum(num_children) + num_children, num_children)
+            ks = self.children[offsets + np.arange(num_children.sum())]
+            rows = np.repeat(rows, num_children)
+        return np.concatenate(found_rows), np.concatenate(found_leafs)
+
+def _invalidating(method):
+    """
+    Wraps a mutating DiGraph method to drop the BoxIndex of the tree
+    """
+    def wrapper(self, *args, **kwargs):
+        self._index = None
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
 class BoxTree(nx.DiGraph):
+    """
+    Tree of boxes, where the children of a box lie within it.
+    Queries use a BoxIndex that is built on first use
+    and rebuilt after the tree has changed
+    """
+    _index = None
+
+    add_node = _invalidating(nx.DiGraph.add_node)
+    add_nodes_from = _invalidating(nx.DiGraph.add_nodes_from)
+    add_edge = _invalidating(nx.DiGraph.add_edge)
+    add_edges_from = _invalidating(nx.DiGraph.add_edges_from)
+    remove_node = _invalidating(nx.DiGraph.remove_node)
+    remove_nodes_from = _invalidating(nx.DiGraph.remove_nodes_from)
+    remove_edge = _invalidating(nx.DiGraph.remove_edge)
+    remove_edges_from = _invalidating(nx.DiGraph.remove_edges_from)
+    clear = _invalidating(nx.DiGraph.clear)
+
     def copy(self):
         return nx.DiGraph.copy(self)
 
+    def get_index(self):
+        if self._index is None:
+            self._index = BoxIndex(self)
+        return self._index
+
     def get_leafs(self):
         return [v for v, d in self.out_degree() if d == 0]
     
@@ -161,25 +278,39 @@ class BoxTree(nx.DiGraph):
         return len(self.get_leafs())
 
     def get_root(self):
-        for node, deg in self.in_degree():
-            if deg == 0:
-                return node
-        else:
+        index = self.get_index()
+        if index.root is None:
             print("Found no root!")
+            return None
+        return index.nodes[index.root]
 
     def profile(self, dim2val):
         """
         Returns leafs of T that overlap with dim2val,
         projected onto the dimensions that are not specified in dim2val
         """
-        stack = [self.get_root()]
-        while stack:
-            box = stack.pop()
-            if box.contains(dim2val):
-                if not self[box]: # found a leaf
-                    yield box
-                for child in self[box]:
-                    stack.append(child)
+        dim2val = Box.autodict(dim2val)
+        index = self.get_index()
+        dims = list(dim2val)
+        x = np.array([dim2val[dim] for dim in dims], dtype=float)
+        for k in index.query(index.columns(dims), x):
+            yield index.nodes[k]
+
+    def profile_many(self, X, dims=None):
+        """
+        profile for every row of X at once.
+        dims are the dimensions of the columns of X, by default 0, 1, ...
+        Returns a list with the leafs of every row
+        """
+        X = np.array(X, dtype=float).reshape(len(X), -1)
+        if dims is None:
+            dims = range(X.shape[1])
+        index = self.get_index()
+        rows, ks = index.query_many(index.columns(list(dims)), X)
+        row2leafs = [[] for _ in range(len(X))]
+        for row, k in zip(rows.tolist(), ks.tolist()):
+            row2leafs[row].append(index.nodes[k])
+        return row2leafs
 
     def remove_subtree(self, node): 
         """
@@ -143,16 +143,19 @@ class Heap:
         return len(self.h)
 
 def equivalence_partition(iterable, key):
-    classes = []
+    """
+    Partitions iterable into sets of items with equal key,
+    in order of first appearance.
+    key must return hashable values
+    """
+    key2class = {}
     for item in iterable:
-        for c in classes:
-            c_item = next(iter(c))
-            if key(c_item) == key(item):
-                c.add(item)
-                break
+        k = key(item)
+        if k in key2class:
+            key2class[k].add(item)
         else:
-            classes.append({item})
-    return classes
+            key2class[k] = {item}
+    return list(key2class.values())
 
 if __name__ == '__main__':
     h = Heap([10, 20, 6], key=lambda x: x**2)
@@ -1,13 +1,13 @@
 import os
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.optimize import nnls, minimize
 
 import pandas as pd
 
-from sentian_miami import get_solver
-
 line_data_dir = "/home/jdw/garageofcode/data/kaggle/corona/"
 data_dir = "/home/jdw/repositories/COVID-19/csse_covid_19_data/csse_covid_19_time_series/"
 res_dir = "/home/jdw/garageofcode/results/corona/"
@@ -36,21 +36,32 @@ def exponential_regression(cases):
     beta = np.exp(beta)
     return alpha, beta
 
-def get_num_confirmed(country, deaths=False):
+@lru_cache(maxsize=None)
+def get_confirmed_table(deaths=False):
+    """
+    Global time series summed per country, read once.
+    Returns a (countries x days) DataFrame, columns as in the csv ("%m/%d/%y")
+    """
     if deaths:
         df = pd.read_csv(num_death_data)
     else:
         df = pd.read_csv(num_cases_data)
+    date_cols = list(df.columns[4:])
+    return df.groupby("Country/Region")[date_cols].sum()
 
-    df = df[df["Country/Region"] == country].sum()
-    days = [datetime.strptime(date, "%m/%d/%y") for date in df.keys()[4:]]
-    last_day = max(days)
+def get_num_confirmed(country, deaths=False):
+    table = get_confirmed_table(deaths)
+    if country in table.index:
+        df = table.loc[country].copy()
+    else:
+        df = pd.Series(0, index=table.columns)
     if country in latest:
+        last_day = max(pd.to_datetime(df.index, format="%m/%d/%y"))
         val = latest[country]
         today = last_day + timedelta(hours=24)
         today = datetime.strftime(today, "%m/%d/%y")
         df.at[today] = val * 1.0
-    return df.iloc[4:]
+    return df
 
 def case_trend():
     for country in ["Sweden", "US", "France", "Germany", "Italy", 
@@ -227,44 +238,25 @@ def new_cases_per_day(report_deaths=False):
 
 
 def get_do_dc(df):
-    dos = []
-    dcs = []
-
-    num_errors = 0
-
-    for do, dc in zip(df["date_onset_symptoms"], df["date_confirmation"]):
-        try:
-            do = datetime.strptime(do, "%d.%m.%Y")
-            dc = datetime.strptime(dc, "%d.%m.%Y")
-        except TypeError as e:
-            print("do:", do)
-            print("dc:", dc)
-            raise e
-        except ValueError as e:
-            #print("ValueError")
-            #print("do:", do)
-            #print("dc:", dc)
-            #print()
-            num_errors += 1
-            continue
-
-        dos.append(do)
-        dcs.append(dc)
+    """
+    Onset and confirmation dates, for rows where both parse
+    """
+    do = pd.to_datetime(df["date_onset_symptoms"], format="%d.%m.%Y", errors="coerce")
+    dc = pd.to_datetime(df["date_confirmation"], format="%d.%m.%Y", errors="coerce")
+    ok = do.notna() & dc.notna()
 
-    #print("Number of row errors:", num_errors)
+    #print("Number of row errors:", (~ok).sum())
 
-    return dos, dcs
+    return do[ok].to_numpy(), dc[ok].to_numpy()
 
 
+@lru_cache(maxsize=None)
 def get_delay2freq():
-    df = pd.read_csv(case_data)
+    df = pd.read_csv(case_data, usecols=["date_onset_symptoms", "date_confirmation"])
     df = df.dropna(subset=["date_onset_symptoms", "date_confirmation"])
-    country2ncases = df.groupby("country").size()
-    #print(country2ncases)
-    #exit(0)
     date_onsets, date_conf = get_do_dc(df)
-    diff = np.array([(dc - do).total_seconds() / (3600 * 24) 
-                        for do, dc in zip(date_onsets, date_conf) if dc >= do])
+    diff = (date_conf - date_onsets) / np.timedelta64(1, "D")
+    diff = diff[diff >= 0]
     '''
     plt.hist(-diff, bins=2*int(max(diff)))
     plt.title("N={}\n(China 455, Japan 135, Singapore 69, South Korea 21, Others 54)".format(len(diff)))
@@ -275,80 +267,88 @@ def get_delay2freq():
     #print("Median:", np.median(diff))
 
     delay2freq, _ = np.histogram(diff, bins=int(max(diff)))
+    delay2freq.flags.writeable = False # shared between calls
     return delay2freq
 
 
-def estimate_unconfirmed():
-    for country in ["Singapore", "Sweden", "US", "France", "Germany", "Italy", 
-                    "Iran", "UK", "South Korea", "Netherlands", 
-                    "Norway", "Belgium", "Spain", "Switzerland", 
-                    "Japan", "Mainland China"]:
-        #df_country = df[df["Country/Region"] == country]
-        #day2case = df_country.groupby(["ObservationDate"])["Confirmed"].sum()
-        day2case = get_num_confirmed(country)
-        #day2case = day2case[day2case >= 70]
-        days = [datetime.strptime(date, "%m/%d/%y") for date in day2case.keys()]
-
-        total_confirmed = day2case.to_numpy()
-        times_arr = np.array(range(len(total_confirmed)))
-
-        cutoff_days = 14
-        delay2freq = get_delay2freq()
-        delay2freq = delay2freq[:cutoff_days] # two weeks cutoff
-        delay2freq = delay2freq / np.sum(delay2freq) # normalize
-        delay2freq = delay2freq[::-1]
-        #plt.plot(delay2freq)
-        #plt.show()
-
-        new_confirmed = np.diff(total_confirmed)
-        #new_confirmed = new_confirmed[:-28]
-        N = len(new_confirmed)
-        A = np.zeros([N, N + cutoff_days - 1])
-        for i in range(N):
-            A[i, i:i+cutoff_days] = delay2freq
-
-        #plt.imshow(A)
-        #plt.show()
-
-        solver = get_solver("couenne")
-
-        new_cases = [solver.NumVar(lb=0) for _ in range(N + cutoff_days)]
-        errs = []
-        for row, new_conf in zip(A, new_confirmed):
-            est_confirmed = solver.Sum([nc * elem for elem, nc in zip(row, new_cases)])
-            err = solver.NumVar(lb=0)
-            err = (est_confirmed - new_conf)**2
-            # absolute error
-            #solver.Add(err >= est_confirmed - new_conf)
-            #solver.Add(err >= new_conf - est_confirmed)
-            errs.append(err)
-        total_err = solver.Sum(errs)
-
-        total_cases = [solver.Sum(new_cases[:i+1]) for i in range(N + cutoff_days)]
-        total_cases = total_cases[cutoff_days-1:]
-        print(len(total_confirmed), len(total_cases))
-        for tn_conf, tn_case in zip(total_confirmed, total_cases):
-            solver.Add(tn_case >= tn_conf)
-
-        #mass: baseline hypothesis is that number of new cases is 0
-        #mass = solver.Sum(nc for nc in new_cases)        
-        #mass_sq = solver.Sum(nc**2 for nc in new_cases)
-        
-        #diff: baseline hypothesis is that number of new cases is like yesterday
-        #diff = solver.Sum([(nc1 - nc0)**2 for nc0, nc1 in zip(new_cases, new_cases[1:])])
-        
-        #exp_diff: baseline hypothesis is that number of new cases grow by 30% each day
-        exp_diff = solver.Sum([(nc1 - 1.3 * nc0)**2 for nc0, nc1 in zip(new_cases, new_cases[1:])])
-
-
-        solver.SetObjective(total_err + exp_diff * 0.1, maximize=False)
-        solver.Solve(time_limit=10, verbose=False)
+def deconvolve_onsets(new_confirmed, delay2freq, total_confirmed=None,
+                      growth=1.3, smoothing=0.1):
+    """
+    Estimates new cases by onset day from new confirmed cases,
+    for many series at once.
+    new_confirmed: (N, C), one column per country
+    delay2freq: probability of confirmation 0, 1, ... days after onset
+    total_confirmed: (N + 1, C), if given the total cases must be
+    at least the total confirmed
+    Minimizes |A x - new_confirmed|^2 + smoothing * |x[t+1] - growth * x[t]|^2
+    with x >= 0, one column at a time.
+    Returns (N + len(delay2freq), C)
+    """
+    N, C = new_confirmed.shape
+    cutoff_days = len(delay2freq)
+    M = N + cutoff_days
+    kernel = delay2freq[::-1]
+
+    # the last day has no confirmations yet, only the other terms
+    A = np.zeros([N, M])
+    rows = np.arange(N)[:, None]
+    A[rows, rows + np.arange(cutoff_days)] = kernel
+
+    #  exp_diff: baseline hypothesis is that number of new cases grow by 30% each day
+    D = np.zeros([M - 1, M])
+    D[np.arange(M - 1), np.arange(M - 1)] = -growth
+    D[np.arange(M - 1), np.arange(1, M)] = 1
+
+    lhs = np.vstack([A, np.sqrt(smoothing) * D])
+    # total cases up to day cutoff_days - 1 + k, against total confirmed on day k
+    S = np.tril(np.ones([M, M]))[cutoff_days - 1:]
+
+    new_cases = np.zeros([M, C])
+    for c in range(C):
+        rhs = np.concatenate([new_confirmed[:, c], np.zeros(M - 1)])
+        x, _ = nnls(lhs, rhs)
+        if total_confirmed is not None and np.any(S @ x < total_confirmed[:, c]):
+            x = _constrained_lsq(lhs, rhs, S, total_confirmed[:, c], x)
+        new_cases[:, c] = x
+    return new_cases
+
+def _constrained_lsq(lhs, rhs, S, lower, x0):
+    """
+    min |lhs x - rhs|^2 with x >= 0 and S x >= lower
+    """
+    res = minimize(lambda x: np.sum((lhs @ x - rhs)**2), x0,
+                   jac=lambda x: 2 * lhs.T @ (lhs @ x - rhs),
+                   bounds=[(0, None)] * len(x0),
+                   constraints=[{"type": "ineq",
+                                 "fun": lambda x: S @ x - lower,
+                                 "jac": lambda x: S}],
+                   method="SLSQP", options={"maxiter": 1000, "ftol": 1e-12})
+    return np.maximum(res.x, 0)
 
-        new_cases_solve = [solver.solution_value(nc) for nc in new_cases]
-        total_cases = np.cumsum(new_cases_solve)
 
-        plt.plot(range(cutoff_days - 1, N + cutoff_days), total_confirmed, c="b")
-        plt.plot(range(N + cutoff_days), total_cases, c="r")
+def estimate_unconfirmed():
+    countries = ["Singapore", "Sweden", "US", "France", "Germany", "Italy", 
+                 "Iran", "UK", "South Korea", "Netherlands", 
+                 "Norway", "Belgium", "Spain", "Switzerland", 
+                 "Japan", "Mainland China"]
+    total_confirmed = np.array([get_num_confirmed(country).to_numpy(dtype=float) 
+                                for country in countries]).T
+
+    cutoff_days = 14
+    delay2freq = get_delay2freq()
+    delay2freq = delay2freq[:cutoff_days] # two weeks cutoff
+    delay2freq = delay2freq / np.sum(delay2freq) # normalize
+
+    new_confirmed = np.diff(total_confirmed, axis=0)
+    #new_confirmed = new_confirmed[:-28]
+    N = len(new_confirmed)
+
+    new_cases = deconvolve_onsets(new_confirmed, delay2freq, total_confirmed)
+    total_cases = np.cumsum(new_cases, axis=0)
+
+    for i, country in enumerate(countries):
+        plt.plot(range(cutoff_days - 1, N + cutoff_days), total_confirmed[:, i], c="b")
+        plt.plot(range(N + cutoff_days), total_cases[:, i], c="r")
         plt.title("Estimated best case unconfirmed {}".format(country))
         plt.xlabel("Days")
         plt.legend(["Confirmed cases", "Estimated total incl. unconfirmed"])
@@ -1,4 +1,5 @@
 import os
+import json
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
@@ -8,6 +9,11 @@ import pandas as pd
 
 from garageofcode.common.utils import get_fn
 
+longs = (13.05, 13.8)
+lats = (52.3, 52.7)
+cache_columns = ["listing_id", "date", "price", "longitude", "latitude"]
+SOURCES_FN = "sources.json"
+
 def price_map(fn):
     df = pd.read_csv(fn)
     reasonable = df["price"].between(1, 200)
@@ -23,8 +29,6 @@ def price_map(fn):
 
 
 def price_map_binned(df, aggregator="min", fig=None, ax=None):
-    longs = (13.05, 13.8)
-    lats = (52.3, 52.7)
     #df = pd.read_csv(listings_fn)
     #available = df["availability_365"] >= 200
     #df = df[available]
@@ -62,48 +66,160 @@ def price_map_binned(df, aggregator="min", fig=None, ax=None):
     ax.set_title("Berlin AirBnB listings Nov 2018-Nov 2019\nAggregated by {} price".format(aggregator))
 
 
-def date_price_map(listings_fn, availability_fn):
-    df = pd.read_csv(availability_fn)
-    df = df[df["available"] == "t"]
-    df["price"] = df["price"].map(lambda x: float(x[1:].replace(",", "")))
-    df.sort_values("date")
-    date_groups = df.groupby("date")
+def parse_price(prices):
+    """
+    "$1,234.00" -> 1234.0, vectorized
+    """
+    return pd.to_numeric(prices.str[1:].str.replace(",", "", regex=False)).astype(np.float32)
+
+
+def build_cache(listings_fn, availability_fn, cache_dir, chunksize=10**6):
+    """
+    Parses the calendar once into a columnar cache of available listings:
+    one .npy per column, sorted by date, with prices parsed and coordinates joined.
+    dates.npy and offsets.npy give the partition of each date:
+    rows offsets[i]:offsets[i+1] have date dates[i]
+    """
+    listings = pd.read_csv(listings_fn, usecols=["id", "longitude", "latitude"])
+    listings = listings.drop_duplicates("id").set_index("id")
+
+    parts = []
+    for df in pd.read_csv(availability_fn, chunksize=chunksize,
+                          usecols=["listing_id", "date", "available", "price"]):
+        df = df[df["available"] == "t"]
+        coords = listings.reindex(df["listing_id"].to_numpy())
+        parts.append({"listing_id": df["listing_id"].to_numpy(dtype=np.int64),
+                      "date": pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]"),
+                      "price": parse_price(df["price"]).to_numpy(),
+                      "longitude": coords["longitude"].to_numpy(dtype=np.float32),
+                      "latitude": coords["latitude"].to_numpy(dtype=np.float32)})
+
+    cols = {key: np.concatenate([part[key] for part in parts]) for key in cache_columns}
+    order = np.argsort(cols["date"], kind="stable")
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    for key in cache_columns:
+        np.save(os.path.join(cache_dir, key + ".npy"), cols[key][order])
+    dates, offsets = np.unique(cols["date"][order], return_index=True)
+    np.save(os.path.join(cache_dir, "dates.npy"), dates)
+    np.save(os.path.join(cache_dir, "offsets.npy"), np.append(offsets, len(order)))
+    # the sources mark the cache as complete, so they go last
+    with open(os.path.join(cache_dir, SOURCES_FN), "w") as f:
+        json.dump(source_stats(listings_fn, availability_fn), f)
+
+
+def source_stats(listings_fn, availability_fn):
+    """
+    Size and modification time of the files a cache is built from
+    """
+    return [[os.path.getsize(fn), os.path.getmtime(fn)] for fn in [listings_fn, availability_fn]]
+
+
+def load_cache(cache_dir):
+    """
+    Columns are memory mapped
+    """
+    cache = {key: np.load(os.path.join(cache_dir, key + ".npy"), mmap_mode="r") 
+             for key in cache_columns}
+    cache["dates"] = np.load(os.path.join(cache_dir, "dates.npy"))
+    cache["offsets"] = np.load(os.path.join(cache_dir, "offsets.npy"))
+    return cache
+
+
+def get_cache(listings_fn, availability_fn, cache_dir=None):
+    """
+    The cache of listings_fn and availability_fn,
+    rebuilt if it is missing or either file has changed since
+    """
+    if cache_dir is None:
+        cache_dir = availability_fn + ".cache"
+    sources_fn = os.path.join(cache_dir, SOURCES_FN)
+    sources = None
+    if os.path.exists(sources_fn):
+        with open(sources_fn, "r") as f:
+            sources = json.load(f)
+    if sources != source_stats(listings_fn, availability_fn):
+        build_cache(listings_fn, availability_fn, cache_dir)
+    return load_cache(cache_dir)
+
+
+def binned_price_maps(cache, aggregator="min", x_grid=None, y_grid=None, price_range=(1, 200)):
+    """
+    Aggregated price per (date, longitude bin, latitude bin), for all dates in one pass.
+    Bins are right-closed, like pd.cut. Empty bins are NaN.
+    Returns an array of shape (num dates, len(x_grid) - 1, len(y_grid) - 1)
+    """
+    if x_grid is None:
+        x_grid = np.linspace(*longs)
+    if y_grid is None:
+        y_grid = np.linspace(*lats)
+    nx_bins, ny_bins = len(x_grid) - 1, len(y_grid) - 1
+    num_dates = len(cache["dates"])
+
+    price = np.asarray(cache["price"])
+    date_idx = np.repeat(np.arange(num_dates), np.diff(cache["offsets"]))
+    xi = np.searchsorted(x_grid, cache["longitude"], side="left") - 1
+    yi = np.searchsorted(y_grid, cache["latitude"], side="left") - 1
+    keep = (price >= price_range[0]) & (price <= price_range[1]) & \
+           (xi >= 0) & (xi < nx_bins) & (yi >= 0) & (yi < ny_bins)
+    flat = (date_idx[keep] * nx_bins + xi[keep]) * ny_bins + yi[keep]
+    price = price[keep].astype(float)
+    size = num_dates * nx_bins * ny_bins
+
+    count = np.bincount(flat, minlength=size)
+    if aggregator == "count":
+        maps = count.astype(float)
+    elif aggregator == "mean":
+        with np.errstate(invalid="ignore"):
+            maps = np.bincount(flat, weights=price, minlength=size) / count
+    elif aggregator in ["min", "max"]:
+        ufunc = np.minimum if aggregator == "min" else np.maximum
+        order = np.argsort(flat, kind="stable")
+        flat_sorted = flat[order]
+        starts = np.flatnonzero(np.r_[True, flat_sorted[1:] != flat_sorted[:-1]])
+        maps = np.full(size, np.nan)
+        if len(starts):
+            maps[flat_sorted[starts]] = ufunc.reduceat(price[order], starts)
+    else:
+        raise ValueError("Unknown aggregator: {}".format(aggregator))
+    maps[count == 0] = np.nan
+    return maps.reshape(num_dates, nx_bins, ny_bins)
 
-    listings = pd.read_csv(listings_fn)
-    id2long = {id_num: lng for id_num, lng in zip(listings["id"], listings["longitude"])}
-    id2lat = {id_num: lat for id_num, lat in zip(listings["id"], listings["latitude"])}
 
-    fig, ax = plt.subplots()
+def date_price_map(listings_fn, availability_fn):
+    cache = get_cache(listings_fn, availability_fn)
     aggregator = "min"
+    x_grid = np.linspace(*longs)
+    y_grid = np.linspace(*lats)
+    maps = binned_price_maps(cache, aggregator, x_grid, y_grid)
+
+    fig, ax = plt.subplots()
 
-    for date_listings in date_groups:
-        date = date_listings[0]
-        date_listings = pd.DataFrame(date_listings[1])
-        date_listings["longitude"] = date_listings["listing_id"].map(id2long)
-        date_listings["latitude"] = date_listings["listing_id"].map(id2lat)
-        price_map_binned(date_listings, fig=fig, ax=ax, aggregator=aggregator)
-        ax.set_title("{0:s} price, {1:s}".format(aggregator, date))
+    for date, price_map in zip(cache["dates"], maps):
+        ax.pcolormesh(x_grid, y_grid, price_map.T)
+        ax.set_xlim(longs)
+        ax.set_ylim(lats)
+        ax.set_xlabel("longitude")
+        ax.set_ylabel("latitude")
+        ax.set_title("{0:s} price, {1:s}".format(aggregator, str(date)))
         #plt.pcolor()
         plt.draw()
         plt.pause(0.1)
         ax.cla()
 
 
-def price_timeline(availability_fn):
-    aggregator = "mean"
-    df = pd.read_csv(availability_fn, nrows=10000)
-    df = df[df["available"] == "t"]
-    df["price"] = df["price"].map(lambda x: float(x[1:].replace(",", "")))
-    #df.sort_values("date")
-    date_groups = df.groupby("date")
-    #cheapest = date_groups["price"].agg([aggregator])
+def price_timeline(listings_fn, availability_fn):
+    cache = get_cache(listings_fn, availability_fn)
+    price = cache["price"]
+    offsets = cache["offsets"]
+    dates = cache["dates"].astype(str)
     quantiles = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
-    quants = [date_groups["price"].quantile(q) for q in quantiles]
+    quants = np.array([np.quantile(price[i0:i1], quantiles) 
+                       for i0, i1 in zip(offsets, offsets[1:])])
 
-    for quant in quants:
-        plt.step(quant.index.values, quant)
-    plt.xticks(quants[0].index.values[::7], rotation="45")
-    #plt.title("The {} AirBnB price in Berlin over time".format(aggregator))
+    for quant in quants.T:
+        plt.step(dates, quant)
+    plt.xticks(dates[::7], rotation="45")
     plt.title("Quantiles of AirBnB price in Berlin over time")
     plt.legend(quantiles)
     plt.xlabel("date")
@@ -117,7 +233,7 @@ def main():
     availability_fn = os.path.join(data_dir, "calendar_summary.csv")
     #price_map_binned(listings_fn)
     #date_price_map(listings_fn, availability_fn)
-    price_timeline(availability_fn)
+    price_timeline(listings_fn, availability_fn)
 
     '''
     df = pd.read_csv(listings_fn)
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 
 
@@ -319,46 +320,104 @@ country_codes = {
 country_codes = {val: key for key, val in country_codes.items()}
 
 
-def get_psy(df):
-    get_strings = lambda s: [s + str(i) for i in range(1, 11)]
-    metrics = ["EXT", "EST", "AGR", "CSN", "OPN"]
-    #psy = pd.DataFrame({s: df[get_strings(s)].sum(axis=1) for s in metrics})
-    psy = {}
-    for met in metrics:
-        met_cols = get_strings(met)
-        coeff = np.array([questions[col][1] for col in met_cols])
-        df_met = df[met_cols]
-        psy[met] = df_met.dot(coeff)
+metrics = ["EXT", "EST", "AGR", "CSN", "OPN"]
+answer_cols = [met + str(i) for met in metrics for i in range(1, 11)]
+# answers (n x 50) @ score_matrix (50 x 5) gives the trait scores
+score_matrix = np.zeros([len(answer_cols), len(metrics)], dtype=np.int16)
+for i, answer_col in enumerate(answer_cols):
+    score_matrix[i, metrics.index(answer_col[:3])] = questions[answer_col][1]
+score_min, score_max = -50, 50
+num_scores = score_max - score_min + 1
 
-    psy = pd.DataFrame(psy)
-    return psy
+data_fn = "/home/jdw/garageofcode/data/kaggle/big5/big5.csv"
 
 
-def psy_density():
-    df = pd.read_csv("/home/jdw/garageofcode/data/kaggle/big5/big5.csv", delimiter="\t", nrows=1000000)
-    df_se = df[df["country"] == "PE"]
+def get_psy(df):
+    answers = df[answer_cols].to_numpy(dtype=np.int16)
+    return pd.DataFrame(answers @ score_matrix, columns=metrics, index=df.index)
+
+
+def read_chunks(fn=data_fn, chunksize=200000):
+    """
+    Yields (countries, answers) per chunk, answers as an int8 matrix.
+    Missing answers are 0, like unanswered questions in the data
+    """
+    dtypes = {col: "Int8" for col in answer_cols}
+    dtypes["country"] = str
+    for df in pd.read_csv(fn, delimiter="\t", usecols=answer_cols + ["country"],
+                          dtype=dtypes, chunksize=chunksize, keep_default_na=False,
+                          na_values=["", "NULL", "NaN"]):
+        countries = df["country"].fillna("NONE").to_numpy()
+        answers = df[answer_cols].to_numpy(dtype=np.int8, na_value=0)
+        yield countries, answers
+
+
+def aggregate(fn=data_fn, chunksize=200000):
+    """
+    Per country trait sums and score histograms over the whole file,
+    in bounded memory
+    """
+    cc2idx = {}
+    counts = np.zeros(0, dtype=np.int64)
+    sums = np.zeros([0, len(metrics)], dtype=np.int64)
+    hist = np.zeros([0, len(metrics), num_scores], dtype=np.int64)
+    for countries, answers in read_chunks(fn, chunksize):
+        uniq, inverse = np.unique(countries, return_inverse=True)
+        for cc in uniq:
+            cc2idx.setdefault(cc, len(cc2idx))
+        C = len(cc2idx)
+        if C > len(counts):
+            counts = np.concatenate([counts, np.zeros(C - len(counts), dtype=np.int64)])
+            sums = np.concatenate([sums, np.zeros([C - len(sums), len(metrics)], dtype=np.int64)])
+            hist = np.concatenate([hist, np.zeros([C - len(hist), len(metrics), num_scores], dtype=np.int64)])
+        idx = np.array([cc2idx[cc] for cc in uniq])[inverse.ravel()]
+
+        scores = answers.astype(np.int16) @ score_matrix
+        counts += np.bincount(idx, minlength=C)
+        for m in range(len(metrics)):
+            sums[:, m] += np.bincount(idx, weights=scores[:, m], minlength=C).astype(np.int64)
+        flat = (idx[:, None] * len(metrics) + np.arange(len(metrics))) * num_scores + (scores - score_min)
+        hist += np.bincount(flat.ravel(), minlength=hist.size).reshape(hist.shape)
+
+    countries = np.array(sorted(cc2idx, key=cc2idx.get))
+    return {"country": countries, "count": counts, "sum": sums, "hist": hist}
+
+
+def get_aggregate(fn=data_fn, cache_fn=None):
+    """
+    aggregate, cached as an .npz of columns next to the data
+    """
+    if cache_fn is None:
+        cache_fn = fn + ".agg.npz"
+    if os.path.exists(cache_fn) and os.path.getmtime(cache_fn) >= os.path.getmtime(fn):
+        with np.load(cache_fn) as data:
+            return {key: data[key] for key in data.files}
+    agg = aggregate(fn)
+    np.savez_compressed(cache_fn, **agg)
+    return agg
+
+
+def country_means(agg, min_count=100):
+    keep = agg["count"] >= min_count
+    means = pd.DataFrame(agg["sum"][keep] / agg["count"][keep, None], columns=metrics)
+    means["cc"] = agg["country"][keep]
+    means["country"] = [country_codes.get(cc, cc)[:20] for cc in agg["country"][keep]]
+    means["count"] = agg["count"][keep]
+    return means
 
-    '''
-    for i in range(5):
-        qi = columns[i]
-        q_stringi = questions[q]
-        si = df[q]
-        si = si[si > 0]
-        plt.hist(s, bins=[1, 2, 3, 4, 5, 6])
-        plt.title(q_string)
-        plt.show()
-    '''
+
+def psy_density():
+    agg = get_aggregate()
+    hist_all = agg["hist"].sum(axis=0)
+    hist_se = agg["hist"][list(agg["country"]).index("PE")]
 
     #corr = df[["OPN" + str(i) for i in range(1, 11)]].corr().to_numpy()
     
-    metrics = ["EXT", "EST", "AGR", "CSN", "OPN"]   
-    #print(psy.corr())
-
-    psy = get_psy(df)
-    psy_se = get_psy(df_se)
-
-    for met in metrics:
-        plt.hist([psy[met], psy_se[met]], bins=range(-30, 40), density=True)
+    bins = np.arange(score_min, score_max + 2)
+    for m, met in enumerate(metrics):
+        for h in [hist_all[m], hist_se[m]]:
+            plt.hist(bins[:-1], bins=bins, weights=h / h.sum(), alpha=0.5)
+        plt.xlim(-30, 40)
         plt.title(met)
         plt.show()
 
@@ -368,19 +427,7 @@ def psy_density():
 
 
 def top5():
-    df = pd.read_csv("/home/jdw/garageofcode/data/kaggle/big5/big5.csv", delimiter="\t", nrows=100000)
-    cc2psy = []
-    
-    for cc, df_cc in df.groupby("country"):
-        if len(df_cc) < 100:
-            continue
-    
-        psy_cc = get_psy(df_cc).mean()
-        psy_cc["country"] = country_codes.get(cc, cc)[:20]
-
-        cc2psy.append(psy_cc)
-        
-    cc2psy = pd.DataFrame(cc2psy)
+    cc2psy = country_means(get_aggregate(), min_count=100)
     
     '''
     met = "OPN"
@@ -408,20 +455,21 @@ def top5():
     m = Basemap(lon_0=0, projection='robin')
     m.drawmapboundary(color='w')
 
+    cc2feat = dict(zip(cc2psy["cc"], cc2psy[feat]))
     m.readshapefile(shapefile, 'units', color='#444444', linewidth=.2)
     for info, shape in zip(m.units_info, m.units):
         iso2 = info['ADM0_A2']
-        if iso3 not in df["country"]:
+        if iso2 not in cc2feat:
             color = '#dddddd'
         else:
-            color = (float(df[df["country"] == iso2][feat]) + 15) / 60
+            color = (cc2feat[iso2] + 15) / 60
 
         patches = [Polygon(np.array(shape), True)]
         pc = PatchCollection(patches)
         pc.set_facecolor(color)
         ax.add_collection(pc)
 
-    plt.savefig(imgfile, bbox_inches='tight', pad_inches=.2)
+    plt.savefig(fn_img, bbox_inches='tight', pad_inches=.2)
 
 
 
@@ -0,0 +1,250 @@
+import numpy as np
+
+MAX_BINS = 255 # codes fit in uint8, the last code is kept for unseen values
+
+def bin_features(X, max_bins=MAX_BINS):
+    """
+    Maps every column of X to uint8 codes, once.
+    Columns with few distinct values get one code per value,
+    others are cut at quantiles.
+    Returns the codes and, per column, the bin edges, the mean value of each bin
+    and whether the bins are exact values
+    """
+    X = np.asarray(X, dtype=float)
+    n, F = X.shape
+    # column-major, so the codes of one feature are contiguous
+    codes = np.zeros([n, F], dtype=np.uint8, order="F")
+    edges = []
+    values = []
+    exact = []
+    for f in range(F):
+        x = X[:, f]
+        uniq = np.unique(x)
+        if len(uniq) <= max_bins:
+            e = uniq
+            c = np.searchsorted(uniq, x)
+            exact.append(True)
+        else:
+            e = np.unique(np.quantile(x, np.linspace(0, 1, max_bins + 1)[1:-1]))
+            c = np.searchsorted(e, x, side="right")
+            exact.append(False)
+        codes[:, f] = c
+        num = np.bincount(c, minlength=len(e) + 1)
+        tot = np.bincount(c, weights=x, minlength=len(e) + 1)
+        values.append(tot / np.maximum(num, 1))
+        edges.append(e)
+    return codes, edges, values, exact
+
+def apply_bins(X, edges, exact):
+    """
+    Codes for new data with the bins from bin_features.
+    For exact columns, values that were never seen get code MAX_BINS
+    """
+    X = np.asarray(X, dtype=float)
+    codes = np.zeros(X.shape, dtype=np.uint8)
+    for f, e in enumerate(edges):
+        x = X[:, f]
+        if exact[f]:
+            c = np.searchsorted(e, x).clip(0, len(e) - 1)
+            c[e[c] != x] = MAX_BINS
+        else:
+            c = np.searchsorted(e, x, side="right")
+        codes[:, f] = c
+    return codes
+
+def info_gain(p, n, log2base_p, log2comp_p):
+    """
+    Vectorized relative_information_gain from insurance.py.
+    p, n: mean of y and relative frequency per branch, along the last axis
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        H = p * np.log2(p * log2base_p) + (1 - p) * np.log2((1 - p) * log2comp_p)
+    H = np.where((p == 0) | (p == 1) | (n == 0), 0, H)
+    return np.sum(n * H, axis=-1)
+
+class HistTree:
+    """
+    The decision tree of insurance.build_DTC, trained on uint8 feature codes.
+    Split statistics for all features at a node come from one bincount
+    over the node's row indices, and the tree is stored as flat arrays.
+
+    Categorical nodes: one child per category with more than small_cat rows,
+    and one 'other' child for the rest.
+    Numerical nodes: split halfway between the class means.
+    """
+    LEAF = -1
+
+    def __init__(self, max_depth=20, small_cat=5):
+        self.max_depth = max_depth
+        self.small_cat = small_cat
+
+    def fit(self, X, y, categorical, base_p=None):
+        """
+        X: (n, F) array, categorical: boolean mask or indices of categorical columns
+        """
+        y = np.asarray(y, dtype=float)
+        n, F = np.shape(X)
+        cat_mask = np.zeros(F, dtype=bool)
+        cat_mask[categorical] = True
+        self.categorical = cat_mask
+        if base_p is None:
+            base_p = y.mean()
+        self.base_p = base_p
+        log2base_p = -np.log2(base_p)
+        log2comp_p = -np.log2(1 - base_p)
+
+        codes, self.edges, self.values, self.exact = bin_features(X)
+        B = MAX_BINS + 1
+        # bin value per (feature, code), for the numerical split rule
+        V = np.zeros([F, B])
+        for f, v in enumerate(self.values):
+            V[f, :len(v)] = v
+
+        feature = []
+        prob = []
+        split = []
+        sign = []
+        cat_child = []  # one row of B+1 children per node, last is 'other'
+        num_child = []  # (left, right)
+
+        def new_node():
+            feature.append(self.LEAF)
+            prob.append(1.0)
+            split.append(0.0)
+            sign.append(1.0)
+            cat_child.append(None)
+            num_child.append((-1, -1))
+            return len(feature) - 1
+
+        root = new_node()
+        stack = [(root, np.arange(n), self.max_depth)]
+        while stack:
+            node, idx, depth = stack.pop()
+            m = len(idx)
+            if not m:
+                prob[node] = 1 # no examples - guess positive
+                continue
+            y_idx = y[idx]
+            s = y_idx.sum()
+            if depth == 0 or s == 0 or s == m:
+                prob[node] = (s + 1) / (m + 2) # laplace probability of unseen
+                continue
+
+            # counts and positives for every (feature, code),
+            # one feature at a time so no n x F temporaries are made
+            N = np.zeros([F, B])
+            P = np.zeros([F, B])
+            for f in range(F):
+                c = codes[idx, f]
+                N[f] = np.bincount(c, minlength=B)
+                P[f] = np.bincount(c, weights=y_idx, minlength=B)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                p = P / N
+
+            gains = np.zeros(F)
+
+            # categorical: clump small categories into 'other'
+            if cat_mask.any():
+                Nc, Pc, pc = N[cat_mask], P[cat_mask], p[cat_mask]
+                small = (Nc > 0) & (Nc <= self.small_cat)
+                n_other = np.sum(Nc * small, axis=1)
+                p_other = np.sum(Pc * small, axis=1) / np.maximum(n_other, 1)
+                pa = np.concatenate([np.where(small, 0, pc), p_other[:, None]], axis=1)
+                na = np.concatenate([np.where(small, 0, Nc), n_other[:, None]], axis=1) / m
+                gains[cat_mask] = info_gain(pa, na, log2base_p, log2comp_p)
+
+            # numerical: split halfway between the class means
+            num_mask = ~cat_mask
+            if num_mask.any():
+                Nn, Pn, Vn = N[num_mask], P[num_mask], V[num_mask]
+                pos_mean = np.sum(Pn * Vn, axis=1) / s
+                neg_mean = np.sum((Nn - Pn) * Vn, axis=1) / (m - s)
+                sp = (neg_mean + pos_mean) / 2
+                sg = np.where(pos_mean >= neg_mean, 1.0, -1.0)
+                right = Vn * sg[:, None] >= (sp * sg)[:, None]
+                n_r = np.sum(Nn * right, axis=1)
+                p_r = np.sum(Pn * right, axis=1)
+                n_l = m - n_r
+                p_l = s - p_r
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    pa = np.stack([p_l / n_l, p_r / n_r], axis=1)
+                na = np.stack([n_l, n_r], axis=1) / m
+                gains[num_mask] = info_gain(pa, na, log2base_p, log2comp_p)
+                num_split = dict(zip(np.flatnonzero(num_mask), zip(sp, sg)))
+
+            f = int(np.argmax(gains))
+            feature[node] = f
+            c = codes[idx, f]
+            if cat_mask[f]:
+                nonsmall = np.flatnonzero(N[f] > self.small_cat)
+                children = np.full(B + 1, -1, dtype=np.int64)
+                other = new_node()
+                children[:] = other
+                order = np.argsort(c, kind="stable")
+                bounds = np.searchsorted(c[order], np.arange(B + 1))
+                in_other = np.ones(m, dtype=bool)
+                for a in nonsmall:
+                    child = new_node()
+                    children[a] = child
+                    sel = order[bounds[a]:bounds[a+1]]
+                    in_other[sel] = False
+                    stack.append((child, idx[sel], depth - 1))
+                stack.append((other, idx[in_other], depth - 1))
+                cat_child[node] = children
+            else:
+                sp_f, sg_f = num_split[f]
+                split[node] = sp_f
+                sign[node] = sg_f
+                go_right = V[f, c] * sg_f >= sp_f * sg_f
+                left_child = new_node()
+                right_child = new_node()
+                num_child[node] = (left_child, right_child)
+                stack.append((right_child, idx[go_right], depth - 1))
+                stack.append((left_child, idx[~go_right], depth - 1))
+
+        self.feature = np.array(feature, dtype=np.int64)
+        self.prob = np.array(prob)
+        self.split = np.array(split)
+        self.sign = np.array(sign)
+        self.left, self.right = [np.array(a, dtype=np.int64) for a in zip(*num_child)]
+        cat_nodes = [i for i, row in enumerate(cat_child) if row is not None]
+        self.cat_row = -np.ones(len(feature), dtype=np.int64)
+        self.cat_row[cat_nodes] = np.arange(len(cat_nodes))
+        self.cat_children = np.array([cat_child[i] for i in cat_nodes], dtype=np.int64).reshape(-1, B + 1)
+        return self
+
+    def predict_proba(self, X):
+        """
+        All rows move down the tree together, one level per iteration
+        """
+        X = np.asarray(X, dtype=float)
+        codes = apply_bins(X, self.edges, self.exact)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int64)
+        active = rows[self.feature[node] != self.LEAF]
+        while len(active):
+            nd = node[active]
+            f = self.feature[nd]
+            is_cat = self.categorical[f]
+
+            a = active[is_cat]
+            if len(a):
+                nd_a = nd[is_cat]
+                node[a] = self.cat_children[self.cat_row[nd_a], codes[a, f[is_cat]]]
+
+            b = active[~is_cat]
+            if len(b):
+                nd_b = nd[~is_cat]
+                x = X[b, f[~is_cat]]
+                sg = self.sign[nd_b]
+                go_right = x * sg >= self.split[nd_b] * sg
+                node[b] = np.where(go_right, self.right[nd_b], self.left[nd_b])
+
+            active = active[self.feature[node[active]] != self.LEAF]
+        return self.prob[node]
+
+    def predict(self, X):
+        return (self.predict_proba(X) > self.base_p) * 1
+
+    def num_nodes(self):
+        return len(self.feature)
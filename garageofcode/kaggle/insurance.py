@@ -3,11 +3,12 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 import pandas as pd
-import networkx as nx
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import train_test_split
 
+from garageofcode.kaggle.hist_tree import HistTree
+
 categorical = {
                "MOSTYPE",  
                #"MGEMLEEF",  # let this be numerical instead
@@ -233,27 +234,42 @@ def train_test_decision_tree(df):
 
 
 def get_confusion_matrix(model, X, y, base_p=0.5):
-    log2base_p = -np.log2(base_p)
-    log2comp_p = -np.log2(1 - base_p)
+    yh = model.predict(X)
 
+    prior_h, posterior_h = get_information(y, yh, base_p)
+    print("Prior:     {0:.3f}\nPosterior: {1:.3f}".format(prior_h, posterior_h))
+
+    tp, fp, fn, tn = get_confusion_counts(y, yh)
+    print("{0} {1}\n{2} {3}".format(tp, fp, fn, tn))
 
-    yh = model.predict(X)
 
+def get_information(y, yh, base_p):
+    """
+    Prior and posterior relative information of the predictions yh
+    (labels or probabilities) about y
+    """
+    log2base_p = -np.log2(base_p)
+    log2comp_p = -np.log2(1 - base_p)
+
+    y = np.asarray(y)
+    yh = np.asarray(yh)
     prior_h = -relative_information_gain({0: y.mean()}, {0: 1}, log2base_p, log2comp_p)
-    y_neg = [yhi for yhi, yi in zip(yh, y) if not yi]
-    y_pos = [yhi for yhi, yi in zip(yh, y) if yi]
+    y_neg = yh[y == 0]
+    y_pos = yh[y == 1]
     posterior_h = -relative_information_gain({0: np.mean(y_neg), 1: np.mean(y_pos)},
-                                             {0: len(y_neg) / len(X_test), 1: len(y_pos) / len(X_test)},
+                                             {0: len(y_neg) / len(y), 1: len(y_pos) / len(y)},
                                              log2base_p, log2comp_p)
-    print("Prior:     {0:.3f}\nPosterior: {1:.3f}".format(prior_h, posterior_h))
+    return prior_h, posterior_h
 
 
+def get_confusion_counts(y, yh):
+    y = np.asarray(y)
+    yh = np.asarray(yh)
     tp = np.dot(  y,   yh)
     fp = np.dot(1-y,   yh)
     fn = np.dot(  y, 1-yh)
     tn = np.dot(1-y, 1-yh)
-
-    print("{0} {1}\n{2} {3}".format(tp, fp, fn, tn))
+    return tp, fp, fn, tn
 
 
 def relative_information_gain(a2p, a2n, log2base_p, log2comp_p):
@@ -440,41 +456,25 @@ def train_dtc(df):
     N_train = 4000
     X_train = df.loc[:N_train]
 
-    root = "root"
-    T = nx.DiGraph()
-    T.add_node(root)
     y_key = "CARAVAN"
     base_p = X_train[y_key].mean() # balanced
     #base_p = 1 # unbalanced
-    build_DTC(T, root, X_train, y_key, base_p, max_depth)
-
-    log2base_p = -np.log2(base_p)
-    log2comp_p = -np.log2(1 - base_p)
+    features = list(L)
+    cat_idx = [i for i, key in enumerate(features) if key in categorical]
+    model = HistTree(max_depth=max_depth)
+    model.fit(X_train[features].to_numpy(), X_train[y_key].to_numpy(), cat_idx, base_p)
 
     #X_test = X_train 
     X_test = df.loc[N_train:]
 
-    #print(T.nodes())
-    for _, x in X_test.iterrows():
-        yh = classify(T, root, x)
-
-    yh = np.array([classify(T, root, x) for _, x in X_test.iterrows()])
-    y = X_test[y_key]
-    prior_h = -relative_information_gain({0: y.mean()}, {0: 1}, log2base_p, log2comp_p)
-    y_neg = [yhi for yhi, yi in zip(yh, y) if not yi]
-    y_pos = [yhi for yhi, yi in zip(yh, y) if yi]
-    posterior_h = -relative_information_gain({0: np.mean(y_neg), 1: np.mean(y_pos)},
-                                             {0: len(y_neg) / len(X_test), 1: len(y_pos) / len(X_test)},
-                                             log2base_p, log2comp_p)
+    yh = model.predict_proba(X_test[features].to_numpy())
+    y = X_test[y_key].to_numpy()
+    prior_h, posterior_h = get_information(y, yh, base_p)
     print("Prior:     {0:.3f}\nPosterior: {1:.3f}".format(prior_h, posterior_h))
+    y_neg = yh[y == 0]
+    y_pos = yh[y == 1]
 
-    yh = np.array([yhi > base_p for yhi in yh])
-
-    tp = np.dot(  y,   yh)
-    fp = np.dot(1-y,   yh)
-    fn = np.dot(  y, 1-yh)
-    tn = np.dot(1-y, 1-yh)
-
+    tp, fp, fn, tn = get_confusion_counts(y, (yh > base_p) * 1)
     print("{0} {1}\n{2} {3}".format(tp, fp, fn, tn))
 
 
@@ -0,0 +1,167 @@
+"""
+Cross validated comparison of the insurance models.
+The data is put in shared memory once, every worker process
+maps it read-only instead of getting its own pickled copy.
+"""
+import time
+from itertools import product
+from collections import defaultdict
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from garageofcode.kaggle.hist_tree import HistTree
+from garageofcode.kaggle.insurance import L, categorical, get_information, get_confusion_counts
+
+_shared = {}
+
+def _init_worker(X_name, X_shape, X_dtype, y_name, y_shape, y_dtype):
+    for key, name, shape, dtype in [("X", X_name, X_shape, X_dtype),
+                                    ("y", y_name, y_shape, y_dtype)]:
+        shm = shared_memory.SharedMemory(name=name)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        _shared[key] = arr
+        _shared[key + "_shm"] = shm # keep the mapping alive
+
+def _to_shared(arr):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm
+
+def make_model(name, params, y_train):
+    if name == "dtc":
+        return HistTree(**params)
+    if name == "svc":
+        # probability: Platt scaling on the true labels, despite the class weights
+        return SVC(class_weight="balanced", probability=True, **params)
+    if name == "tree":
+        return DecisionTreeClassifier(class_weight={0: 1, 1: 1 / np.mean(y_train)}, **params)
+    raise ValueError("Unknown model: {}".format(name))
+
+def predict_proba(name, model, X):
+    """
+    Probability of 1 for every row, calibrated to the actual class frequencies,
+    so that the information is comparable between the models
+    """
+    if name == "dtc":
+        return model.predict_proba(X)
+    p = model.predict_proba(X)[:, list(model.classes_).index(1)]
+    if name == "tree":
+        # undo the class weight w of the leaf frequencies: p = w k / (w k + m)
+        w = model.class_weight[1] / model.class_weight[0]
+        p = p / w / (p / w + 1 - p)
+    return p
+
+def _run_task(task):
+    name, params, fold, train_idx, test_idx, cat_idx = task
+    X, y = _shared["X"], _shared["y"]
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+    base_p = y_train.mean()
+
+    model = make_model(name, params, y_train)
+    t0 = time.time()
+    if name == "dtc":
+        model.fit(X_train, y_train, cat_idx, base_p)
+    else:
+        model.fit(X_train, y_train)
+    t1 = time.time()
+    yh = predict_proba(name, model, X_test)
+    if name == "dtc":
+        labels = (yh > base_p) * 1
+    else:
+        labels = model.predict(X_test)
+    t2 = time.time()
+
+    prior_h, posterior_h = get_information(y_test, yh, base_p)
+    tp, fp, fn, tn = get_confusion_counts(y_test, labels)
+    return {"model": name,
+            "params": tuple(sorted(params.items())),
+            "fold": fold,
+            "fit_time": t1 - t0,
+            "predict_time": t2 - t1,
+            "prior_h": prior_h,
+            "posterior_h": posterior_h,
+            "tp": tp, "fp": fp, "fn": fn, "tn": tn}
+
+def expand_grid(grid):
+    """
+    {"max_depth": [3, 5], "small_cat": [5]} -> list of param dicts
+    """
+    keys = list(sorted(grid))
+    return [dict(zip(keys, vals)) for vals in product(*[grid[key] for key in keys])]
+
+def run_experiments(X, y, model2grid, cat_idx=(), k=5, processes=None, seed=0):
+    """
+    Evaluates every model and parameter combination on k stratified folds,
+    one (model, params, fold) per task, spread over a process pool.
+    model2grid: {"dtc": {"max_depth": [5, 10, 20]}, "svc": {"C": [0.1, 1]}, ...}
+    Returns one result dict per task
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    y = np.ascontiguousarray(y, dtype=np.int64)
+    folds = list(StratifiedKFold(n_splits=k, shuffle=True, random_state=seed).split(X, y))
+
+    tasks = [(name, params, fold, train_idx, test_idx, list(cat_idx))
+             for name, grid in model2grid.items()
+             for params in expand_grid(grid)
+             for fold, (train_idx, test_idx) in enumerate(folds)]
+
+    X_shm = _to_shared(X)
+    y_shm = _to_shared(y)
+    initargs = (X_shm.name, X.shape, X.dtype, y_shm.name, y.shape, y.dtype)
+    try:
+        with Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+            results = pool.map(_run_task, tasks, chunksize=1)
+    finally:
+        for shm in [X_shm, y_shm]:
+            shm.close()
+            shm.unlink()
+    return results
+
+def summarize(results):
+    """
+    Mean and standard deviation over folds, per model and params
+    """
+    key2rows = defaultdict(list)
+    for res in results:
+        key2rows[(res["model"], res["params"])].append(res)
+
+    rows = []
+    for (name, params), res in key2rows.items():
+        info_gain = [r["prior_h"] - r["posterior_h"] for r in res]
+        recall = [r["tp"] / max(r["tp"] + r["fn"], 1) for r in res]
+        rows.append({"model": name,
+                     "params": ", ".join("{}={}".format(key, val) for key, val in params),
+                     "info_gain": np.mean(info_gain),
+                     "info_gain_std": np.std(info_gain),
+                     "recall": np.mean(recall),
+                     "fit_time": np.mean([r["fit_time"] for r in res]),
+                     "predict_time": np.mean([r["predict_time"] for r in res])})
+    return pd.DataFrame(rows).sort_values("info_gain", ascending=False)
+
+def main():
+    df = pd.read_csv("/home/jdw/garageofcode/data/kaggle/insurance/tic_2000_train_data.csv", delimiter=",")
+    features = list(L)
+    cat_idx = [i for i, key in enumerate(features) if key in categorical]
+    X = df[features].to_numpy()
+    y = df["CARAVAN"].to_numpy()
+
+    model2grid = {"dtc": {"max_depth": [3, 5, 10, 20]},
+                  "tree": {"max_depth": [3, 5, 10]},
+                  "svc": {"C": [0.1, 1, 10]}}
+
+    t0 = time.time()
+    results = run_experiments(X, y, model2grid, cat_idx, k=5)
+    t1 = time.time()
+    print(summarize(results).to_string(index=False))
+    print("Total time: {0:.2f}".format(t1 - t0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import numpy as np
+
+BLOCK = 2**16 # rows of the embedding matrix scored at a time
+
+def top_k(scores, k=None):
+    """
+    Indices of the k largest scores, in descending order.
+    k=None gives the full ranking
+    """
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, k-1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def top_k_batch(Q, X, k, block=BLOCK):
+    """
+    Exact top k of X @ q for every row q of Q,
+    scoring X in blocks of rows so that the full
+    len(Q) x len(X) score matrix is never held in memory.
+    Returns ids and scores, both of shape (len(Q), k)
+    """
+    Q = np.atleast_2d(np.asarray(Q, dtype=X.dtype))
+    k = min(k, len(X))
+    best_ids = np.zeros([len(Q), 0], dtype=np.int64)
+    best_scores = np.zeros([len(Q), 0], dtype=X.dtype)
+    for i0 in range(0, len(X), block):
+        S = Q @ X[i0:i0+block].T
+        kb = min(k, S.shape[1])
+        idx = np.argpartition(-S, kb-1, axis=1)[:, :kb]
+        cand_scores = np.concatenate([best_scores, np.take_along_axis(S, idx, axis=1)], axis=1)
+        cand_ids = np.concatenate([best_ids, idx + i0], axis=1)
+        if cand_scores.shape[1] > k:
+            keep = np.argpartition(-cand_scores, k-1, axis=1)[:, :k]
+            cand_scores = np.take_along_axis(cand_scores, keep, axis=1)
+            cand_ids = np.take_along_axis(cand_ids, keep, axis=1)
+        best_scores, best_ids = cand_scores, cand_ids
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+class IVFIndex:
+    """
+    Inverted file index for maximum inner product search
+    over unit vectors.
+    The vectors are clustered with spherical k-means, and a query
+    is only scored against the clusters whose centroids are nearest.
+    Scoring itself is exact, so nprobe = nlist gives exact results.
+    """
+    def __init__(self, centroids, order, offsets, nprobe=8):
+        self.centroids = centroids
+        self.order = order      # vector ids sorted by cluster
+        self.offsets = offsets  # cluster c owns order[offsets[c]:offsets[c+1]]
+        self.nprobe = nprobe
+
+    @staticmethod
+    def build(X, nlist=None, num_iter=10, sample_size=None, nprobe=8, seed=0):
+        """
+        X should be row normalized.
+        nlist defaults to sqrt(len(X))
+        """
+        N = len(X)
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(N)))
+        if sample_size is None:
+            sample_size = min(N, 64 * nlist)
+        rng = np.random.RandomState(seed)
+        sample = np.asarray(X[np.sort(rng.choice(N, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)]
+        for _ in range(num_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            # empty clusters keep their old centroid
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        labels = np.concatenate([np.argmax(np.asarray(X[i0:i0+BLOCK], dtype=np.float32) @ centroids.T, axis=1)
+                                 for i0 in range(0, N, BLOCK)])
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(nlist + 1))
+        return IVFIndex(centroids, order, offsets, nprobe)
+
+    def save(self, fn):
+        np.savez(fn, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @staticmethod
+    def load(fn, nprobe=8):
+        data = np.load(fn)
+        return IVFIndex(data["centroids"], data["order"], data["offsets"], nprobe)
+
+    def probe(self, Q, nprobe=None):
+        """
+        The nprobe nearest clusters for every row of Q
+        """
+        if nprobe is None:
+            nprobe = self.nprobe
+        nprobe = min(nprobe, len(self.centroids))
+        C = np.atleast_2d(Q) @ self.centroids.T
+        return np.argpartition(-C, nprobe-1, axis=1)[:, :nprobe]
+
+    def _search_clusters(self, X, q, clusters, k):
+        ids = np.concatenate([self.order[self.offsets[c]:self.offsets[c+1]] for c in clusters])
+        ids.sort() # sequential access into X
+        scores = X[ids] @ q
+        best = top_k(scores, k)
+        return ids[best], scores[best]
+
+    def search(self, X, q, k=10, nprobe=None):
+        """
+        Approximate top k of X @ q.
+        Returns ids and scores
+        """
+        return self._search_clusters(X, q, self.probe(q, nprobe)[0], k)
+
+    def search_batch(self, X, Q, k=10, nprobe=None):
+        """
+        Same as search for every row of Q,
+        with the centroids scored in one go
+        """
+        return [self._search_clusters(X, q, clusters, k) 
+                for q, clusters in zip(Q, self.probe(Q, nprobe))]
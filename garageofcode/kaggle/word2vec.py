@@ -1,9 +1,11 @@
 import os
+import json
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
 from garageofcode.tda.main import get_mds
+from garageofcode.kaggle.ivf import IVFIndex, top_k, top_k_batch
 
 def get_words():
         data_dir = "/home/jdw/garageofcode/data/kaggle/word2vec_sample"
@@ -16,16 +18,127 @@ def get_words():
 
         return words.drop_duplicates()
 
+def convert_to_store(fn, d, chunksize=100000):
+    """
+    One-time conversion of a word2vec csv into a directory with
+    unit.f32: row normalized float32 vectors, memory mappable
+    norms.f32: the original row norms
+    vocab.txt: one lowercased word per line, first occurrence kept
+    meta.json: shape
+    """
+    if not os.path.exists(d):
+        os.makedirs(d)
+    header = pd.read_csv(fn, delimiter=",", nrows=0).columns
+    dtypes = {col: np.float32 for col in header[1:]}
+    dtypes[header[0]] = str
+
+    seen = set()
+    num = 0
+    with open(os.path.join(d, "unit.f32"), "wb") as f_unit, \
+         open(os.path.join(d, "norms.f32"), "wb") as f_norms, \
+         open(os.path.join(d, "vocab.txt"), "w") as f_vocab:
+        for df in pd.read_csv(fn, delimiter=",", dtype=dtypes, chunksize=chunksize, 
+                              keep_default_na=False):
+            words = df.iloc[:, 0].str.lower()
+            keep = ~words.duplicated().values
+            keep &= np.array([word not in seen for word in words])
+            words = words[keep]
+            seen.update(words)
+
+            vecs = df.iloc[:, 1:].values[keep].astype(np.float32)
+            norms = np.linalg.norm(vecs, axis=1)
+            vecs /= np.where(norms > 0, norms, 1)[:, None]
+            vecs.tofile(f_unit)
+            norms.astype(np.float32).tofile(f_norms)
+            f_vocab.write("".join(word + "\n" for word in words))
+            num += len(words)
+
+    with open(os.path.join(d, "meta.json"), "w") as f:
+        json.dump({"num": num, "dim": len(header) - 1}, f)
+
+class ScaledRows:
+    """
+    Rows of unit * norms, computed on access,
+    so that the raw vectors never have to be materialized
+    """
+    def __init__(self, unit, norms):
+        self.unit = unit
+        self.norms = norms
+        self.shape = unit.shape
+
+    def __len__(self):
+        return len(self.unit)
+
+    def __getitem__(self, idx):
+        return np.asarray(self.unit[idx]) * self.norms[idx][..., None]
+
 class Word2Vec:
     def __init__(self, fn):
+        """
+        fn is either a word2vec csv, 
+        or a directory made by convert_to_store, which opens almost instantly
+        """
+        if os.path.isdir(fn):
+            self._open_store(fn)
+            return
+
         df = pd.read_csv(fn, delimiter=",", nrows=None)
 
         df.iloc[:, 0] = df.iloc[:, 0].map(lambda x: x.lower())
         df = df.drop_duplicates(subset="word")
 
-        self.word2id = {word.lower(): i for i, word in enumerate(df.iloc[:, 0])}
+        self._word2id = {word.lower(): i for i, word in enumerate(df.iloc[:, 0])}
         self.id2word = {i: word.lower() for i, word in enumerate(df.iloc[:, 0])}
-        self.id2vec = np.array(df.iloc[:, 1:].applymap(float))
+        self.id2vec = np.array(df.iloc[:, 1:].astype(float))
+        self._init_unit()
+
+    def _open_store(self, d):
+        """
+        Memory maps the vectors, pages are read in as rows are used
+        and shared between processes through the page cache
+        """
+        with open(os.path.join(d, "meta.json"), "r") as f:
+            meta = json.load(f)
+        shape = (meta["num"], meta["dim"])
+        with open(os.path.join(d, "vocab.txt"), "r") as f:
+            self.id2word = f.read().split("\n")[:meta["num"]]
+        self._word2id = None
+        self.unit = np.memmap(os.path.join(d, "unit.f32"), dtype=np.float32, mode="r", shape=shape)
+        norms = np.fromfile(os.path.join(d, "norms.f32"), dtype=np.float32)
+        self.id2vec = ScaledRows(self.unit, norms)
+        self.index = None
+        self.k = 100
+
+    @property
+    def word2id(self):
+        if self._word2id is None:
+            self._word2id = {word: i for i, word in enumerate(self.id2word)}
+        return self._word2id
+
+    def _init_unit(self):
+        """
+        Row normalized float32 copy of the embeddings, used for all nearest queries
+        """
+        unit = self.id2vec.astype(np.float32)
+        norms = np.linalg.norm(unit, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.unit = unit / norms
+        self.index = None
+        self.k = 100 # default length of nearest lists
+
+    def build_index(self, fn=None, nlist=None, nprobe=8):
+        """
+        Approximate nearest neighbour index over self.unit,
+        saved to fn if given
+        """
+        self.index = IVFIndex.build(self.unit, nlist=nlist, nprobe=nprobe)
+        if fn is not None:
+            self.index.save(fn)
+        return self.index
+
+    def load_index(self, fn, nprobe=8):
+        self.index = IVFIndex.load(fn, nprobe=nprobe)
+        return self.index
 
     def direct_output(func):
         def wrapper_output(self, *args, **kwargs):
@@ -62,17 +175,41 @@ class Word2Vec:
                 do_pipe = kwargs.get("pipe_nearest", pipe)
                 res = func(self, *args, **kwargs)
                 if do_pipe:
-                    return self.get_nearest(res)
+                    # the hypothesis may be ranked anywhere
+                    k = None if kwargs.get("hypothesis") else kwargs.get("k", self.k)
+                    return self.get_nearest(res, k=k)
                 else:
                     return res
             return wrapper_pipe
         return meta
 
-    def get_nearest(self, vec):
-        alignment = np.dot(self.id2vec, vec)
-        alignment = [(a, i) for i, a in enumerate(alignment)]
-        nearest = list(sorted(alignment, reverse=True))
-        return nearest
+    def get_nearest(self, vec, k=None, exact=False):
+        """
+        The k words with highest cosine similarity to vec, as (a, i) pairs.
+        Uses the approximate index if there is one, unless exact.
+        k=None ranks the whole vocabulary
+        """
+        vec = np.asarray(vec, dtype=np.float32)
+        vec = vec / np.linalg.norm(vec)
+        if self.index is not None and k is not None and not exact:
+            ids, alignment = self.index.search(self.unit, vec, k)
+        else:
+            scores = self.unit @ vec
+            ids = top_k(scores, k)
+            alignment = scores[ids]
+        return list(zip(alignment.tolist(), ids.tolist()))
+
+    def get_nearest_batch(self, vecs, k=10, exact=False):
+        """
+        get_nearest for many vectors at once
+        """
+        Q = np.asarray(vecs, dtype=np.float32)
+        Q = Q / np.linalg.norm(Q, axis=1, keepdims=True)
+        if self.index is not None and not exact:
+            results = self.index.search_batch(self.unit, Q, k)
+        else:
+            results = zip(*top_k_batch(Q, self.unit, k))
+        return [list(zip(alignment.tolist(), ids.tolist())) for ids, alignment in results]
 
     def __call__(self, word):
         return self.word2vec(word)
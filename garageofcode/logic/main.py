@@ -5,52 +5,194 @@ import numpy as np
 import networkx as nx
 import pydot
 
-from garageofcode.common.utils import Heap, get_fn
+from functools import lru_cache
+from multiprocessing import Pool
+
+from garageofcode.common.utils import get_fn
 
 MAX_CREDIBLE_INTERMEDIATE = 1e3
 main_dir = get_fn("logic", "")
 
-def search(tokens, target, unary_ops, merge_ops):
-    """Searching to merge tokens to target with bfs
+def search(tokens, target, unary_ops, merge_ops, max_depth=None):
+    """Searching to merge tokens to target with bfs.
+    States are tuples of canonical tokens, each visited once,
+    with the parent and operation that first reached it.
+    The search stops after the first depth where target is reached,
+    and returns one shortest path for every state that reaches it,
+    the operations between states, and the number of states visited
     """
+    unary_ops, merge_ops = tuple(unary_ops), tuple(merge_ops)
+    root = canonical(tokens)
+    g_target = (canonical_(target),)
+    state2parent = {root: None}
+    ops = {}
+    parents = []
+    layer = [root]
+    depth = 0
+    while layer and not parents:
+        if max_depth is not None and depth >= max_depth:
+            break
+        next_layer = []
+        for state in layer:
+            for child, op in get_children(state, unary_ops, merge_ops):
+                if test_target(child, target):
+                    parents.append(state)
+                    ops[(state, g_target)] = op
+                    continue
+                if child in state2parent:
+                    continue
+                state2parent[child] = state
+                ops[(state, child)] = op
+                next_layer.append(child)
+        layer = next_layer
+        depth += 1
 
-    G = nx.DiGraph()
-    heap = Heap()
-    G.add_node(tuple(tokensf), visited=False)
-    heap.push((0, tokens))
-    root = tokens
-    g_root = tuple(root)
-    g_target = (target,)
-    
-    while heap:
-        depth, tokens = heap.pop()
-        g_tokens = tuple(tokens)
-        if G.nodes[g_tokens]["visited"]:
-            continue
-        G.nodes[g_tokens]["visited"] = True
-        for child, op in generate_children(tokens, unary_ops, merge_ops):
-            g_child = tuple(child)
-            if g_child not in G:
-                G.add_node(g_child, visited=False)
-            G.add_edge(g_tokens, g_child, operation=op)
-            if test_target(child, target):
+    paths = [get_path(state2parent, parent) + [g_target] for parent in dict.fromkeys(parents)]
+    return paths, ops, len(state2parent)
+
+def get_path(state2parent, state):
+    path = [state]
+    while state2parent[path[-1]] is not None:
+        path.append(state2parent[path[-1]])
+    return path[::-1]
+
+def canonical_(a):
+    """Rounds away float error, so 2.0000000001 and 2 are the same token
+    """
+    r = round(a)
+    if abs(a - r) < 1e-6:
+        return int(r)
+    return round(a, 6)
+
+def canonical(tokens):
+    return tuple(canonical_(a) for a in tokens)
+
+@lru_cache(maxsize=None)
+def get_children(tokens, unary_ops, merge_ops):
+    return tuple((canonical(child), op) for child, op in generate_children(tokens, unary_ops, merge_ops))
+
+"""
+Meet in the middle: the values a token sequence can be reduced to,
+computed for every split into a left and a right part,
+and the final merge looked up by inverting it
+"""
+
+def _inv_add(a, c):
+    return c - a
+
+def _inv_sub(a, c):
+    return a - c
+
+def _inv_mul(a, c):
+    return None if a == 0 else c / a
+
+def _inv_div(a, c):
+    return None if c == 0 else a / c
+
+def _pre_sqrt(c):
+    return [c * c] if c >= 0 else []
+
+def _pre_factorial(c):
+    return [n for n in range(8) if factorial(n) == c]
+
+@lru_cache(maxsize=None)
+def get_values(tokens, unary_ops, merge_ops):
+    """All values tokens can be reduced to, with an expression for each
+    """
+    if len(tokens) == 1:
+        value2expr = {tokens[0]: str(tokens[0])}
+    else:
+        value2expr = {}
+        for k in range(1, len(tokens)):
+            left = get_values(tokens[:k], unary_ops, merge_ops)
+            right = get_values(tokens[k:], unary_ops, merge_ops)
+            for op in merge_ops:
+                for a, a_expr in left.items():
+                    for b, b_expr in right.items():
+                        c = op(a, b)
+                        if not eligible_(c):
+                            continue
+                        c = canonical_(c)
+                        if c not in value2expr:
+                            value2expr[c] = "{}({}, {})".format(op.__name__, a_expr, b_expr)
+    return _unary_closure(value2expr, unary_ops)
+
+def _unary_closure(value2expr, unary_ops):
+    stack = list(value2expr)
+    while stack:
+        a = stack.pop()
+        for op in unary_ops:
+            b = op(a)
+            if not eligible_(b):
                 continue
-            if not G.nodes[g_child]["visited"]:
-                heap.push((depth+1, child))
+            b = canonical_(b)
+            if b not in value2expr:
+                value2expr[b] = "{}({})".format(op.__name__, value2expr[a])
+                stack.append(b)
+    return value2expr
 
-    if g_target not in G:
-        return [], G
-    return [nx.shortest_path(G, g_root, parent) + [g_target]
-                for parent in set(G.pred[g_target])], G
+def find(tokens, target, unary_ops, merge_ops):
+    """An expression for target from tokens, or None.
+    For every split, the left values are enumerated and the right value
+    needed for each merge is looked up, instead of trying all pairs.
+    Merges without an inverse in merge_inverses fall back to all pairs.
+    A unary operation on top is undone with unary_preimages
+    """
+    tokens = canonical(tokens)
+    unary_ops, merge_ops = tuple(unary_ops), tuple(merge_ops)
+    if len(tokens) == 1:
+        return get_values(tokens, unary_ops, merge_ops).get(canonical_(target))
 
+    # the last operation may be unary: find what it was applied to
+    targets = {canonical_(target): "{}"}
+    stack = [canonical_(target)]
+    while stack:
+        c = stack.pop()
+        for op in unary_ops:
+            for pre in unary_preimages.get(op, lambda c: [])(c):
+                if not eligible_(pre) or op(pre) != c:
+                    continue
+                pre = canonical_(pre)
+                if pre not in targets:
+                    targets[pre] = targets[c].format(op.__name__ + "({})")
+                    stack.append(pre)
 
-    '''
-    # return all paths to target
-    try:
-        return nx.all_simple_paths(G, tuple(root), (target,)), G
-    except nx.exception.NodeNotFound:
-        return [], G
-    '''
+    for k in range(1, len(tokens)):
+        left = get_values(tokens[:k], unary_ops, merge_ops)
+        right = get_values(tokens[k:], unary_ops, merge_ops)
+        for c, wrap in targets.items():
+            for op in merge_ops:
+                inverse = merge_inverses.get(op)
+                for a, a_expr in left.items():
+                    if inverse is None:
+                        candidates = right
+                    else:
+                        b = inverse(a, c)
+                        candidates = [] if b is None or not eligible_(b) else [canonical_(b)]
+                    for b in candidates:
+                        if b not in right:
+                            continue
+                        d = op(a, b)
+                        if d is not None and abs(d - c) < 1e-6:
+                            return wrap.format("{}({}, {})".format(op.__name__, a_expr, right[b]))
+    return None
+
+def _sweep_tokens(job):
+    tokens, targets, unary_ops, merge_ops = job
+    value2expr = get_values(canonical(tokens), tuple(unary_ops), tuple(merge_ops))
+    return {target: value2expr.get(canonical_(target)) for target in targets}
+
+def sweep(token_sets, targets, unary_ops, merge_ops, processes=None):
+    """Expressions for every target from every token set, in parallel
+    over the token sets. Returns {tuple(tokens): {target: expression or None}}.
+    All reachable values of a token set come out of one computation,
+    so the number of targets hardly matters
+    """
+    jobs = [(tuple(tokens), list(targets), tuple(unary_ops), tuple(merge_ops))
+            for tokens in token_sets]
+    with Pool(processes) as pool:
+        results = pool.map(_sweep_tokens, jobs)
+    return {tokens: result for (tokens, _, _, _), result in zip(jobs, results)}
 
 def test_target(tokens, target):
     if len(tokens) > 1:
@@ -124,6 +266,9 @@ def factorial(a):
             return None
     return f
 
+merge_inverses = {add: _inv_add, sub: _inv_sub, mul: _inv_mul, div: _inv_div}
+unary_preimages = {sqrt: _pre_sqrt, factorial: _pre_factorial}
+
 def eligible(tokens):
     return all([eligible_(a) for a in tokens])
 
@@ -143,11 +288,11 @@ def is_integer(a):
         print(a)
         raise e
 
-def print_expression(path, G):
+def print_expression(path, ops):
     s = ""
     tokens = [str(a) for a in path[0]]
     for n0, n1 in zip(path[:-1], path[1:]):
-        op_str = G[n0][n1]["operation"]
+        op_str = ops[(n0, n1)]
         op, idx, arity = op_str.split("_")
         idx = int(idx)
         if arity == "unary":
@@ -157,7 +302,7 @@ def print_expression(path, G):
 
     print(tokens[0])
 
-def path_to_expression_graph(path, G):
+def path_to_expression_graph(path, ops):
     C = nx.DiGraph() # computation graph
     tokens = path[0]
     g_tokens = []
@@ -166,7 +311,7 @@ def path_to_expression_graph(path, G):
         g_tokens.append(str(token) + "_%d" % i)
     
     for n0, n1 in zip(path[:-1], path[1:]):
-        op_str = G[n0][n1]["operation"]
+        op_str = ops[(n0, n1)]
         op, idx, arity = op_str.split("_")
         idx = int(idx)
         if arity == "unary":
@@ -186,8 +331,8 @@ def path_to_expression_graph(path, G):
 
     return C
 
-def to_png(filename, path, G):
-    C = path_to_expression_graph(path, G)
+def to_png(filename, path, ops):
+    C = path_to_expression_graph(path, ops)
     f = os.path.join(main_dir, "tmp.dot")
     nx.drawing.nx_pydot.write_dot(C, f)
     (graph,) = pydot.graph_from_dot_file(f)
@@ -202,8 +347,8 @@ def main():
     t0 = time.time()
     for i in range(10):
         tokens = [i]*3
-        paths, G = search(tokens, target, unary_ops, merge_ops)
-        print(i, "searched nodes: {}".format(len(G)))
+        paths, ops, num_searched = search(tokens, target, unary_ops, merge_ops)
+        print(i, "searched nodes: {}".format(num_searched))
         if not paths:
             print(None)
             print()
@@ -211,9 +356,9 @@ def main():
         num_solutions = 0
         for j, path in enumerate(paths):
             if num_solutions < print_cutoff:
-                print_expression(path, G)
+                print_expression(path, ops)
                 filename = os.path.join(main_dir, "{}_{}.png".format(i, j))
-                to_png(filename, path, G)
+                to_png(filename, path, ops)
             num_solutions += 1
         if num_solutions > print_cutoff:
             print("{} more...".format(num_solutions - print_cutoff))
@@ -221,5 +366,11 @@ def main():
         print()
     print("Total time: {0:.3f}".format(time.time() - t0))
 
+    #t0 = time.time()
+    #results = sweep([[i]*4 for i in range(10)], range(1001), unary_ops, merge_ops)
+    #for tokens, target2expr in results.items():
+    #    print(tokens, sum(expr is not None for expr in target2expr.values()), "targets reached")
+    #print("Sweep time: {0:.3f}".format(time.time() - t0))
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,105 +1,106 @@
-import numpy as np
+import re
+from numbers import Number
+from weakref import WeakValueDictionary
 
-def get_subexpr(s):
-    d = 1
-    for i, ch in enumerate(s):
-        if ch == "(":
-            d += 1
-        elif ch == ")":
-            d -= 1
-        if not d:
-            break
-    else:
-        raise # Unmatched left parenthesis
-    return s[:i], s[i:]
+import numpy as np
 
+FUNCTIONS = ["cos", "sin"]
+TOKEN_RE = re.compile(r"\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_]\w*)|(\S))")
 
-def get_token(s):
+def tokenize(s):
     """
-    Unary minus sign is a big bug
+    Numbers, names and single character operators, in one pass
     """
-    s = s.strip()
-    for pat in ["+", "-", "*", "/", "(", ")", "cos(", "sin("]:
-        if s.startswith(pat):
-            return s[:len(pat)], s[len(pat):]
-
-    for i, ch in enumerate(s):
-        #print("ch:", ch)
-        if not ch.isalnum():
-            break
-    else:
-        return s, ""
-    return s[:i], s[i:]
+    for number, name, op in TOKEN_RE.findall(s):
+        if number:
+            yield float(number) if "." in number else int(number)
+        elif name:
+            yield name
+        elif op:
+            yield op
 
 
-def tokenize(s):
-    s = s.strip()
-    while s:
-        tok, s = get_token(s)
-        if tok == "(":
-            sub_s, s = get_subexpr(s)
-            #print("sub_s:", sub_s)
-            #print("s:", s)
-            yield parse(sub_s)
-        elif tok == "cos(":
-            sub_s, s = get_subexpr(s)
-            yield Expression("cos", parse(sub_s))
-        elif tok == "sin(":
-            sub_s, s = get_subexpr(s)
-            yield Expression("sin", parse(sub_s))
-        elif tok == ")":
-            pass
-        else:
-            yield tok
-
+BINARY_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
 
 def parse(s):
+    """
+    Precedence climbing, linear in the number of tokens.
+    All binary operators are left associative,
+    and a unary minus is multiplication by -1
+    """
     tokens = list(tokenize(s))
-    
-    newtokens = []
-    for tok in tokens:
-        try:
-            tok = int(tok)
-        except ValueError:
-            pass
-        except TypeError:
-            pass
-        newtokens.append(tok)
-    tokens = newtokens
-
-    while len(tokens) > 1:
-        if "/" in tokens:
-            i = tokens.index("/")
-            expr = Expression("/", tokens[i-1], tokens[i+1])
-            tokens = tokens[:i-1] + [expr] + tokens[i+2:]
-            continue
-
-        if "*" in tokens:
-            i = tokens.index("*")
-            expr = Expression("*", tokens[i-1], tokens[i+1])
-            tokens = tokens[:i-1] + [expr] + tokens[i+2:]
-            continue
-
-        if "-" in tokens:
-            i = tokens.index("-")
-            expr = Expression("-", tokens[i-1], tokens[i+1])
-            tokens = tokens[:i-1] + [expr] + tokens[i+2:]
-            continue
-
-        if "+" in tokens:
-            i = tokens.index("+")
-            expr = Expression("+", tokens[i-1], tokens[i+1])
-            tokens = tokens[:i-1] + [expr] + tokens[i+2:]
-            continue
-
-    return tokens[0]
-
+    expr, pos = _parse_expr(tokens, 0, 1)
+    if pos != len(tokens):
+        raise ValueError("Unexpected {!r} in {!r}".format(tokens[pos], s))
+    return expr
+
+def _parse_expr(tokens, pos, min_precedence):
+    lhs, pos = _parse_primary(tokens, pos)
+    while pos < len(tokens) and BINARY_PRECEDENCE.get(tokens[pos], 0) >= min_precedence:
+        op = tokens[pos]
+        rhs, pos = _parse_expr(tokens, pos + 1, BINARY_PRECEDENCE[op] + 1)
+        lhs = Expression(op, lhs, rhs)
+    return lhs, pos
+
+def _parse_primary(tokens, pos):
+    if pos == len(tokens):
+        raise ValueError("Unexpected end of expression")
+    tok = tokens[pos]
+    if tok == "(":
+        expr, pos = _parse_expr(tokens, pos + 1, 1)
+        return expr, _expect(tokens, pos, ")")
+    if tok == "-":
+        expr, pos = _parse_primary(tokens, pos + 1)
+        return Expression("*", -1, expr), pos
+    if tok in FUNCTIONS:
+        pos = _expect(tokens, pos + 1, "(")
+        expr, pos = _parse_expr(tokens, pos, 1)
+        return Expression(tok, expr), _expect(tokens, pos, ")")
+    if isinstance(tok, Number) or tok not in BINARY_PRECEDENCE and tok != ")":
+        return tok, pos + 1
+    raise ValueError("Unexpected {!r}".format(tok))
+
+def _expect(tokens, pos, tok):
+    if pos == len(tokens) or tokens[pos] != tok:
+        raise ValueError("Expected {!r}".format(tok))
+    return pos + 1
+
+
+def _leaf_key(a):
+    # 1, 1.0 and True are equal as dict keys, but not as leafs
+    if isinstance(a, Expression):
+        return a
+    return (type(a), a)
 
 class Expression:
-    def __init__(self, op, lhs, rhs=None):
-        self.op = op
-        self.lhs = lhs
-        self.rhs = rhs
+    """
+    Immutable, hash-consed expression node:
+    there is only ever one node with a given op and children,
+    so equal subexpressions are the same object,
+    and results can be cached on the node.
+    Leafs are numbers and variable names
+    """
+    __slots__ = ["op", "lhs", "rhs", "_simple", "_derivatives", "__weakref__"]
+    _nodes = WeakValueDictionary()
+
+    def __new__(cls, op, lhs, rhs=None):
+        key = (op, _leaf_key(lhs), _leaf_key(rhs))
+        node = cls._nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, "op", op)
+            object.__setattr__(node, "lhs", lhs)
+            object.__setattr__(node, "rhs", rhs)
+            object.__setattr__(node, "_simple", None)
+            object.__setattr__(node, "_derivatives", {})
+            cls._nodes[key] = node
+        return node
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Expression is immutable")
+
+    def __reduce__(self):
+        return (Expression, (self.op, self.lhs, self.rhs))
 
     def __str__(self):
         if self.rhs is None:
@@ -108,108 +109,121 @@ class Expression:
             return "(" + str(self.lhs) + self.op + str(self.rhs) + ")"
 
     def simplify(self):
-        try:
-            self.lhs = self.lhs.simplify()
-        except AttributeError:
-            pass
-
-        try:
-            self.rhs = self.rhs.simplify()
-        except AttributeError:
-            pass
-
-        if self.op == "+":
-            try:
-                return self.lhs + self.rhs / 1
-            except TypeError:
-                pass
-
-            if self.lhs == 0:
-                return self.rhs
-            if self.rhs == 0:
-                return self.lhs
-            return self
-
-        if self.op == "-":
-            try:
-                return self.lhs - self.rhs
-            except TypeError:
-                pass
-
-            if self.lhs == 0:
-                return Expression("*", -1, self.rhs).simplify()
-            if self.rhs == 0:
-                return self.lhs
-            return self
-
-        if self.op == "*":
-            try:
-                return self.lhs * self.rhs / 1
-            except TypeError:
-                pass
-
-            if self.rhs == 0:
-                return 0
-            if self.lhs == 0:
-                return 0
-            if self.lhs == 1:
-                return self.rhs
-            if self.rhs == 1:
-                return self.lhs
-            return self
-
-        if self.op == "/":
-            try:
-                return self.lhs / self.rhs
-            except TypeError:
-                pass
-
-            if self.lhs == 0:
-                return 0
-            if self.lhs == 1:
-                return self
-            if self.rhs == 1:
-                return self.lhs
-            return self
-
-        if self.op == "cos":
-            try:
-                return np.cos(self.lhs)
-            except TypeError:
-                return self
-
-        if self.op == "sin":
-            try:
-                return np.sin(self.lhs)
-            except TypeError:
-                return self
-
-    def collect_literals(self):
-        try:
-            self.lhs.collect_literals()
-        except AttributeError:
-            lhs_literals = {1: self.lhs}
-
-        try:
-            self.rhs.collect_literals()
-        except AttributeError:
-            rhs_literals = {1: self.rhs}
-
-        self.literals = {}
-        if self.op == "+":
-            pass
+        """
+        Folds constants and removes neutral elements, bottom up.
+        Cached on the node, so every shared subexpression is simplified once
+        """
+        if self._simple is None:
+            object.__setattr__(self, "_simple", _simplify_node(self))
+        return self._simple
+
+    def nodes(self):
+        """
+        All nodes below and including self, children before parents,
+        each shared node once
+        """
+        order = []
+        seen = set()
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            stack.append((node, True))
+            for child in (node.rhs, node.lhs):
+                if isinstance(child, Expression) and id(child) not in seen:
+                    stack.append((child, False))
+        return order
+
+    def variables(self):
+        return sorted(set(child for node in self.nodes() for child in (node.lhs, node.rhs)
+                          if isinstance(child, str)))
+
+def simplify(expr):
+    if isinstance(expr, Expression):
+        return expr.simplify()
+    return expr
+
+def _same(a, b):
+    return a is b or isinstance(a, str) and a == b
+
+def _simplify_node(expr):
+    lhs = simplify(expr.lhs)
+    rhs = simplify(expr.rhs)
+    numeric = isinstance(lhs, Number) and (rhs is None or isinstance(rhs, Number))
+
+    if expr.op == "+":
+        if numeric:
+            return lhs + rhs
+        if lhs == 0:
+            return rhs
+        if rhs == 0:
+            return lhs
+        if _same(lhs, rhs):
+            return Expression("*", 2, lhs)
+
+    elif expr.op == "-":
+        if numeric:
+            return lhs - rhs
+        if _same(lhs, rhs):
+            return 0
+        if lhs == 0:
+            return Expression("*", -1, rhs).simplify()
+        if rhs == 0:
+            return lhs
+
+    elif expr.op == "*":
+        if numeric:
+            return lhs * rhs
+        if lhs == 0 or rhs == 0:
+            return 0
+        if lhs == 1:
+            return rhs
+        if rhs == 1:
+            return lhs
+
+    elif expr.op == "/":
+        if numeric:
+            return lhs / rhs
+        if lhs == 0:
+            return 0
+        if rhs == 1:
+            return lhs
+        if _same(lhs, rhs):
+            return 1
+
+    elif expr.op == "cos":
+        if numeric:
+            return np.cos(lhs)
+
+    elif expr.op == "sin":
+        if numeric:
+            return np.sin(lhs)
+
+    return Expression(expr.op, lhs, rhs)
 
 
 def differentiate(expr, x):
-    #print(expr)
-    try:
-        expr.op
-    except AttributeError:
+    """
+    Derivative with respect to the variable x.
+    Cached on every node, so shared subexpressions
+    are differentiated once, and derivatives share
+    the nodes of the expression
+    """
+    if not isinstance(expr, Expression):
         if expr == x:
             return 1
         else:
             return 0
+    if x not in expr._derivatives:
+        expr._derivatives[x] = _differentiate_node(expr, x)
+    return expr._derivatives[x]
 
+def _differentiate_node(expr, x):
     if expr.op in ["+", "-"]:
         return Expression(expr.op,
                           differentiate(expr.lhs, x),
@@ -227,36 +241,127 @@ def differentiate(expr, x):
                                     )
                          )
     elif expr.op == "/":
+        # u'/v - (u*v'/v)/v: each order adds one power of v, instead of squaring it
         return Expression("-",
                           Expression("/",
                                      differentiate(expr.lhs, x),
                                      expr.rhs
                                      ),
                           Expression("/",
-                                     Expression("*",
-                                                expr.lhs,
-                                                differentiate(expr.rhs, x)
-                                                ),
-                                     Expression("*",
-                                                expr.rhs,
+                                     Expression("/",
+                                                Expression("*",
+                                                           expr.lhs,
+                                                           differentiate(expr.rhs, x)
+                                                           ),
                                                 expr.rhs
-                                                )
+                                                ),
+                                     expr.rhs
                                     )
                           )
     elif expr.op == "sin":
-        return Expression("*", 
-                          differentiate(expr.lhs, x), 
+        return Expression("*",
+                          differentiate(expr.lhs, x),
                           Expression("cos", expr.lhs)
                         )
     elif expr.op == "cos":
-        return Expression("*", 
-                          -1, 
-                          Expression("*", 
+        return Expression("*",
+                          -1,
+                          Expression("*",
                                      differentiate(expr.lhs, x),
                                      Expression("sin", expr.lhs)
                                     )
                         )
 
+
+_np_functions = {"cos": "np.cos", "sin": "np.sin"}
+CHUNK_BYTES = 1 << 28 # memory for the live intermediates of one chunk
+MAX_CHUNK = 1 << 16
+
+def compile_expression(expr, variables=None):
+    """
+    A NumPy function of the variables (default: sorted names in expr)
+    that evaluates expr elementwise over arrays.
+    Every node of the DAG becomes one line of generated code,
+    and intermediates are deleted after their last use.
+    Large inputs are evaluated a chunk at a time, small enough that
+    the intermediates alive at once take at most CHUNK_BYTES
+    """
+    if variables is None:
+        variables = expr.variables() if isinstance(expr, Expression) else []
+    args = ["v{}".format(i) for i in range(len(variables))]
+    var2arg = dict(zip(variables, args))
+    max_live = 1
+    if not isinstance(expr, Expression):
+        body = ["    return np.broadcast_arrays({}, *[{}])[0] * 1.0".format(
+                    var2arg.get(expr, repr(expr)), ", ".join(args))]
+    else:
+        nodes = expr.nodes()
+        node2name = {id(node): "t{}".format(i) for i, node in enumerate(nodes)}
+        last_use = {}
+        for i, node in enumerate(nodes):
+            for child in (node.lhs, node.rhs):
+                if isinstance(child, Expression):
+                    last_use[id(child)] = i
+
+        def operand(a):
+            if isinstance(a, Expression):
+                return node2name[id(a)]
+            if a in var2arg:
+                return var2arg[a]
+            if isinstance(a, Number):
+                return repr(a)
+            raise ValueError("Unknown variable: {}".format(a))
+
+        body = []
+        live = 0
+        for i, node in enumerate(nodes):
+            name = node2name[id(node)]
+            if node.rhs is None:
+                line = "{} = {}({})".format(name, _np_functions[node.op], operand(node.lhs))
+            else:
+                line = "{} = {} {} {}".format(name, operand(node.lhs), node.op, operand(node.rhs))
+            body.append("    " + line)
+            live += 1
+            max_live = max(max_live, live)
+            done = set(node2name[id(child)] for child in (node.lhs, node.rhs)
+                       if isinstance(child, Expression) and last_use[id(child)] == i)
+            if done:
+                body.append("    del " + ", ".join(sorted(done)))
+                live -= len(done)
+        result = node2name[id(nodes[-1])]
+        if variables and set(expr.variables()) == set(variables):
+            body.append("    return " + result)
+        else:
+            # constant in some (or all) of the arguments, so broadcast like a leaf
+            body.append("    return np.broadcast_arrays({}, *[{}])[0] * 1.0".format(
+                            result, ", ".join(args)))
+
+    source = "def f({}):\n{}\n".format(", ".join(args), "\n".join(body))
+    namespace = {"np": np}
+    exec(compile(source, "<expression>", "exec"), namespace)
+    f = _chunked(namespace["f"], max(1 << 10, min(MAX_CHUNK, CHUNK_BYTES // (8 * max_live))))
+    f.source = source
+    return f
+
+def _chunked(f, chunk_size):
+    """
+    f over the broadcast arguments, chunk_size elements at a time
+    """
+    def chunked_f(*values):
+        values = np.broadcast_arrays(*values)
+        if not values or values[0].size <= chunk_size:
+            return f(*values)
+        shape = values[0].shape
+        flat = [v.reshape(-1) for v in values]
+        out = None
+        for i0 in range(0, flat[0].size, chunk_size):
+            chunk = f(*[v[i0:i0+chunk_size] for v in flat])
+            if out is None:
+                out = np.empty(flat[0].size, dtype=chunk.dtype)
+            out[i0:i0+chunk_size] = chunk
+        return out.reshape(shape)
+    return chunked_f
+
 def main():
     #expr = Expression("*", 2, "x")
     #print(expr.simplify())
@@ -264,9 +369,12 @@ def main():
 
     print(differentiate(parse("cos(x)*cos(x) + sin(x)*sin(x)"), "x").simplify())
 
+    #expr = parse("sin(x)*cos(x)/x")
+    #for _ in range(10):
+    #    expr = differentiate(expr, "x").simplify()
+    #f = compile_expression(expr, ["x"])
+    #print(len(expr.nodes()), f(np.linspace(1, 2, 1000000))[:3])
 
 
 if __name__ == '__main__':
     main()
-
-
@@ -1,30 +1,34 @@
 import numpy as np
+from scipy.sparse import coo_matrix
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 
-from sentian_miami import get_solver
+from garageofcode.mip.model import MatrixModel
 
 
 def mip_optimize(Y):
     #Y = [2, 6, 5, 3, 4, 5, 1]
     N = len(Y)
 
-    solver = get_solver("CBC")
+    model = MatrixModel()
 
-    X = {(i, j): solver.IntVar(lb=0) for i in range(N) for j in range(i+1, N+1)}
+    I, J = np.triu_indices(N + 1, k=1)
+    X = model.IntVars(len(I), lb=0)
 
     # get exact covers
-    for k, y in enumerate(Y):
-        X_covering = [val for (i, j), val in X.items() if i <= k < j]
-        solver.Add(solver.Sum(X_covering) == y)
+    # interval (i, j) covers k for i <= k < j
+    lengths = J - I
+    cols = np.repeat(np.arange(len(I)), lengths)
+    rows = np.repeat(I, lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+    A = coo_matrix((np.ones(len(cols)), (rows, cols)), shape=(N, len(I)))
+    model.add_rows(A, lb=Y, ub=Y, cols=X)
 
     # set objective
-    cost = solver.Sum(X.values())
-    solver.SetObjective(cost, maximize=False)
+    model.set_objective(X, 1, maximize=False)
 
-    solver.Solve(time_limit=10)
+    model.solve(time_limit=10)
 
-    return solver.solution_value(cost)
+    return model.objective_value()
     
     '''
     print("Score:", solver.solution_value(cost))
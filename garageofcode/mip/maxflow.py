@@ -1,9 +1,11 @@
 import numpy as np
+from scipy.sparse import coo_matrix
 
 import networkx as nx
 
-from sentian_miami import get_solver
+from garageofcode.mip.model import MatrixModel
 from garageofcode.networkx.utils import get_random_graph
+from garageofcode.networkx.sparse_graph import max_flow
 
 def get_xkcd730_graph():
     G = nx.DiGraph()
@@ -26,28 +28,47 @@ def get_xkcd730_graph():
     return G
 
 
-def get_flows(G, s, t, capacity):
-    solver = get_solver("CBC")
+def get_flows(G, s, t, capacity, backend="mip"):
+    """
+    backend: "mip" for the LP, or "dinic" for
+    the combinatorial max flow in networkx/sparse_graph
+    """
+    nodes = list(G)
+    node2idx = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(data=capacity))
+    E = len(edges)
+    tails = np.array([node2idx[u] for u, _, _ in edges], dtype=int)
+    heads = np.array([node2idx[v] for _, v, _ in edges], dtype=int)
+    caps = np.array([cap for _, _, cap in edges], dtype=float)
 
-    flows = {(u, v): solver.NumVar(lb=0, ub=cap) for u, v, cap in G.edges(data=capacity)}
+    if backend == "dinic":
+        _, flows = max_flow(len(nodes), tails, heads, caps, node2idx[s], node2idx[t])
+        return {(u, v): flow for (u, v, _), flow in zip(edges, flows.tolist())}
+    if backend != "mip":
+        raise ValueError("Unknown backend: {}".format(backend))
 
-    for node in G:
-        in_flow = solver.Sum([flows[e] for e in G.in_edges(node)])
-        out_flow = solver.Sum([flows[e] for e in G.out_edges(node)])
+    model = MatrixModel()
+    flows = model.NumVars(E, lb=0, ub=caps, name="flow")
 
-        if node == s:
-            total_in = out_flow - in_flow
-        elif node == t:
-            total_out = in_flow - out_flow
-        else:
-            solver.Add(in_flow == out_flow)
+    #  node-edge incidence matrix: +1 for inflow, -1 for outflow
+    edge_idx = np.arange(E)
+    vals = np.concatenate([np.ones(E), -np.ones(E)])
+    rows = np.concatenate([heads, tails])
+    cols = np.concatenate([edge_idx, edge_idx])
+    incidence = coo_matrix((vals, (rows, cols)), shape=(len(nodes), E)).tocsr()
 
-    solver.SetObjective(total_out, maximize=True)
+    #  flow conservation everywhere except at source and sink
+    inner = np.array([i for i, node in enumerate(nodes) if node not in (s, t)], dtype=int)
+    model.add_rows(incidence[inner], lb=0, ub=0, cols=flows)
 
-    solver.Solve(time_limit=10, verbose=True)
-    total_out = solver.solution_value(total_out)
-    #print("Total out:", total_out)
-    return {e: solver.solution_value(flow) for e, flow in flows.items()}
+    #  maximize net inflow to sink
+    t_row = incidence[node2idx[t]].tocoo()
+    model.set_objective(flows[t_row.col], t_row.data, maximize=True)
+
+    model.solve(time_limit=10, verbose=True)
+    #print("Total out:", model.objective_value())
+    return {(u, v): model.solution_value(flow) 
+            for (u, v, _), flow in zip(edges, flows)}
 
 
 def main():
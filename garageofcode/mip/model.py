@@ -0,0 +1,282 @@
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, issparse
+
+from garageofcode.mip.solver import get_solver, status2str
+
+class MatrixModel:
+    """
+    Solver-agnostic model builder.
+    Variables are integer indices, constraints are added
+    as whole matrices: lb <= A x <= ub.
+    Nothing is handed to a solver until solve() or to_solver(),
+    at which point everything is loaded in one pass over the nonzeros.
+    """
+    def __init__(self):
+        self._lb = []
+        self._ub = []
+        self._integer = []
+        self._names = []
+        self.num_vars = 0
+
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._row_lb = []
+        self._row_ub = []
+        self.num_rows = 0
+
+        self.obj = np.zeros(0)
+        self.maximize = False
+
+        self.solver = None
+        self.X = None
+        self.x = None
+        self._loaded_rows = 0 # rows already in self.solver
+
+    """
+    Variables
+    """
+    def add_vars(self, n, lb=0, ub=np.inf, integer=False, name=""):
+        """
+        Adds n variables with common or per-variable bounds.
+        Returns the indices of the new variables as an array,
+        which can be reshaped to whatever index structure is convenient.
+        """
+        idx = np.arange(self.num_vars, self.num_vars + n)
+        self._lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (n,)))
+        self._ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (n,)))
+        self._integer.append(np.broadcast_to(np.asarray(integer, dtype=bool), (n,)))
+        self._names.append((idx[0] if n else 0, n, name))
+        self.num_vars += n
+        return idx
+
+    def IntVars(self, shape, lb=0, ub=np.inf, name=""):
+        return self._var_array(shape, lb, ub, True, name)
+
+    def NumVars(self, shape, lb=0, ub=np.inf, name=""):
+        return self._var_array(shape, lb, ub, False, name)
+
+    def _var_array(self, shape, lb, ub, integer, name):
+        """
+        Bounds can be given per element, in the shape of the array
+        """
+        n = int(np.prod(shape))
+        lb = np.broadcast_to(np.asarray(lb, dtype=float), shape).ravel()
+        ub = np.broadcast_to(np.asarray(ub, dtype=float), shape).ravel()
+        return self.add_vars(n, lb, ub, integer, name).reshape(shape)
+
+    """
+    Constraints
+    """
+    def add_rows(self, A, lb=-np.inf, ub=np.inf, cols=None):
+        """
+        Adds the constraints lb <= A x[cols] <= ub.
+        A is a scipy sparse matrix, a dense array,
+        or a COO triple (vals, (rows, cols)).
+        If cols is None, the columns of A are the model variables.
+        Returns the indices of the new rows.
+        """
+        if isinstance(A, tuple):
+            vals, (rows, cs) = A
+            num_rows = int(np.max(rows)) + 1 if len(rows) else 0
+            A = coo_matrix((vals, (rows, cs)),
+                           shape=(num_rows, int(np.max(cs)) + 1 if len(cs) else 0))
+        elif issparse(A):
+            A = A.tocoo()
+        else:
+            A = coo_matrix(np.atleast_2d(A))
+
+        m = A.shape[0]
+        col_idx = A.col if cols is None else np.asarray(cols).ravel()[A.col]
+        self._rows.append(A.row + self.num_rows)
+        self._cols.append(col_idx)
+        self._vals.append(A.data.astype(float))
+        self._row_lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (m,)))
+        self._row_ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (m,)))
+        idx = np.arange(self.num_rows, self.num_rows + m)
+        self.num_rows += m
+        return idx
+
+    def add_row(self, cols, coefs=1, lb=-np.inf, ub=np.inf):
+        """
+        Single constraint lb <= sum(coefs * x[cols]) <= ub
+        """
+        cols = np.asarray(cols).ravel()
+        coefs = np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape)
+        return self.add_rows((coefs, (np.zeros(len(cols), dtype=int), np.arange(len(cols)))),
+                             lb, ub, cols=cols)
+
+    def add_sum_rows(self, groups, lb=-np.inf, ub=np.inf):
+        """
+        One constraint per group: lb <= sum(x[group]) <= ub
+        groups is a 2d index array (one row per group),
+        or a list of index arrays of varying length.
+        """
+        if isinstance(groups, np.ndarray) and groups.ndim == 2:
+            m, k = groups.shape
+            rows = np.repeat(np.arange(m), k)
+            cols = groups.ravel()
+        else:
+            lengths = [len(g) for g in groups]
+            m = len(lengths)
+            rows = np.repeat(np.arange(m), lengths)
+            cols = np.concatenate([np.asarray(g, dtype=int) for g in groups]) if m else np.zeros(0, dtype=int)
+        A = coo_matrix((np.ones(len(cols)), (rows, np.arange(len(cols)))),
+                       shape=(m, len(cols)))
+        return self.add_rows(A, lb, ub, cols=cols)
+
+    """
+    Objective
+    """
+    def set_objective(self, cols, coefs=1, maximize=False):
+        cols = np.asarray(cols).ravel()
+        self.obj = np.zeros(self.num_vars)
+        np.add.at(self.obj, cols, np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape))
+        self.maximize = maximize
+
+    """
+    Export
+    """
+    def bounds(self):
+        if not self.num_vars:
+            return np.zeros(0), np.zeros(0), np.zeros(0, dtype=bool)
+        return (np.concatenate(self._lb),
+                np.concatenate(self._ub),
+                np.concatenate(self._integer))
+
+    def matrix(self):
+        """
+        Returns A, row_lb, row_ub with A in CSR format
+        """
+        if not self.num_rows:
+            return csr_matrix((0, self.num_vars)), np.zeros(0), np.zeros(0)
+        A = coo_matrix((np.concatenate(self._vals),
+                        (np.concatenate(self._rows), np.concatenate(self._cols))),
+                       shape=(self.num_rows, self.num_vars)).tocsr()
+        return A, np.concatenate(self._row_lb), np.concatenate(self._row_ub)
+
+    def var_names(self):
+        names = np.array(["x{}".format(i) for i in range(self.num_vars)], dtype=object)
+        for i0, n, name in self._names:
+            if name:
+                names[i0:i0+n] = ["{}_{}".format(name, i) for i in range(n)]
+        return names
+
+    def to_solver(self, solver=None):
+        """
+        Loads the model into an OR-tools solver.
+        Constraints are created through SetCoefficient row by row
+        instead of going through python expression trees.
+        Returns the solver and the list of solver variables.
+        """
+        if solver is None:
+            solver = get_solver("CBC")
+        inf = solver.infinity()
+        lb, ub, integer = self.bounds()
+        names = self.var_names()
+        X = [solver.Var(max(l, -inf), min(u, inf), bool(it), name)
+             for l, u, it, name in zip(lb, ub, integer, names)]
+
+        self.solver = solver
+        self.X = X
+        self._loaded_rows = 0
+        self._load_rows()
+
+        objective = solver.Objective()
+        for j in np.flatnonzero(self.obj):
+            objective.SetCoefficient(X[j], float(self.obj[j]))
+        if self.maximize:
+            objective.SetMaximization()
+        else:
+            objective.SetMinimization()
+        return solver, X
+
+    def _load_rows(self):
+        """
+        Adds the rows that are not yet in self.solver
+        """
+        A, row_lb, row_ub = self.matrix()
+        inf = self.solver.infinity()
+        r0 = self._loaded_rows
+        indptr, indices, data = A.indptr, A.indices.tolist(), A.data.tolist()
+        row_lb = np.maximum(row_lb, -inf).tolist()
+        row_ub = np.minimum(row_ub, inf).tolist()
+        for r in range(r0, A.shape[0]):
+            ct = self.solver.Constraint(row_lb[r], row_ub[r])
+            for k in range(indptr[r], indptr[r+1]):
+                ct.SetCoefficient(self.X[indices[k]], data[k])
+        self._loaded_rows = A.shape[0]
+
+    def solve(self, time_limit=0, verbose=True, solver=None, incremental=False, hint=None):
+        """
+        Returns the status, the solution is stored in self.x.
+        If incremental, the solver from the previous solve is kept
+        and only the rows added since then are loaded into it,
+        which is how cutting plane loops should add their cuts.
+        hint: values of all variables to start the search from
+        """
+        if incremental and self.solver is not None and solver is None \
+                and len(self.X) == self.num_vars:
+            solver, X = self.solver, self.X
+            self._load_rows()
+        else:
+            solver, X = self.to_solver(solver)
+        if hint is not None:
+            solver.SetHint(X, [float(v) for v in hint])
+        status = solver.Solve(time_limit=time_limit, verbose=verbose)
+        if status2str[status] in ["OPTIMAL", "FEASIBLE"]:
+            self.x = np.array([x.solution_value() for x in X])
+        else:
+            self.x = None
+        return status
+
+    def solution_value(self, idx):
+        return self.x[idx]
+
+    def objective_value(self):
+        return float(np.dot(self.obj, self.x))
+
+    def write_lp(self, fn):
+        """
+        Plain LP format export, independent of any solver
+        """
+        with open(fn, "w") as f:
+            f.write("\n".join(self.lp_lines()))
+            f.write("\n")
+
+    def lp_lines(self):
+        names = self.var_names()
+        lb, ub, integer = self.bounds()
+
+        def terms(cols, coefs):
+            return " ".join("{} {} {}".format("-" if c < 0 else "+", repr(abs(float(c))), names[j])
+                            for j, c in zip(cols, coefs)) or "0 x0"
+
+        yield "Maximize" if self.maximize else "Minimize"
+        nz = np.flatnonzero(self.obj) if len(self.obj) else []
+        yield " obj: " + terms(nz, self.obj[nz] if len(nz) else [])
+
+        yield "Subject To"
+        A, row_lb, row_ub = self.matrix()
+        for r in range(A.shape[0]):
+            sl = slice(A.indptr[r], A.indptr[r+1])
+            lhs = terms(A.indices[sl], A.data[sl])
+            l, u = row_lb[r], row_ub[r]
+            if l == u:
+                yield " c{}: {} = {}".format(r, lhs, repr(float(l)))
+                continue
+            if np.isfinite(l):
+                yield " c{}_lb: {} >= {}".format(r, lhs, repr(float(l)))
+            if np.isfinite(u):
+                yield " c{}_ub: {} <= {}".format(r, lhs, repr(float(u)))
+
+        yield "Bounds"
+        for name, l, u in zip(names, lb, ub):
+            l = repr(float(l)) if np.isfinite(l) else "-inf"
+            u = repr(float(u)) if np.isfinite(u) else "+inf"
+            yield " {} <= {} <= {}".format(l, name, u)
+
+        if np.any(integer):
+            yield "General"
+            yield " " + " ".join(names[integer])
+        yield "End"
@@ -1,6 +1,8 @@
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-from garageofcode.mip.solver import get_solver
+from garageofcode.mip.model import MatrixModel
 
 def tsp(points, depot=None):
     """MIP exact solution of TSP
@@ -17,49 +19,153 @@ def tsp(points, depot=None):
     ids, coords = zip(*points)
     N = len(ids)
 
-    solver = get_solver("CBC")
+    model = MatrixModel()
     D  = np.array([[np.linalg.norm(x - y) 
                     for y in coords] for x in coords])
     #  gate variables
-    GV = np.array([[solver.IntVar(0, int(i != j)) 
-                    for j in range(N)] for i in range(N)])
+    GV = model.IntVars((N, N), lb=0, ub=1 - np.eye(N))
     #  time variables
-    TV = [solver.NumVar(lb=0) for _ in range(N)]
+    TV = model.NumVars(N, lb=0)
     
     #  exactly one entrance to all except entrance depot
-    for j in range(1, N):
-        solver.Add(solver.Sum(GV[:, j]) == 1)
     #  no entrance to entrance depot
-    solver.Add(solver.Sum(GV[:, 0]) == 0)
+    in_degree = np.ones(N)
+    in_degree[0] = 0
+    model.add_sum_rows(GV.T, lb=in_degree, ub=in_degree)
 
     #  exactly one exit from all except exit depot
-    for i in range(N-1):
-        solver.Add(solver.Sum(GV[i, :]) == 1)
     #  no exit from exit depot
-    solver.Add(solver.Sum(GV[-1, :]) == 0)
+    out_degree = np.ones(N)
+    out_degree[-1] = 0
+    model.add_sum_rows(GV, lb=out_degree, ub=out_degree)
 
     #  can get tighter big M, by greedy solution
     #  actually, it doesn't make it faster
     M = N * np.max(D) * 2
     #  eliminate subtours with time variable formulation
-    for i in range(N):
-        for j in range(N):
-            if i == j:
-                continue
-            gv = GV[i, j]
-            d = D[i, j]
-            solver.Add(TV[j] >= TV[i] + d - M * (1 - gv))
+    #  TV[j] - TV[i] - M * GV[i, j] >= D[i, j] - M
+    I, J = np.nonzero(1 - np.eye(N))
+    K = len(I)
+    rows = np.tile(np.arange(K), 3)
+    cols = np.concatenate([TV[J], TV[I], GV[I, J]])
+    vals = np.concatenate([np.ones(K), -np.ones(K), -M * np.ones(K)])
+    model.add_rows((vals, (rows, cols)), lb=D[I, J] - M)
 
     #  minimize finish time
-    solver.SetObjective(TV[-1], maximize=False)
+    model.set_objective(TV[-1], maximize=False)
 
-    solver.Solve(time_limit=10, verbose=False)
+    model.solve(time_limit=10, verbose=False)
 
-    idx_order = np.argsort([solver.solution_value(tv) for tv in TV])
+    idx_order = np.argsort(model.solution_value(TV))
     return [(ids[idx0], ids[idx1]) 
                 for idx0, idx1 in zip(idx_order, idx_order[1:])]
 
 
+def tsp_lazy(points, depot=None, time_limit=0, verbose=False):
+    """MIP exact solution of TSP with lazy subtour elimination
+    Solves the degree constrained relaxation, 
+    finds subtours in the solution and cuts them off,
+    until the solution is a single tour.
+    The solver is kept between rounds, and only the new cuts are added.
+    Seeded with a heuristic tour as upper bound and as a hint in every round.
+    Returns the edges, in the same format as tsp
+    """
+    from garageofcode.nphard.tsp import TSPath
+
+    if not points:
+        return []
+    if depot is not None:
+        points = [depot] + points
+    ids, coords = zip(*points)
+    N = len(ids)
+    if N < 4:
+        order = list(range(N)) + [0]
+        return [(ids[i], ids[j]) for i, j in zip(order, order[1:])]
+
+    coords = np.array(coords, dtype=float)
+    D = np.linalg.norm(coords[:, None, :] - coords[None, :, :], axis=-1)
+
+    #  heuristic upper bound
+    tspath = TSPath(D=D)
+    tspath.greedy_init()
+    tspath.exhaust_crosses()
+    ub = tspath.get_score()
+    heuristic_order = tspath.get_path()
+
+    #  one variable per undirected edge
+    I, J = np.triu_indices(N, k=1)
+    E = len(I)
+    edge_idx = -np.ones([N, N], dtype=int)
+    edge_idx[I, J] = np.arange(E)
+    edge_idx[J, I] = np.arange(E)
+
+    model = MatrixModel()
+    X = model.IntVars(E, lb=0, ub=1, name="x")
+
+    #  degree two at every node
+    incidence = coo_matrix((np.ones(2*E), 
+                            (np.concatenate([I, J]), np.tile(np.arange(E), 2))), 
+                           shape=(N, E))
+    model.add_rows(incidence, lb=2, ub=2, cols=X)
+
+    #  no worse than the heuristic
+    model.add_row(X, D[I, J], ub=ub + 1e-6)
+    model.set_objective(X, D[I, J], maximize=False)
+
+    #  the heuristic tour satisfies every subtour cut, so it is a valid start
+    hint = np.zeros(E)
+    hint[edge_idx[heuristic_order, np.roll(heuristic_order, -1)]] = 1
+
+    while True:
+        model.solve(time_limit=time_limit, verbose=verbose, incremental=True, hint=hint)
+        if model.x is None:
+            #  heuristic was optimal, or we ran out of time
+            order = heuristic_order
+            break
+
+        chosen = np.round(model.x).astype(bool)
+        G = coo_matrix((np.ones(chosen.sum()), (I[chosen], J[chosen])), shape=(N, N))
+        num_comp, labels = connected_components(G, directed=False)
+        if num_comp == 1:
+            order = _tour_order(I[chosen], J[chosen], N)
+            break
+
+        #  the edges inside a subtour S must be fewer than |S|
+        #  only cut the small side, the complement cut is equivalent
+        for c in range(num_comp):
+            S = np.flatnonzero(labels == c)
+            if len(S) > N // 2:
+                continue
+            si, sj = np.triu_indices(len(S), k=1)
+            model.add_row(X[edge_idx[S[si], S[sj]]], 1, ub=len(S) - 1)
+        if verbose:
+            print("Subtours: {0:d}, cuts: {1:d}".format(num_comp, model.num_rows - N - 1))
+
+    #  start and end at depot
+    k = order.index(0)
+    order = order[k:] + order[:k] + [0]
+    return [(ids[idx0], ids[idx1]) 
+                for idx0, idx1 in zip(order, order[1:])]
+
+
+def _tour_order(I, J, N):
+    """Walks the cycle given by the edges (I, J)
+    """
+    neighbours = [[] for _ in range(N)]
+    for i, j in zip(I, J):
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    order = [0]
+    prev = None
+    node = 0
+    for _ in range(N - 1):
+        a, b = neighbours[node]
+        nxt = a if a != prev else b
+        prev, node = node, nxt
+        order.append(node)
+    return order
+
+
     '''
     sample = partial(np.random.choice, size=k, replace=False)
     c = Counter(chain.from_iterable(tsp([points[i] 
@@ -0,0 +1,184 @@
+"""
+Graphs as flat edge arrays and SciPy sparse matrices.
+Resistor networks are solved through the graph Laplacian,
+and max flow is Dinic's algorithm over CSR adjacency arrays.
+Nodes are numbered 0..n-1 in the order of G.
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve, cg, LinearOperator
+
+DIRECT_MAX_NODES = 50000 # larger systems are solved with cg
+EPS = 1e-12
+
+def to_arrays(G, weight=None, default=1.0):
+    """
+    Returns nodes, node2idx and the tail, head and weight of every edge
+    """
+    nodes = list(G)
+    node2idx = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(data=weight, default=default)) if weight else \
+            [(u, v, default) for u, v in G.edges]
+    tails = np.array([node2idx[u] for u, _, _ in edges], dtype=np.int64)
+    heads = np.array([node2idx[v] for _, v, _ in edges], dtype=np.int64)
+    weights = np.array([w for _, _, w in edges], dtype=float)
+    return nodes, node2idx, tails, heads, weights
+
+def laplacian(n, tails, heads, conductances):
+    """
+    D - A of the undirected graph, as a csr matrix.
+    Parallel edges add up
+    """
+    rows = np.concatenate([tails, heads, tails, heads])
+    cols = np.concatenate([heads, tails, tails, heads])
+    vals = np.concatenate([-conductances, -conductances, conductances, conductances])
+    return sp.coo_matrix((vals, (rows, cols)), shape=(n, n)).tocsr()
+
+def solve_laplacian(L, b, method=None, tol=1e-10):
+    """
+    Solves L x = b for a symmetric positive definite L, e.g. a grounded Laplacian.
+    method: "direct" (sparse LU), "cg" (conjugate gradients with
+    a Jacobi preconditioner), or by size if None
+    """
+    if method is None:
+        method = "direct" if L.shape[0] <= DIRECT_MAX_NODES else "cg"
+    if method == "direct":
+        return spsolve(L.tocsc(), b)
+    if method == "cg":
+        inv_diag = 1 / L.diagonal()
+        M = LinearOperator(L.shape, matvec=lambda x: inv_diag * x)
+        x, info = cg(L, b, rtol=tol, maxiter=10 * L.shape[0], M=M)
+        if info:
+            raise RuntimeError("cg did not converge: {}".format(info))
+        return x
+    raise ValueError("Unknown method: {}".format(method))
+
+def get_potentials(G, s, t, resistance=None, U=1.0, method=None):
+    """
+    Potentials with s at U and t at 0, where every edge is a resistor
+    (weight resistance, default 1). Nodes not connected to t get nan.
+    Returns node2potential, edge2current (positive from tail to head)
+    and the effective resistance between s and t
+    """
+    if s == t:
+        raise ValueError("s and t must differ: {}".format(s))
+    nodes, node2idx, tails, heads, resistances = to_arrays(G, resistance)
+    n = len(nodes)
+    conductances = 1 / resistances
+    L = laplacian(n, tails, heads, conductances)
+    i_s, i_t = node2idx[s], node2idx[t]
+
+    # ground t, and drop everything not connected to it
+    _, labels = connected_components(L, directed=False)
+    component = labels == labels[i_t]
+    phi = np.full(n, np.nan)
+    if not component[i_s]:
+        return dict(zip(nodes, phi)), {}, np.inf
+    free = np.flatnonzero(component)
+    free = free[free != i_t]
+    free2row = {i: k for k, i in enumerate(free.tolist())}
+
+    # unit current into s: the potential at s is the effective resistance
+    b = np.zeros(len(free))
+    b[free2row[i_s]] = 1
+    x = solve_laplacian(L[free][:, free], b, method)
+    R = x[free2row[i_s]]
+
+    phi[free] = x * U / R
+    phi[i_t] = 0
+    currents = (phi[tails] - phi[heads]) * conductances
+    edge2current = {(nodes[u], nodes[v]): current
+                    for u, v, current in zip(tails.tolist(), heads.tolist(), currents.tolist())}
+    return dict(zip(nodes, phi.tolist())), edge2current, R
+
+def effective_resistance(G, s, t, resistance=None, method=None):
+    _, _, R = get_potentials(G, s, t, resistance, method=method)
+    return R
+
+"""
+Max flow
+"""
+def max_flow(n, tails, heads, caps, s, t):
+    """
+    Dinic's algorithm. Edge e is arc e, its reverse is arc e + E.
+    Levels come from a vectorized bfs, and blocking flows from a dfs
+    with a current-arc pointer per node.
+    Returns the flow value and the flow on every edge
+    """
+    if s == t:
+        raise ValueError("s and t must differ: {}".format(s))
+    E = len(tails)
+    arc_tail = np.concatenate([tails, heads])
+    arc_head = np.concatenate([heads, tails])
+    order = np.argsort(arc_tail, kind="stable")
+    indptr = np.searchsorted(arc_tail[order], np.arange(n + 1))
+
+    adj = order.tolist()
+    end = indptr[1:].tolist()
+    tail = arc_tail.tolist()
+    head = arc_head.tolist()
+    residual = np.concatenate([caps, np.zeros(E)]).astype(float).tolist()
+    rev = lambda a: a + E if a < E else a - E
+
+    total = 0.0
+    while True:
+        level = _levels(n, s, indptr, order, arc_head, np.array(residual))
+        if level[t] < 0:
+            break
+        level = level.tolist()
+        ptr = indptr[:-1].tolist()
+        path = []
+        u = s
+        while True:
+            if u == t:
+                f = min(residual[a] for a in path)
+                for a in path:
+                    residual[a] -= f
+                    residual[rev(a)] += f
+                total += f
+                # back to the tail of the first saturated arc
+                k = next(k for k, a in enumerate(path) if residual[a] <= EPS)
+                u = tail[path[k]]
+                del path[k:]
+                continue
+            while ptr[u] < end[u]:
+                a = adj[ptr[u]]
+                if residual[a] > EPS and level[head[a]] == level[u] + 1:
+                    break
+                ptr[u] += 1
+            else:
+                # dead end
+                if u == s:
+                    break
+                level[u] = -1
+                a = path.pop()
+                u = tail[a]
+                ptr[u] += 1
+                continue
+            path.append(a)
+            u = head[a]
+
+    flows = np.maximum(np.asarray(caps, dtype=float) - np.array(residual[:E]), 0)
+    return total, flows
+
+def _levels(n, s, indptr, order, arc_head, residual):
+    """
+    Bfs distance from s over arcs with residual capacity, -1 if unreachable
+    """
+    level = np.full(n, -1, dtype=np.int64)
+    level[s] = 0
+    frontier = np.array([s])
+    depth = 0
+    while len(frontier):
+        starts, stops = indptr[frontier], indptr[frontier + 1]
+        counts = stops - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        arcs = order[offsets + np.arange(counts.sum())]
+        arcs = arcs[residual[arcs] > EPS]
+        nxt = np.unique(arc_head[arcs])
+        nxt = nxt[level[nxt] < 0]
+        depth += 1
+        level[nxt] = depth
+        frontier = nxt
+    return level
@@ -9,17 +9,13 @@ from torch.nn import functional as F
 from torch.utils import data as torch_data
 
 from garageofcode.nn.models import MLP
+from garageofcode.tda.metrics import pairwise, euclidean
 
 def get_mds(X, metric, dim=2):
     mds = MDS(n_components=dim, dissimilarity='precomputed')
-    M = [[metric(xi, xj) for xj in X] for xi in X]
+    M = pairwise(X, metric)
     return mds.fit_transform(M), mds  
 
-def euclidean(xi, xj):
-    xi = np.array(xi)
-    xj = np.array(xj)
-    return np.linalg.norm(xi - xj)
-
 def plot_mds(ax, X, mds=None):
     ax.cla()
     X_fit, mds = get_mds(X, euclidean)
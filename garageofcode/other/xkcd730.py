@@ -3,8 +3,7 @@ import numpy as np
 
 import networkx as nx
 
-#from garageofcode.mip.solver import get_solver
-from sentian_miami import get_solver
+from garageofcode.networkx import sparse_graph
 
 def get_xkcd730_graph():
     G = nx.DiGraph()
@@ -36,54 +35,21 @@ def get_simple_graph():
     return G
 
 def get_potentials(G, s, t):
-    # It's not necessary to use a MIP solver for this;
-    # it's just a linear equation system.
-    # But it makes for a simple formulation.
-
-    solver = get_solver("mono")
-
-    t0 = time.time()
-    potentials = {node: solver.NumVar(lb=0) for node in G}
-    currents = {e: solver.NumVar() for e in G.edges}
-
-    # Edge conditions
+    # Kirchoff's and Ohm's laws together are a linear system
+    # in the graph Laplacian, with s at U0 and t at U_1
     U0, U_1 = 1, 0
     total_potential = U0 - U_1
-    solver.Add(potentials[s] == U0)
-    solver.Add(potentials[t] == U_1)
 
-    # Kirchoff's law: current is preserved in internal nodes
-    for node in G:
-        in_current = solver.Sum([currents[e] for e in G.in_edges(node)])
-        out_current = solver.Sum([currents[e] for e in G.out_edges(node)])
-        if node == s:
-            total_in = out_current - in_current
-        elif node == t:
-            total_out = in_current - out_current
-        else:
-            solver.Add(in_current == out_current)
-
-    # Ohm's law: delta U = I * R
-    for e in G.edges:
-        i, j = e
-        Ui = potentials[i]
-        Uj = potentials[j]
-        Iij = currents[e]
-        Rij = 1 # ignore resistance parameter for now
-        solver.Add(Ui - Uj == Rij * Iij)
-
-    t1 = time.time()
-    print("Build time: {0:.3f}".format(t1 - t0))
-
-    solver.Solve(time_limit=10, verbose=True)
+    t0 = time.time()
+    potentials, currents, total_resistance = sparse_graph.get_potentials(G, s, t, U=total_potential)
+    print("Solve time: {0:.3f}".format(time.time() - t0))
 
-    total_current = solver.solution_value(total_in)
-    total_resistance = total_potential / total_current
+    total_current = total_potential / total_resistance
     print("Total resistance: {0:.3f}".format(total_resistance))
     print("Total current: {0:.3f}".format(total_current))
 
     for node, potential in sorted(potentials.items()):
-        print("{0:d}  {1:.3f}".format(node, solver.solution_value(potential)))
+        print("{0:d}  {1:.3f}".format(node, potential + U_1))
 
 def main():
     np.random.seed(0)
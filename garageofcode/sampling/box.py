@@ -57,11 +57,15 @@ class SamplingBoxTree(BoxTree):
     def entropy(self):
         return entropy([box.volume() for box in self.get_leafs()])
 
-    def markov_row_transition(self, from_state, to_states):
+    def markov_row_transition(self, from_state, to_states, boxes=None):
+        """
+        boxes: the leafs at the middle of from_state, if already known
+        """
         row = np.zeros(len(to_states))
         mid = (from_state[0] + from_state[1]) / 2
         dim2val = {0: mid}
-        boxes = list(self.profile(dim2val))
+        if boxes is None:
+            boxes = list(self.profile(dim2val))
         get_end = lambda box: box[0][1]
         for box in sorted(boxes, key=get_end):
             c0 = box.profile(dim2val)
@@ -82,7 +86,9 @@ class SamplingBoxTree(BoxTree):
         bins = [min(map(get_start, boxes))] + bins
         bins = list(sorted(set(bins)))
         bins = [(b0, b1) for b0, b1 in zip(bins[:-1], bins[1:])]
-        P = [self.markov_row_transition(b, bins) for b in bins]
+        mids = [(b0 + b1) / 2 for b0, b1 in bins]
+        bin2boxes = self.profile_many(mids, dims=[0])
+        P = [self.markov_row_transition(b, bins, boxes) for b, boxes in zip(bins, bin2boxes)]
         return np.array(P)
 
     def stationary_distribution(self):
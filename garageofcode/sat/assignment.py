@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 from itertools import product
 
@@ -9,10 +10,10 @@ from pysat.formula import WCNF
 from garageofcode.common.interval_utils import interval_overlap
 from garageofcode.common.interval_utils import interval_overlap2, interval_contains2
 from garageofcode.sat.solver import SugarRush
+from garageofcode.sat.cnf_cache import cached
 
-def interval_selection2(mat, feasible):
+def encode_interval_selection2(solver, mat, feasible):
     N, M = mat.shape
-    solver = SugarRush()
 
     coord2var = {}
     for ix, iy, jx, jy in product(range(N+1), range(M+1), repeat=2):
@@ -55,6 +56,21 @@ def interval_selection2(mat, feasible):
 
     itot_clauses, itot_vars = solver.itotalizer(opt_vars)
     solver.add(itot_clauses)
+    return coord2var, itot_vars
+
+def interval_selection2(mat, feasible, cache_key=None):
+    """
+    cache_key: a name for feasible, under which the encoding
+    of mat is cached (see cnf_cache)
+    """
+    solver = SugarRush()
+    encode = lambda solver: encode_interval_selection2(solver, mat, feasible)
+    if cache_key is None:
+        coord2var, itot_vars = encode(solver)
+    else:
+        mat_hash = hashlib.sha1(np.ascontiguousarray(mat).tobytes()).hexdigest()
+        params = {"shape": mat.shape, "mat": mat_hash, "feasible": cache_key}
+        coord2var, itot_vars = cached(solver, "interval_selection2", params, encode)
     best = solver.optimize(itot_vars, debug=False)
     if best is None:
         return []
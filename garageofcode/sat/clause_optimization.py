@@ -1,10 +1,10 @@
 #from collections import defaultdict
-#from itertools import chain, combinations
+from itertools import combinations
+import numpy as np
 
 from sugarrush.solver import SugarRush
 
-from garageofcode.tools.main import powerset
-from garageofcode.common.utils import flatten_simple
+from garageofcode.sat.preprocess import Preprocessor, preprocess
 
 def equivalent(solver, a, b):
     """Given two cnfs a and b (in the same variables),
@@ -81,13 +81,47 @@ def evaluate(cnf, var2val, solve):
         return keep_cnf
 
 
-def get_var2val(lits):
-    for subset in powerset(lits):
-        pwr_lits = [lit if lit in subset else -lit for lit in lits]
-        var2val = defaultdict(int)
-        for lit, var in zip(lits, pwr_lits):
-            var2val[lit] = var
-        yield var2val
+def truth_tables(n):
+    """Truth tables of n variables over all 2^n assignments,
+    as bitmasks packed into bytes, one row per variable.
+    In assignment a, variable i has the value of bit i of a
+    """
+    a = np.arange(2**n)
+    bits = (a >> np.arange(n)[:, None]) & 1
+    return np.packbits(bits, axis=1, bitorder='little')
+
+def unpack(tables, n):
+    return np.unpackbits(tables, axis=-1, count=2**n, bitorder='little').astype(bool)
+
+def cnf_table(cnf, lits):
+    """Truth table over lits of cnf, which may contain other variables.
+    Those are solved for with one incremental solver, under
+    the assumptions of every assignment that is not already false
+    """
+    n = len(lits)
+    tables = truth_tables(n)
+    lit_tables = np.concatenate([tables, ~tables])
+    lit2idx = {lit: i for i, lit in enumerate(lits)}
+    lit2idx.update({-lit: i + n for i, lit in enumerate(lits)})
+
+    table = np.full(tables.shape[1], 255, dtype=np.uint8)
+    residual = []
+    for clause in cnf:
+        if all(lit in lit2idx for lit in clause):
+            table &= np.bitwise_or.reduce(lit_tables[[lit2idx[lit] for lit in clause]], axis=0)
+        else:
+            residual.append(clause)
+    table = unpack(table, n)
+
+    if residual:
+        solver = SugarRush()
+        solver.add(residual)
+        bits = unpack(tables, n)
+        for a in np.flatnonzero(table):
+            assumptions = [lit if bit else -lit for lit, bit in zip(lits, bits[:, a])]
+            table[a] = solver.solve(assumptions=assumptions)
+        solver.delete()
+    return table
 
 
 def optimize(solver, cnf, x, num_auxilliary=0):
@@ -101,37 +135,34 @@ def optimize(solver, cnf, x, num_auxilliary=0):
     lits.extend(aux)
     #lits = list(set([abs(lit) for clause in cnf for lit in clause]))
     ext_lits = lits + [-lit for lit in lits]
-    candidates = chain(combinations(ext_lits, 1), 
-                       combinations(ext_lits, 2),
-                       combinations(ext_lits, 3))
-    candidates = list(candidates)
+    n = len(lits)
+
+    # truth tables of all candidate clauses, by number of literals,
+    #  with literal k in the same order as ext_lits
+    tables = truth_tables(n)
+    lit_tables = np.concatenate([tables, ~tables])
+    candidates = []
+    cand_tables = []
+    for size in [1, 2, 3]:
+        idx = np.array(list(combinations(range(2*n), size)), dtype=np.int64).reshape(-1, size)
+        candidates.extend([[ext_lits[k] for k in row] for row in idx.tolist()])
+        cand_tables.append(np.bitwise_or.reduce(lit_tables[idx], axis=1))
+    cand_false = ~unpack(np.concatenate(cand_tables), n)
 
     # join candidate clauses with an enabler each
     enablers = [solver.var() for _ in candidates]
-    candidates = [[-enbl] + list(candidate) 
-                    for enbl, candidate in zip(enablers, candidates)]
-    enbl2cand = {enbl: str(candidate[1:]) 
+    enbl2cand = {enbl: str(candidate) 
                     for enbl, candidate in zip(enablers, candidates)}
 
-    # create constraints for enablers, 
-    #  some can be discarded right away
-    constraints = []
-    for var2val in get_var2val(lits):
-        resin = evaluate(candidates, var2val, solve=False)
-        val = evaluate(cnf, var2val, solve=True)
-        if val == 0:
-            clause = [-lit for c in resin for lit in c]
-            constraints.append(clause)
-        elif val == 1:
-            constraints.extend(resin)
-            # this case means free computation for 
-            #  the solver, since we're including single-lit clauses
-            # obvious optimization: remove the corresponding 
-            #  enablers from candidates
-        else:
-            print("something wrong!")
-            print(x)
-            return
+    # create constraints for enablers:
+    #  a candidate that is false where the cnf is true is disabled,
+    #  and where the cnf is false, some remaining candidate is false
+    true = cnf_table(cnf, lits)
+    disabled = (cand_false & true).any(axis=1)
+    enbl_arr = np.array(enablers)
+    constraints = [[-enbl] for enbl in enbl_arr[disabled].tolist()]
+    for a in np.flatnonzero(~true):
+        constraints.append(enbl_arr[cand_false[:, a] & ~disabled].tolist())
 
     # optimize on number of enablers
     #print(constraints)
@@ -159,60 +190,23 @@ def optimize(solver, cnf, x, num_auxilliary=0):
 
 
 def unit_propagation(cnf):
-    while True:
-        unit_clause_lits = []
-        for clause in cnf:
-            if len(clause) == 1:
-                unit_clause_lits.append(clause[0])
-
-        keep_cnf = []
-        for clause in cnf:
-            for u in unit_clause_lits:
-                if u in clause:
-                    break
-                elif -u in clause:
-                    clause.remove(-u)
-            else:
-                keep_cnf.append(clause)
-
-        cnf = keep_cnf
-
-        if not len(unit_clause_lits) or not len(cnf):
-            break
-    return cnf
+    """Fixes the literals of the unit clauses and what they imply,
+    and returns the remaining clauses. cnf is not modified
+    """
+    p = Preprocessor(cnf)
+    p.propagate()
+    p.simplify()
+    return p.clauses()
 
 def purelit_propagation(cnf, core):
-    while True:
-        pure_lits = []
-        lits = set(flatten_simple(cnf))
-        for lit in lits:
-            if -lit not in lits and abs(lit) not in core:
-                pure_lits.append(lit)
-
-        keep_cnf = []
-        for clause in cnf:
-            for lit in pure_lits:
-                if lit in clause:
-                    break
-            else:
-                keep_cnf.append(clause)
-
-        cnf = keep_cnf
-
-        if not len(pure_lits) or not len(cnf):
-            break
-    return cnf
+    """Removes the clauses of pure literals outside core
+    """
+    p = Preprocessor(cnf, core)
+    p.eliminate_pure()
+    return p.clauses()
 
 def unary_propagation(cnf, core):
-    #print("original:", cnf)
-    while True:
-        orig_len = len(cnf)
-        cnf = unit_propagation(cnf)
-        #print("after unit:", cnf)
-        cnf = purelit_propagation(cnf, core)
-        #print("after pure:", cnf)
-        if orig_len == len(cnf):
-            break
+    cnf, _ = preprocess(cnf, core, subsume=False, eliminate=False)
     return cnf
 
 def to_binary(N, n, a):
@@ -317,7 +311,9 @@ def main():
     '''
     for r in range(60, 70):
         tl, cnfl = solver.less(z, r)
-        print(r, len(unary_propagation(cnfl + [[tl], [-z[0]]], core=X)))
+        cnfl = cnfl + [[tl], [-z[0]]]
+        cnf_simple, _ = preprocess(cnf + cnfl, core=X)
+        print(r, len(unary_propagation(cnfl, core=X)), len(cnf_simple))
 
         # for r > N it should be empty!
 
@@ -0,0 +1,194 @@
+"""
+On-disk cache of CNF encodings, keyed by generator name and parameters.
+
+A CNF is stored as a flat int32 array of all literals and an int64 array
+of clause offsets, clause i being lits[offsets[i]:offsets[i+1]].
+Both are .npy files that are memory-mapped on load,
+and go into the solver with append_formula a batch of clauses at a time.
+
+X = cached(solver, "langford", {"n": n}, lambda solver: langford(solver, n))
+"""
+import os
+import pickle
+import hashlib
+import inspect
+
+import numpy as np
+
+from garageofcode.common.utils import get_fn
+
+BATCH_SIZE = 1 << 16 # clauses per append_formula
+
+def to_arrays(clauses):
+    """
+    Flat literals and offsets of clauses
+    """
+    sizes = np.array([len(clause) for clause in clauses], dtype=np.int64)
+    offsets = np.zeros(len(clauses) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    lits = np.fromiter((lit for clause in clauses for lit in clause),
+                       dtype=np.int32, count=offsets[-1])
+    return lits, offsets
+
+def write_cnf(path, clauses):
+    """
+    Writes path + "_lits.npy" and path + "_offsets.npy"
+    """
+    lits, offsets = to_arrays(clauses)
+    np.save(path + "_lits.npy", lits)
+    np.save(path + "_offsets.npy", offsets)
+
+def read_cnf(path, mmap=True):
+    mmap_mode = "r" if mmap else None
+    lits = np.load(path + "_lits.npy", mmap_mode=mmap_mode)
+    offsets = np.load(path + "_offsets.npy", mmap_mode=mmap_mode)
+    return lits, offsets
+
+def iter_batches(lits, offsets, batch_size=BATCH_SIZE):
+    """
+    Yields lists of up to batch_size clauses
+    """
+    num_clauses = len(offsets) - 1
+    for c0 in range(0, num_clauses, batch_size):
+        c1 = min(c0 + batch_size, num_clauses)
+        batch = np.asarray(lits[offsets[c0]:offsets[c1]]).tolist()
+        bounds = (offsets[c0+1:c1] - offsets[c0]).tolist()
+        yield [batch[i:j] for i, j in zip([0] + bounds, bounds + [len(batch)])]
+
+def add_cnf(solver, lits, offsets, batch_size=BATCH_SIZE):
+    for clauses in iter_batches(lits, offsets, batch_size):
+        solver.add(clauses)
+
+"""
+DIMACS
+"""
+def write_dimacs(fn, lits, offsets, num_vars=None):
+    if num_vars is None:
+        num_vars = int(np.abs(lits).max()) if len(lits) else 0
+    with open(fn, "w") as f:
+        f.write("p cnf {} {}\n".format(num_vars, len(offsets) - 1))
+        for clauses in iter_batches(lits, offsets):
+            f.writelines(" ".join(map(str, clause + [0])) + "\n" for clause in clauses)
+
+def read_dimacs(fn):
+    """
+    Returns lits, offsets and the number of variables in the header
+    """
+    num_vars = 0
+    chunks = []
+    with open(fn, "r") as f:
+        for line in f:
+            if line.startswith("c") or line.startswith("%"):
+                continue
+            if line.startswith("p"):
+                num_vars = int(line.split()[2])
+                continue
+            chunks.append(line)
+    tokens = np.array(" ".join(chunks).split(), dtype=np.int32)
+    # clauses may span lines, they are ended by 0
+    ends = np.flatnonzero(tokens == 0)
+    offsets = np.concatenate([[0], ends + 1 - np.arange(1, len(ends) + 1)]).astype(np.int64)
+    lits = tokens[tokens != 0]
+    return lits, offsets, num_vars
+
+"""
+Cache
+"""
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+def source_hash(generate, solver):
+    """
+    Hash of the source files of generate, of the functions and classes
+    in this repository that it refers to (recursively, through globals
+    and closures), and of the solver class.
+    Editing an encoder changes the hash, so stale entries are not used
+    """
+    fns = set()
+    seen = set()
+    # generate itself is followed even if it is defined elsewhere, e.g. in a script
+    stack = [(generate, True), (type(solver), False)]
+    while stack:
+        obj, is_generate = stack.pop()
+        if not (inspect.isfunction(obj) or inspect.isclass(obj)) or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        try:
+            fn = os.path.abspath(inspect.getsourcefile(obj))
+        except TypeError:
+            continue # builtin
+        if fn.startswith(ROOT_DIR):
+            fns.add(fn)
+        elif not is_generate:
+            continue
+        if inspect.isfunction(obj):
+            names = _code_names(obj.__code__)
+            refs = [obj.__globals__.get(name) for name in names]
+            for cell in obj.__closure__ or []:
+                try:
+                    refs.append(cell.cell_contents)
+                except ValueError:
+                    pass # empty cell
+            for ref in refs:
+                if inspect.ismodule(ref):
+                    # module.function
+                    stack.extend((getattr(ref, name, None), False) for name in names)
+                else:
+                    stack.append((ref, False))
+    h = hashlib.sha1()
+    for fn in sorted(fns):
+        with open(fn, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+def get_key(name, params, top_id, source=""):
+    key = repr((name, sorted(params.items()), top_id, source)).encode()
+    return "{}_{}".format(name, hashlib.sha1(key).hexdigest()[:16])
+
+def cached(solver, name, params, generate, cache_dir=None):
+    """
+    Result of generate(solver), which adds its clauses with solver.add
+    and creates its variables with solver.var.
+    The first time, the clauses and the result are saved.
+    After that, generate is not run: the saved clauses are added
+    and the same variables are reserved.
+    The key includes solver.top_id(), so the variables come out the same,
+    and the source_hash of generate, so an edited encoder is run again.
+    XOR constraints (add_xor) are not cached, so if generate
+    adds any, ValueError is raised and nothing is saved
+    """
+    if cache_dir is None:
+        cache_dir = get_fn("sat/cnf_cache")
+    path = os.path.join(cache_dir, get_key(name, params, solver.top_id(),
+                                           source_hash(generate, solver)))
+
+    if os.path.exists(path + ".pkl"):
+        with open(path + ".pkl", "rb") as f:
+            top_id, result = pickle.load(f)
+        add_cnf(solver, *read_cnf(path))
+        solver.add_lits([top_id])
+        return result
+
+    kept = solver.clauses
+    solver.clauses = []
+    num_xors = len(solver.xors)
+    try:
+        result = generate(solver)
+    finally:
+        clauses, solver.clauses = solver.clauses, kept
+    if kept is not None:
+        kept.extend(clauses)
+    if len(solver.xors) != num_xors:
+        raise ValueError("{} adds XOR constraints, which are not cached".format(name))
+
+    write_cnf(path, clauses)
+    # the result marks the entry as complete, so it goes last
+    with open(path + ".pkl", "wb") as f:
+        pickle.dump((solver.top_id(), result), f)
+    return result
@@ -1,16 +1,16 @@
+import random
 from collections import defaultdict
 
-from sugarrush.solver import SugarRush
-
 from garageofcode.common.utils import flatten_simple
+from garageofcode.sat.solver import SugarRush
 
 N = 3
 
-def get_state(solver):
+def get_state(solver, n=N):
     # one-hot encoding
-    X = [[[solver.var() for _ in range(N**2)] 
-                        for _ in range(N)] 
-                        for _ in range(N)]
+    X = [[[solver.var() for _ in range(n**2)] 
+                        for _ in range(n)] 
+                        for _ in range(n)]
     for x in flatten_simple(X):
         solver.add(solver.equals(x, 1)) # exactly one number per tile
 
@@ -20,42 +20,47 @@ def get_state(solver):
     return X
 
 def get_transition(solver, X0, X1):
+    """
+    One move of the empty square (number 0) from X0 to X1.
+    Frame: a tile keeps its number unless a swap next to it is used,
+    so only the two swapped tiles get equality clauses
+    """
+    n = len(X0)
     ij2swaps = defaultdict(list)
     swap2ijs = {}
-    for i in range(N):
-        for j in range(N):
-            if j < N - 1:
+    for i in range(n):
+        for j in range(n):
+            if j < n - 1:
                 swap = solver.var()
                 swap2ijs[swap] = [(i, j), (i, j+1)]
                 ij2swaps[(i, j)].append(swap)
                 ij2swaps[(i, j+1)].append(swap)
-            if i < N - 1:
+            if i < n - 1:
                 swap = solver.var()
                 swap2ijs[swap] = [(i, j), (i+1, j)]
                 ij2swaps[(i, j)].append(swap)
                 ij2swaps[(i+1, j)].append(swap)
 
     cnf = []
-    for i in range(N):
-        for j in range(N):
+    for i in range(n):
+        for j in range(n):
             hot = X0[i][j][0]
             # if the empty square is on (i, j) (is 'hot'), 
             # then one of the adjacent swaps must be used
             cnf.append([-hot] + ij2swaps[(i, j)])
 
-            # the non-adjacent swaps must be 0
-            for swap in swap2ijs:
-                if swap not in ij2swaps[(i, j)]:
-                    cnf.append([-hot, -swap])
-
+            # unless an adjacent swap is used, X1 = X0 in this tile
+            for x0, x1 in zip(X0[i][j], X1[i][j]):
+                cnf.extend([[x0, -x1] + ij2swaps[(i, j)], 
+                            [-x0, x1] + ij2swaps[(i, j)]])
 
     for swap, ijs in swap2ijs.items():
         # if a swap is used, one of the adjacent
         # squares must be hot
-        #cnf.append([-swap] + swap2ijs[swap])
+        (il, jl), (ir, jr) = ijs # left/right
+        cnf.append([-swap, X0[il][jl][0], X0[ir][jr][0]])
 
         # if swap is true, then the adjacent tiles should swap values
-        (il, jl), (ir, jr) = ijs # left/right
         for x0l, x1r in zip(X0[il][jl], X1[ir][jr]):
             # swap => x0l == x1r
             cnf.extend([[-swap, x0l, -x1r], [-swap, -x0l, x1r]])
@@ -63,24 +68,16 @@ def get_transition(solver, X0, X1):
             # swap => x0r == x1l
             cnf.extend([[-swap, x0r, -x1l], [-swap, -x0r, x1l]])
 
-        for ij in ij2swaps:
-            # if tile is not adjacent to swap,
-            # then X1 = X0 in that tile
-            if ij not in ijs:
-                i, j = ij
-                for x0, x1 in zip(X0[i][j], X1[i][j]):
-                    # swap => x0 == x1
-                    cnf.extend([[-swap, x0, -x1], [-swap, -x0, x1]])
-
     swaps = list(swap2ijs.keys())
     cnf.extend(solver.equals(swaps, 1)) # only one swap per turn
     return cnf
 
 def set_state(X0, ij2k=None):
+    n = len(X0)
     cnf = []
-    for i in range(N):
-        for j in range(N):
-            for k in range(N**2):
+    for i in range(n):
+        for j in range(n):
+            for k in range(n**2):
                 if k == ij2k[(i, j)]:
                     cnf.append([X0[i][j][k]])
                 else:
@@ -94,35 +91,59 @@ def print_solve(solver, Xr):
     for row in Xr_solve:
         print([x.index(1) for x in row])
 
-def main():
-    for r in range(4, 24, 2):
-        solver = SugarRush()
-
-        #r = 5 # note: r is number of steps i.e. num states minus one
-        X = [get_state(solver) for _ in range(r+1)]
-
-        ij2k = {(i, j): i * N + j for j in range(N) for i in range(N)}
-        cnf = set_state(X[0], ij2k)
-        solver.add(cnf)
-
-        for X0, X1 in zip(X, X[1:]):
-            cnf = get_transition(solver, X0, X1)
-            solver.add(cnf)
-
-        ij2k[(0, 1)] = 2
-        ij2k[(0, 2)] = 1
-        cnf = set_state(X[-1], ij2k)
-        solver.add(cnf)
-
-        satisfiable = solver.solve()
-        if satisfiable:
-            print(r)
-            for x in X:
-                print_solve(solver, x)
-                print()
-            return
-        else:
+def bmc(start, goal, max_steps=80, n=N, verbose=False):
+    """
+    Bounded model checking: the shortest sequence of moves from start to goal,
+    each a dict (i, j) -> number with 0 for the empty square.
+    One transition is added at a time to the same solver,
+    and the goal at horizon r is checked under an assumption
+    that is retired when it fails.
+    Returns the states as solver variables, or None after max_steps moves.
+    If verbose, prints every horizon that fails
+    """
+    solver = SugarRush()
+    X = [get_state(solver, n)]
+    solver.add(set_state(X[0], start))
+    for r in range(max_steps + 1):
+        if r:
+            X.append(get_state(solver, n))
+            solver.add(get_transition(solver, X[-2], X[-1]))
+        at_goal = solver.var()
+        solver.add([[-at_goal, X[-1][i][j][k]] for (i, j), k in goal.items()])
+        if solver.solve(assumptions=[at_goal]):
+            return solver, X
+        if verbose:
             print(r, "not satisfiable")
+        solver.add([[-at_goal]])
+    return solver, None
+
+def scramble(num_moves, n=N):
+    """
+    The solved board after num_moves random moves of the empty square
+    """
+    ij2k = {(i, j): i * n + j for j in range(n) for i in range(n)}
+    empty = (0, 0)
+    for _ in range(num_moves):
+        i, j = empty
+        neighbours = [(i + di, j + dj) for di, dj in [(1, 0), (-1, 0), (0, 1), (0, -1)]
+                      if 0 <= i + di < n and 0 <= j + dj < n]
+        neighbour = random.choice(neighbours)
+        ij2k[empty], ij2k[neighbour] = ij2k[neighbour], ij2k[empty]
+        empty = neighbour
+    return ij2k
+
+def main():
+    n = 4
+    solved = {(i, j): i * n + j for j in range(n) for i in range(n)}
+    start = scramble(30, n)
+
+    solver, X = bmc(start, solved, n=n, verbose=True)
+    if X is None:
+        return
+    print(len(X) - 1, "moves")
+    for x in X:
+        print_solve(solver, x)
+        print()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
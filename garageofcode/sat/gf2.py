@@ -0,0 +1,67 @@
+"""
+Linear systems over GF(2), with every row packed into 64 bit words.
+Column j is bit j % 64 of word j // 64
+"""
+import numpy as np
+
+def pack(rows, num_cols):
+    """
+    rows: lists of columns, a repeated column cancels
+    """
+    A = np.zeros([len(rows), max(1, -(-num_cols // 64))], dtype=np.uint64)
+    ri = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+    ci = np.array([j for row in rows for j in row], dtype=np.int64)
+    bits = np.left_shift(np.uint64(1), (ci % 64).astype(np.uint64))
+    np.bitwise_xor.at(A, (ri, ci // 64), bits)
+    return A
+
+def get_column(A, j):
+    return ((A[:, j // 64] >> np.uint64(j % 64)) & np.uint64(1)) != 0
+
+def eliminate(A, b, num_cols):
+    """
+    Reduced row echelon form of A x = b.
+    Returns A and b without the zero rows, the pivot column of every row,
+    and whether the system is consistent
+    """
+    A = A.copy()
+    b = np.array(b, dtype=bool)
+    pivots = []
+    r = 0
+    for j in range(num_cols):
+        if r == len(A):
+            break
+        col = get_column(A, j)
+        candidates = np.flatnonzero(col[r:])
+        if not len(candidates):
+            continue
+        p = r + candidates[0]
+        A[[r, p]] = A[[p, r]]
+        b[[r, p]] = b[[p, r]]
+        col[[r, p]] = col[[p, r]]
+        col[r] = False
+        A[col] ^= A[r]
+        b[col] ^= b[r]
+        pivots.append(j)
+        r += 1
+    consistent = not b[r:].any()
+    return A[:r], b[:r], pivots, consistent
+
+def solve(A, b, num_cols):
+    """
+    One solution of A x = b with the free variables at 0,
+    or None if there is none
+    """
+    A, b, pivots, consistent = eliminate(A, b, num_cols)
+    if not consistent:
+        return None
+    x = np.zeros(num_cols, dtype=bool)
+    x[pivots] = b
+    return x
+
+def unpack_row(row, num_cols):
+    """
+    The columns set in a packed row
+    """
+    bits = np.unpackbits(row.astype('<u8').view(np.uint8), bitorder='little')
+    return np.flatnonzero(bits[:num_cols])
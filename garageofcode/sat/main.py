@@ -1,40 +1,29 @@
+from collections import Counter
+from math import comb
+
 from pysat.card import EncType
 
-from garageofcode.common.utils import power_set
 from garageofcode.sat.solver import SugarRush
+from garageofcode.sat.cnf_cache import cached
 from garageofcode.sat.langford import langford, print_langford_solution
 from garageofcode.sat.parity_board import parity_board
 
-def power_set_literals(lits):
-    for subset in power_set(lits):
-        yield [lit if lit in subset else -lit for lit in lits]
-        #yield [1 if lit in subset else 0 for lit in lits]
-
 def enumeration_test(solver, variables):
-    satisfying_assignments = []
-    unsatisfying_assignments = []
-    for lits in power_set_literals(variables):
-        res = solver.solve(assumptions=lits)
-        bin_lits = [1 if lit > 0 else 0 for lit in lits]
-        if res:
-            satisfying_assignments.append(tuple(bin_lits))
-        else:
-            unsatisfying_assignments.append(tuple(bin_lits))
+    n = len(variables)
+    sum2count = Counter(sum(lit > 0 for lit in lits)
+                        for lits in solver.enumerate_models(variables))
 
     print("Satisfying assignments:")
-    #[print(lits) for lits in sorted(satisfying_assignments)]
-    print(set([sum(lits) for lits in satisfying_assignments]))
+    print(set(sum2count))
     print()
-    #print("False positives:")
-    #[print(lits) for lits in sorted(satisfying_assignments) if sum(lits[:3]) < 2]
-    
+
+    # assignments with k true variables, of which some are not satisfying
     print("Unsatisfying assignments:")
-    print(set([sum(lits) for lits in unsatisfying_assignments]))
-    #[print(lits) for lits in sorted(unsatisfying_assignments)]
+    print(set([k for k in range(n+1) if sum2count[k] < comb(n, k)]))
 
 def langford_test(n):
     with SugarRush("cadical") as solver:
-        X = langford(solver, n)
+        X = cached(solver, "langford", {"n": n}, lambda solver: langford(solver, n))
 
         print("n:", n)
         solver.print_stats()
@@ -49,6 +38,21 @@ def langford_test(n):
 
         print_langford_solution(solver, X)
 
+def langford_portfolio_test(n):
+    solver = SugarRush(keep_clauses=True)
+    X = langford(solver, n)
+
+    print("n:", n)
+    solver.print_stats()
+
+    satisfiable = solver.solve_portfolio(family="langford")
+    print("Satisfiable:", satisfiable)
+    print("Winner:", solver.winner)
+    if not satisfiable:
+        return
+
+    print_langford_solution(solver, X)
+
 def negate_test():
     n = 3
     solver = SugarRush()
@@ -88,6 +92,8 @@ def disjunction_test():
 def main():
     langford_test(7)
 
+    #langford_portfolio_test(12)
+
     #negate_test()
 
     #disjunction_test()
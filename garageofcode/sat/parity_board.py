@@ -1,11 +1,6 @@
 import numpy as np
 from garageofcode.sat.solver import SugarRush
 
-def allowed_cards(solver, variables, cardinalities):
-    cardinalities = [card for card in cardinalities if card <= len(variables)]
-    bounds = [solver.equals(variables, bound=card) for card in cardinalities]
-    return solver.disjunction(bounds)
-
 def get_covering_vars(coord, coord2tiles):
     incident_tiles = []
     x, y = coord
@@ -15,7 +10,7 @@ def get_covering_vars(coord, coord2tiles):
             incident_tiles.append(coord2tiles[neigh])
     return incident_tiles
 
-def parity_board_solve(board, num_moves):
+def parity_board_solve(board, num_moves=None):
     solver = SugarRush()
 
     coord2tiles = dict((coord, solver.var()) 
@@ -23,19 +18,13 @@ def parity_board_solve(board, num_moves):
     coord2covering_vars = dict((coord, get_covering_vars(coord, coord2tiles))
                           for coord in board)
 
-    evens = list(range(0, num_moves+1, 2))
-    odds  = list(range(1, num_moves+1, 2))
     for coord, val in board.items():
-        covering_vars = coord2covering_vars[coord]
-        if val:
-            parity_bound = allowed_cards(solver, covering_vars, odds)
-        else:
-            parity_bound = allowed_cards(solver, covering_vars, evens)
-        solver.add(parity_bound)
+        solver.add_xor(coord2covering_vars[coord], parity=int(val))
 
-    tile_vars = list(coord2tiles.values())
-    total_moves_bound = solver.equals(tile_vars, bound=num_moves)
-    solver.add(total_moves_bound)
+    if num_moves is not None:
+        tile_vars = list(coord2tiles.values())
+        total_moves_bound = solver.equals(tile_vars, bound=num_moves)
+        solver.add(total_moves_bound)
 
     satisfiable = solver.solve()
     print("Satisfiable:", satisfiable)
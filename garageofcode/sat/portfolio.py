@@ -0,0 +1,89 @@
+"""
+Portfolio solving: the same CNF is loaded into several pysat backends,
+each with its own seed, in separate processes.
+The first definitive answer wins and the other workers are killed.
+Pysat backends take no seed, so a seed shuffles the clause order instead,
+which is enough to change the search.
+Winners are appended to a csv file, from which best_config picks
+the configuration that won most often for a problem family.
+"""
+import os
+import csv
+import time
+import random
+from collections import Counter
+import multiprocessing
+from multiprocessing import Pool
+
+from pysat.solvers import Solver
+
+from garageofcode.common.utils import get_fn
+
+DEFAULT_CONFIGS = [("glucose4", 0), ("cadical", 0), ("minisat22", 0), ("glucose4", 1)]
+
+_shared = {}
+
+def _init_worker(clauses, assumptions):
+    _shared["clauses"] = clauses
+    _shared["assumptions"] = assumptions
+
+def _run_config(config):
+    name, seed = config
+    clauses = _shared["clauses"]
+    if seed:
+        clauses = list(clauses)
+        random.Random(seed).shuffle(clauses)
+    t0 = time.time()
+    with Solver(name=name, bootstrap_with=clauses) as solver:
+        satisfiable = solver.solve(assumptions=_shared["assumptions"])
+        model = solver.get_model() if satisfiable else None
+    return config, satisfiable, model, time.time() - t0
+
+def solve_portfolio(clauses, configs=DEFAULT_CONFIGS, assumptions=[],
+                    timeout=None, family=None, log_fn=None):
+    """
+    Returns (satisfiable, model, (name, seed) of the winner),
+    or (None, None, None) if no worker answered within timeout seconds.
+    If family is given, the winner is logged for best_config
+    """
+    configs = list(configs)
+    t0 = time.time()
+    with Pool(len(configs), initializer=_init_worker, initargs=(clauses, assumptions)) as pool:
+        results = pool.imap_unordered(_run_config, configs)
+        try:
+            config, satisfiable, model, _ = results.next(timeout=timeout)
+        except multiprocessing.TimeoutError:
+            return None, None, None
+        # leaving the pool terminates the workers still solving
+    if family is not None:
+        log_winner(family, config, satisfiable, time.time() - t0, log_fn)
+    return satisfiable, model, config
+
+def _get_log_fn(log_fn):
+    if log_fn is None:
+        log_fn = get_fn("sat", "portfolio.csv")
+    return log_fn
+
+def log_winner(family, config, satisfiable, solve_time, log_fn=None):
+    log_fn = _get_log_fn(log_fn)
+    new = not os.path.exists(log_fn)
+    with open(log_fn, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(["family", "name", "seed", "satisfiable", "time"])
+        name, seed = config
+        writer.writerow([family, name, seed, int(satisfiable), "{0:.3f}".format(solve_time)])
+
+def best_config(family, default=DEFAULT_CONFIGS[0], log_fn=None):
+    """
+    The configuration that has won most often for family
+    """
+    log_fn = _get_log_fn(log_fn)
+    if not os.path.exists(log_fn):
+        return default
+    with open(log_fn, "r", newline="") as f:
+        wins = Counter((row["name"], int(row["seed"]))
+                       for row in csv.DictReader(f) if row["family"] == family)
+    if not wins:
+        return default
+    return wins.most_common(1)[0][0]
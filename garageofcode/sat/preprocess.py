@@ -0,0 +1,351 @@
+"""
+CNF preprocessing before the formula reaches the solver:
+unit propagation with two watched literals, pure literal elimination,
+subsumption and bounded variable elimination.
+
+Clauses are kept in flat integer arrays, clause c being
+lits[starts[c]:starts[c]+sizes[c]], and are never mutated in the input.
+Variables in core keep their meaning: they are never eliminated,
+and units on them stay in the simplified formula.
+Everything else that is removed can be recovered with the Reconstruction.
+
+p = Preprocessor(cnf, core=X)
+cnf_simple, reconstruction = p.run()
+solver.add(cnf_simple)
+solver.solve()
+var2val = reconstruction.extend(solver.get_model())
+"""
+from array import array
+from collections import defaultdict
+
+class Reconstruction:
+    """
+    Removed clauses, each with a witness literal.
+    Going through them backwards, the witness is made true
+    whenever the clause is not already satisfied,
+    which turns a model of the simplified formula into one of the original
+    """
+    def __init__(self):
+        self.witnesses = array('i')
+        self.lits = array('i')
+        self.starts = array('l', [0])
+
+    def __len__(self):
+        return len(self.witnesses)
+
+    def push(self, witness, clause):
+        self.witnesses.append(witness)
+        self.lits.extend(clause)
+        self.starts.append(len(self.lits))
+
+    def extend(self, model):
+        """
+        model: the true literals, e.g. solver.get_model()
+        Variables missing from model are false.
+        Returns var2val with 1 for true and 0 for false
+        """
+        var2val = {abs(lit): (lit > 0) * 1 for lit in model}
+        for k in range(len(self.witnesses) - 1, -1, -1):
+            clause = self.lits[self.starts[k]:self.starts[k+1]]
+            if not any(var2val.get(abs(lit), 0) == (lit > 0) for lit in clause):
+                witness = self.witnesses[k]
+                var2val[abs(witness)] = (witness > 0) * 1
+        return var2val
+
+class Preprocessor:
+    def __init__(self, cnf, core=()):
+        self.core = set(abs(lit) for lit in core)
+        self.lits = array('i')
+        self.starts = array('l')
+        self.sizes = array('l')
+        self.alive = bytearray()
+        self.occ = defaultdict(list) # lit -> clauses, dead ones are skipped
+        self.num_occ = defaultdict(int) # lit -> alive clauses
+        self.watches = defaultdict(list)
+        self.units = [] # unit clauses not yet assigned
+        self.trail = [] # assigned literals, propagated up to qhead
+        self.qhead = 0
+        self.unsat = False
+        self.num_changes = 0
+        self.reconstruction = Reconstruction()
+
+        cnf = [list(clause) for clause in cnf]
+        num_vars = max((abs(lit) for clause in cnf for lit in clause), default=0)
+        self.value = array('b', bytes(num_vars + 1)) # var -> 1, -1 or 0 if free
+        for clause in cnf:
+            self.add_clause(clause)
+
+    """
+    Clauses
+    """
+    def add_clause(self, clause):
+        """
+        Drops duplicate literals, and the clause if it is a tautology
+        """
+        seen = set()
+        for lit in clause:
+            if -lit in seen:
+                return None
+            seen.add(lit)
+        clause = list(dict.fromkeys(clause))
+        if not clause:
+            self.unsat = True
+            return None
+
+        c = len(self.sizes)
+        self.starts.append(len(self.lits))
+        self.sizes.append(len(clause))
+        self.lits.extend(clause)
+        self.alive.append(1)
+        for lit in clause:
+            self.occ[lit].append(c)
+            self.num_occ[lit] += 1
+        if len(clause) == 1:
+            self.units.append(clause[0])
+        else:
+            self.watches[clause[0]].append(c)
+            self.watches[clause[1]].append(c)
+        return c
+
+    def get_clause(self, c):
+        s = self.starts[c]
+        return self.lits[s:s+self.sizes[c]].tolist()
+
+    def remove_clause(self, c, witness=None):
+        """
+        The clause is kept for reconstruction if a witness is given
+        """
+        self.alive[c] = 0
+        clause = self.get_clause(c)
+        for lit in clause:
+            self.num_occ[lit] -= 1
+        if witness is not None:
+            self.reconstruction.push(witness, clause)
+        self.num_changes += 1
+        return clause
+
+    def alive_occ(self, lit):
+        occ = [c for c in self.occ[lit] if self.alive[c]]
+        self.occ[lit] = occ
+        return occ
+
+    def clauses(self):
+        """
+        The simplified formula, with the units of fixed core variables
+        """
+        if self.unsat:
+            return [[]]
+        cnf = [self.get_clause(c) for c in range(len(self.sizes)) if self.alive[c]]
+        cnf.extend([[lit] for lit in self.trail if abs(lit) in self.core])
+        return cnf
+
+    """
+    Unit propagation
+    """
+    def lit_value(self, lit):
+        val = self.value[abs(lit)]
+        return val if lit > 0 else -val
+
+    def assign(self, lit):
+        val = self.lit_value(lit)
+        if val == -1:
+            self.unsat = True
+        elif val == 0:
+            self.value[abs(lit)] = 1 if lit > 0 else -1
+            self.trail.append(lit)
+            self.reconstruction.push(lit, [lit])
+            self.num_changes += 1
+
+    def propagate(self):
+        """
+        Assigns the units and everything they imply.
+        Returns False on conflict
+        """
+        units, self.units = self.units, []
+        for lit in units:
+            self.assign(lit)
+        lits, starts, sizes, alive = self.lits, self.starts, self.sizes, self.alive
+        while self.qhead < len(self.trail) and not self.unsat:
+            false_lit = -self.trail[self.qhead]
+            self.qhead += 1
+            watchers = self.watches[false_lit]
+            self.watches[false_lit] = keep = []
+            for i, c in enumerate(watchers):
+                if not alive[c]:
+                    continue
+                s = starts[c]
+                # the false watch goes second
+                if lits[s] == false_lit:
+                    lits[s], lits[s+1] = lits[s+1], lits[s]
+                other = lits[s]
+                if self.lit_value(other) == 1:
+                    keep.append(c)
+                    continue
+                for k in range(s + 2, s + sizes[c]):
+                    if self.lit_value(lits[k]) != -1:
+                        lits[s+1], lits[k] = lits[k], lits[s+1]
+                        self.watches[lits[s+1]].append(c)
+                        break
+                else:
+                    keep.append(c)
+                    if self.lit_value(other) == -1:
+                        keep.extend(watchers[i+1:])
+                        self.unsat = True
+                        break
+                    self.assign(other)
+        return not self.unsat
+
+    def simplify(self):
+        """
+        Removes satisfied clauses and false literals,
+        after which no assigned variable occurs in the formula
+        """
+        lits, starts, sizes, alive = self.lits, self.starts, self.sizes, self.alive
+        self.occ = defaultdict(list)
+        self.num_occ = defaultdict(int)
+        self.watches = defaultdict(list)
+        for c in range(len(sizes)):
+            if not alive[c]:
+                continue
+            s = starts[c]
+            n = 0
+            for k in range(s, s + sizes[c]):
+                val = self.lit_value(lits[k])
+                if val == 1:
+                    alive[c] = 0
+                    break
+                elif val == 0:
+                    lits[s+n] = lits[k]
+                    n += 1
+            if not alive[c]:
+                continue
+            if n < sizes[c]:
+                sizes[c] = n
+                self.num_changes += 1
+            if n == 0:
+                self.unsat = True
+            elif n == 1:
+                self.units.append(lits[s])
+            else:
+                self.watches[lits[s]].append(c)
+                self.watches[lits[s+1]].append(c)
+            for k in range(s, s + n):
+                self.occ[lits[k]].append(c)
+                self.num_occ[lits[k]] += 1
+
+    """
+    Eliminations
+    """
+    def eliminate_pure(self):
+        """
+        Removes the clauses of literals whose negation does not occur,
+        and of the literals that become pure as a result
+        """
+        stack = list(self.occ)
+        while stack:
+            lit = stack.pop()
+            if abs(lit) in self.core or self.num_occ[-lit] or not self.num_occ[lit]:
+                continue
+            for c in self.alive_occ(lit):
+                stack.extend(-other for other in self.remove_clause(c, witness=lit))
+
+    def subsume(self):
+        """
+        Removes the clauses that contain another clause
+        """
+        order = sorted((c for c in range(len(self.sizes)) if self.alive[c]),
+                       key=lambda c: self.sizes[c])
+        for c in order:
+            if not self.alive[c]:
+                continue
+            clause = self.get_clause(c)
+            lit = min(clause, key=lambda lit: self.num_occ[lit])
+            clause = set(clause)
+            for d in self.alive_occ(lit):
+                if d == c or self.sizes[d] < len(clause):
+                    continue
+                if clause.issubset(self.get_clause(d)):
+                    self.remove_clause(d)
+
+    def eliminate_variables(self, max_occ=16):
+        """
+        Replaces the clauses of a variable by their resolvents,
+        if there are no more resolvents than clauses.
+        Variables with more than max_occ occurrences of a sign are left
+        """
+        variables = set(abs(lit) for lit in self.occ) - self.core
+        cost = lambda var: self.num_occ[var] * self.num_occ[-var]
+        for var in sorted(variables, key=cost):
+            if self.unsat:
+                return
+            pos = self.alive_occ(var)
+            neg = self.alive_occ(-var)
+            if not pos and not neg:
+                continue
+            if len(pos) > max_occ or len(neg) > max_occ:
+                continue
+            pos_clauses = [self.get_clause(c) for c in pos]
+            neg_clauses = [self.get_clause(c) for c in neg]
+            resolvents = []
+            for p in pos_clauses:
+                for n in neg_clauses:
+                    resolvent = resolve(p, n, var)
+                    if resolvent is None:
+                        continue
+                    resolvents.append(resolvent)
+                    if len(resolvents) > len(pos) + len(neg):
+                        break
+                else:
+                    continue
+                break
+            if len(resolvents) > len(pos) + len(neg):
+                continue
+            for c in pos:
+                self.remove_clause(c, witness=var)
+            for c in neg:
+                self.remove_clause(c, witness=-var)
+            for resolvent in resolvents:
+                self.add_clause(resolvent)
+
+    def run(self, pure=True, subsume=True, eliminate=True):
+        """
+        Applies the steps until nothing changes.
+        Returns the simplified formula and its Reconstruction
+        """
+        while not self.unsat:
+            num_changes = self.num_changes
+            if not self.propagate():
+                break
+            self.simplify()
+            if self.units:
+                continue
+            if pure:
+                self.eliminate_pure()
+            if subsume:
+                self.subsume()
+            if eliminate:
+                self.eliminate_variables()
+            if self.num_changes == num_changes and not self.units:
+                break
+        return self.clauses(), self.reconstruction
+
+def resolve(p, n, var):
+    """
+    Resolvent of p, containing var, and n, containing -var,
+    or None if it is a tautology
+    """
+    resolvent = [lit for lit in p if lit != var]
+    lits = set(resolvent)
+    for lit in n:
+        if lit == -var or lit in lits:
+            continue
+        if -lit in lits:
+            return None
+        resolvent.append(lit)
+    return resolvent
+
+def preprocess(cnf, core=(), **kwargs):
+    """
+    Returns the simplified cnf and the Reconstruction of the removed variables
+    """
+    return Preprocessor(cnf, core).run(**kwargs)
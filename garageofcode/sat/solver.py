@@ -1,19 +1,31 @@
+from itertools import product
+
 from pysat.solvers import Solver
 from pysat.card import CardEnc, EncType, ITotalizer
 from pysat.formula import CNF
 
 from garageofcode.common.utils import flatten_simple as flatten
 from garageofcode.common.utils import dbg
+from garageofcode.sat import gf2
+from garageofcode.sat.portfolio import solve_portfolio, DEFAULT_CONFIGS
 
 class SugarRush(Solver):
     """
     Quality-of-life wrapper for pysat.solvers.Solver
     """
-    def __init__(self, name="glucose4"):
+    def __init__(self, name="glucose4", keep_clauses=False):
         super().__init__(name=name)
+        # a copy of the clauses, for solve_portfolio
+        self.clauses = [] if keep_clauses else None
+        self.winner = None
         #self.top_id = 0
         self.var2val = {}
         self.lits = set([0])
+        self.xors = [] # (variables, parity) not yet given to the solver
+        self.xor_unsat = False
+        self.has_clauses = False # pysat does not count unit clauses in nof_clauses
+        self.internal = set() # auxilliary variables that models are not projected onto
+        self.xor_model = None
 
     """
     Basics
@@ -35,8 +47,19 @@ class SugarRush(Solver):
     #    return self.append_formula(cnf)        
 
     def add(self, cnf):
+        if self.clauses is not None:
+            cnf = [list(clause) for clause in cnf]
+            self.clauses.extend(cnf)
         self.append_formula(cnf)   
 
+    def add_clause(self, clause, no_return=True):
+        self.has_clauses = True
+        return super().add_clause(clause, no_return)
+
+    def append_formula(self, formula, no_return=True):
+        self.has_clauses = True
+        return super().append_formula(formula, no_return)
+
     def add_lits(self, lits):
         for lit in lits:
             self.lits.add(abs(lit))
@@ -44,6 +67,12 @@ class SugarRush(Solver):
     def add_lits_from(self, cnf):
         self.add_lits(flatten(cnf))
 
+    def user_vars(self):
+        """
+        All variables so far, except the internal ones
+        """
+        return sorted(self.lits - self.internal - set([0]))
+
     def top_id(self):
         return max(self.lits)
 
@@ -51,6 +80,142 @@ class SugarRush(Solver):
         for var, val in enumerate(self.get_model()):
             self.var2val[var+1] = (val > 0) * 1 # 1-indexed
 
+    def solve(self, assumptions=[]):
+        """
+        Pending XOR constraints are solved by Gaussian elimination first.
+        If there are no clauses and no assumptions, that is the answer,
+        otherwise the reduced system is added as short XOR chains
+        """
+        self.var2val = {}
+        self.xor_model = None
+        if self.xor_unsat:
+            return False
+        if not self.xors:
+            return super().solve(assumptions=assumptions)
+        variables, A, b, pivots, consistent = self._eliminate_xors()
+        if not consistent:
+            return False
+        if not self.has_clauses and not assumptions:
+            x = dict.fromkeys(range(1, self.top_id() + 1), 0)
+            for j, parity in zip(pivots, b.tolist()):
+                x[variables[j]] = parity * 1
+            self.var2val = x
+            self.xor_model = [var if val else -var for var, val in sorted(x.items())]
+            return True
+        self._add_reduced(variables, A, b)
+        return super().solve(assumptions=assumptions)
+
+    def get_model(self):
+        if self.xor_model is not None:
+            return self.xor_model
+        return super().get_model()
+
+    def _eliminate_xors(self):
+        """
+        Reduced row echelon form of the pending XOR constraints
+        """
+        variables = sorted(set(var for xor_vars, _ in self.xors for var in xor_vars))
+        var2col = {var: j for j, var in enumerate(variables)}
+        A = gf2.pack([[var2col[var] for var in xor_vars] for xor_vars, _ in self.xors],
+                     len(variables))
+        b = [parity for _, parity in self.xors]
+        A, b, pivots, consistent = gf2.eliminate(A, b, len(variables))
+        if not consistent:
+            self.xors = []
+            self.xor_unsat = True
+        return variables, A, b, pivots, consistent
+
+    def _add_xors(self):
+        """
+        Adds the pending XOR constraints as clauses,
+        False if they are inconsistent by themselves
+        """
+        if self.xor_unsat:
+            return False
+        if not self.xors:
+            return True
+        variables, A, b, _, consistent = self._eliminate_xors()
+        if consistent:
+            self._add_reduced(variables, A, b)
+        return consistent
+
+    def _add_reduced(self, variables, A, b):
+        self.xors = []
+        for row, parity in zip(A, b.tolist()):
+            xor_vars = [variables[j] for j in gf2.unpack_row(row, len(variables))]
+            self.add(self.parity(xor_vars, parity))
+
+    def solve_portfolio(self, configs=DEFAULT_CONFIGS, assumptions=[], 
+                        timeout=None, family=None):
+        """
+        Solves the clauses in several backends in parallel, see portfolio.
+        Needs keep_clauses. The winning (name, seed) is in self.winner
+        """
+        if self.clauses is None:
+            raise ValueError("solve_portfolio needs SugarRush(keep_clauses=True)")
+        self.var2val = {}
+        if not self._add_xors():
+            self.winner = None
+            return False
+        satisfiable, model, self.winner = solve_portfolio(self.clauses, configs, assumptions,
+                                                          timeout, family)
+        if satisfiable:
+            self.var2val = {abs(lit): (lit > 0) * 1 for lit in model}
+        return satisfiable
+
+    def enumerate_models(self, variables=None, assumptions=[], limit=None):
+        """
+        Yields every model projected onto variables (default: user_vars)
+        once, as a list of literals, found one solve at a time.
+        Each model is blocked with a clause that is only active
+        during the enumeration, so the solver is unchanged afterwards.
+        Variables the solver has not seen are free, and give two models each
+        """
+        if variables is None:
+            variables = self.user_vars()
+        active = self.var()
+        self.internal.add(active)
+        num_models = 0
+        try:
+            while limit is None or num_models < limit:
+                if not self.solve(assumptions=list(assumptions) + [active]):
+                    break
+                model = self.get_model()
+                known = [model[var-1] for var in variables if var <= len(model)]
+                free = [var for var in variables if var > len(model)]
+                self.add([[-active] + [-lit for lit in known]])
+                for free_lits in product(*[(-var, var) for var in free]):
+                    yield known + list(free_lits)
+                    num_models += 1
+                    if limit is not None and num_models >= limit:
+                        break
+                if not known:
+                    break
+        finally:
+            self.add([[-active]])
+
+    def count_models(self, variables=None, assumptions=[], limit=None):
+        """
+        Number of models projected onto variables, see enumerate_models.
+        Free variables are counted without going through their models
+        """
+        if variables is None:
+            variables = self.user_vars()
+        active = self.var()
+        self.internal.add(active)
+        num_models = 0
+        while limit is None or num_models < limit:
+            if not self.solve(assumptions=list(assumptions) + [active]):
+                break
+            model = self.get_model()
+            known = [model[var-1] for var in variables if var <= len(model)]
+            num_models += 2**(len(variables) - len(known))
+            if not known:
+                break
+            self.add([[-active] + [-lit for lit in known]])
+        self.add([[-active]])
+        return num_models if limit is None else min(num_models, limit)
+
     def solution_value(self, var):
         if not self.var2val:
             self._init_var2val()
@@ -120,6 +285,36 @@ class SugarRush(Solver):
         clauses.append(inds)
         return clauses
 
+    def add_xor(self, lits, parity=1):
+        """
+        Constrains an odd (parity=1) or even (parity=0)
+        number of lits to be true. Kept aside until solve
+        """
+        self.add_lits(lits)
+        var2count = {}
+        for lit in lits:
+            var2count[abs(lit)] = var2count.get(abs(lit), 0) + 1
+            parity ^= lit < 0
+        # a repeated variable cancels
+        xor_vars = [var for var, count in var2count.items() if count % 2]
+        self.xors.append((xor_vars, parity * 1))
+
+    def parity(self, lits, parity=1, chain_length=4):
+        """
+        Clauses for an odd (parity=1) or even (parity=0) number of lits,
+        as a chain of XORs of at most chain_length literals each,
+        linked by auxilliary variables
+        """
+        lits = list(lits)
+        clauses = []
+        while len(lits) > chain_length:
+            t = self.var()
+            self.internal.add(t)
+            chunk, lits = lits[:chain_length-1], [t] + lits[chain_length-1:]
+            clauses.extend(xor_clauses(chunk + [t], 0))
+        clauses.extend(xor_clauses(lits, parity))
+        return clauses
+
     def itotalizer(self, lits, ubound=None):
         if ubound is None:
             ubound = len(lits)
@@ -158,4 +353,15 @@ class SugarRush(Solver):
                 lower = mid
             dbg("", debug)
         self.solve(assumptions=[-itot[upper]])
-        return upper
\ No newline at end of file
+        return upper
+
+def xor_clauses(lits, parity):
+    """
+    One clause against each assignment of lits with the wrong parity
+    """
+    clauses = []
+    for assignment in range(2**len(lits)):
+        bits = [(assignment >> i) & 1 for i in range(len(lits))]
+        if sum(bits) % 2 != parity:
+            clauses.append([-lit if bit else lit for lit, bit in zip(lits, bits)])
+    return clauses
@@ -16,6 +16,7 @@ N = 10 # num students
 max_simultaneous = [1 for _ in range(T)] # max num student per time
 min_times = [1 for _ in range(N)] # min times per student
 lesson_length = timedelta(minutes=20)
+decompose_weeks = False # solve weeks independently, in parallel
 
 #available = [[random.random() < 0.1 for _ in range(T)] for _ in range(N)]
 
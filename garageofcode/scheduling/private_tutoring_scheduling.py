@@ -1,6 +1,7 @@
 import numpy as np
 import random
 from collections import defaultdict, OrderedDict
+from multiprocessing import Pool
 from datetime import datetime, timedelta
 from datetime import time as midnight_time
 import matplotlib.pyplot as plt
@@ -12,43 +13,61 @@ from garageofcode.mip.miputils import max_var, min_var
 from garageofcode.scheduling.read import read
 import garageofcode.scheduling.conf as conf
 
-def constraint_take_times(solver, students, student_time2take, take_times):
+def get_index(times, student_time2take):
+    """
+    Groups the take variables by student, by time and by day,
+    in one pass over student_time2take.
+    day2slot2takes has every time in times, also those that no student can take,
+    ordered by date and time of day
+    """
+    student2takes = defaultdict(list)
+    time2takes = defaultdict(list)
+    for (student, dt), take in student_time2take.items():
+        student2takes[student].append(take)
+        time2takes[dt].append(take)
+
+    day2slot2takes = OrderedDict()
+    for dt in sorted(times):
+        slot2takes = day2slot2takes.setdefault(dt.date(), OrderedDict())
+        slot2takes[dt] = time2takes.get(dt, [])
+
+    return {"student2takes": student2takes,
+            "time2takes": time2takes,
+            "day2slot2takes": day2slot2takes}
+
+def constraint_take_times(solver, students, index, take_times):
+    student2takes = index["student2takes"]
     for student in students:
-        takes = [take for (st_id, _), take in student_time2take.items() if st_id == student]
+        takes = student2takes.get(student, [])
         solver.Add(solver.Sum(takes) == take_times[student])
 
-def constraint_max_simultaneous(solver, times, student_time2take, max_simultaneous):
+def constraint_max_simultaneous(solver, times, index, max_simultaneous):
+    time2takes = index["time2takes"]
     for dt in times:
-        takes = [take for (_, t), take in student_time2take.items() if t == dt]
+        takes = time2takes.get(dt, [])
         solver.Add(solver.Sum(takes) <= max_simultaneous[dt])
 
-def get_day2works(solver, times, student_time2take):
+def get_day2works(solver, index):
     day2works = {}
-    for day in equivalence_partition(times, lambda x: x.date()):
-        date = next(iter(day)).date()
-        takes = [take for (_, t), take in student_time2take.items() if t in day]
+    for date, slot2takes in index["day2slot2takes"].items():
+        takes = flatten_simple(slot2takes.values())
         works = max_var(solver, takes, lb=0, ub=1)
         day2works[date] = works
 
     return day2works
 
-def get_day2time_span(solver, times, student_time2take):
+def get_day2time_span(solver, index):
     day2start_time = {}
     day2end_time = {}
     day2time_span = {}
-    for day in equivalence_partition(times, lambda x: x.date()):
-        dt0 = next(iter(day))
-        midnight = datetime.combine(dt0.date(), midnight_time())
-        date = dt0.date()
-
-        day_takes = [(t, take) for (_, t), take in student_time2take.items() if t in day]
+    for date, slot2takes in index["day2slot2takes"].items():
+        midnight = datetime.combine(date, midnight_time())
 
         start_busy_times = []
         end_busy_times = []
         busy_times = []
-        for dt in equivalence_partition(day, lambda x: x.time()):
-            t_of_d = (next(iter(dt)) - midnight).total_seconds()
-            takes = [take for t, take in day_takes if t in dt]
+        for dt, takes in slot2takes.items():
+            t_of_d = (dt - midnight).total_seconds()
             busy = max_var(solver, takes, lb=0, ub=1)
             start_busy_times.append(busy * t_of_d + (1 - busy) * DAY2SEC)
             end_busy_times.append(busy * t_of_d)
@@ -64,6 +83,90 @@ def get_day2time_span(solver, times, student_time2take):
 
     return day2time_span
 
+def solve_schedule(students, times, available, take_times, max_simultaneous, 
+                   time_limit=10, verbose=True):
+    """
+    Builds and solves the model.
+    Returns the status and the solution values as plain dicts,
+    so that it can be run in a worker process
+    """
+    solver = get_solver("CBC")
+
+    # Generate variables
+    student_time2take = dict([(item, solver.IntVar(0, 1)) for item in sorted(available)])
+    index = get_index(times, student_time2take)
+
+    # Add constraints
+    constraint_take_times(solver, students, index, take_times)
+    constraint_max_simultaneous(solver, times, index, max_simultaneous)
+
+    # Add costs and values
+    obj = solver.NumVar(lb=0, ub=0)
+    day2works = get_day2works(solver, index)
+    obj -= solver.Sum(day2works.values()) * conf.per_diem_cost
+    day2t_s = get_day2time_span(solver, index)
+    obj -= solver.Sum(day2t_s.values()) * conf.time_cost
+
+    solver.SetObjective(obj, maximize=True)
+
+    status = solver.Solve(time_limit=time_limit, verbose=verbose)
+    if status2str[status] not in ["OPTIMAL", "FEASIBLE"]:
+        return status, None
+
+    solution = {"obj": solution_value(obj)}
+    solution["student_time2take"] = dict([(key, solution_value(take)) 
+                                          for key, take in student_time2take.items()])
+    solution["day2works"] = dict([(key, solution_value(take)) 
+                                  for key, take in day2works.items()])
+    solution["day2t_s"] = dict([(key, solution_value(take))
+                                for key, take in day2t_s.items()])
+    return status, solution
+
+def _solve_week(args):
+    return solve_schedule(*args, verbose=False)
+
+def solve_decomposed(students, times, available, take_times, max_simultaneous, 
+                     time_limit=10, processes=None):
+    """
+    Solves each week as an independent model, in parallel, 
+    and stitches the solutions together.
+    Here take_times is per week: a student who is available 
+    during a week takes take_times[student] lessons that week.
+    Days never interact in the objective, so this is exact
+    as long as the weekly demands are what you want.
+    """
+    week2times = defaultdict(set)
+    for dt in times:
+        week2times[dt.isocalendar()[:2]].add(dt)
+    week2available = defaultdict(set)
+    for student, dt in available:
+        week2available[dt.isocalendar()[:2]].add((student, dt))
+
+    jobs = []
+    weeks = sorted(week2times)
+    for week in weeks:
+        week_available = week2available[week]
+        week_students = set(student for student, _ in week_available)
+        week_take_times = {student: take_times[student] for student in week_students}
+        week_times = week2times[week]
+        week_max_simultaneous = {dt: max_simultaneous[dt] for dt in week_times}
+        jobs.append((week_students, week_times, week_available, 
+                     week_take_times, week_max_simultaneous, time_limit))
+
+    with Pool(processes) as pool:
+        results = pool.map(_solve_week, jobs)
+
+    solution = {"obj": 0, "student_time2take": {}, "day2works": {}, "day2t_s": {}}
+    for week, (status, week_solution) in zip(weeks, results):
+        if week_solution is None:
+            print("Week {}: {}".format(week, status2str[status]))
+            return status, None
+        solution["obj"] += week_solution["obj"]
+        for key in ["student_time2take", "day2works", "day2t_s"]:
+            solution[key].update(week_solution[key])
+    # OPTIMAL < FEASIBLE, so the worst week decides
+    return max(status for status, _ in results), solution
+
 def draw_tutoring_schedule(ax, students, times, student_time2take):
     students = list(sorted(students))
     T = len(times)
@@ -118,38 +221,20 @@ def main():
     take_times = dict([(student, 1) for student in students])
     max_simultaneous = dict([(dt, ms) for dt, ms in zip(times, conf.max_simultaneous)])
 
-    # Generate variables
-    solver = get_solver("CBC")
-
-    student_time2take = dict([(item, solver.IntVar(0, 1)) for item in available])
-
-    # Add constraints
-    constraint_take_times(solver, students, student_time2take, take_times)
-    constraint_max_simultaneous(solver, times, student_time2take, max_simultaneous)
-
-    # Add costs and values
-    obj = solver.NumVar(lb=0, ub=0)
-    day2works = get_day2works(solver, times, student_time2take)
-    obj -= solver.Sum(day2works.values()) * conf.per_diem_cost
-    day2t_s = get_day2time_span(solver, times, student_time2take)
-    obj -= solver.Sum(day2t_s.values()) * conf.time_cost
-
-    solver.SetObjective(obj, maximize=True)
-
-    status = solver.Solve(time_limit=10)
+    if conf.decompose_weeks:
+        status, solution = solve_decomposed(students, times, available, 
+                                            take_times, max_simultaneous)
+    else:
+        status, solution = solve_schedule(students, times, available, 
+                                          take_times, max_simultaneous)
     print(status2str[status])
-    if status2str[status] not in ["OPTIMAL", "FEASIBLE"]:
+    if solution is None:
         return 0
-    print(int(np.around(solution_value(obj))))
-
-    student_time2take_solve = dict([(key, solution_value(take)) 
-                                for key, take in student_time2take.items()])
-
-    day2works_solve = dict([(key, solution_value(take)) 
-                            for key, take in day2works.items()])
+    print(int(np.around(solution["obj"])))
 
-    day2t_s_solve = dict([(key, solution_value(take))
-                            for key, take in day2t_s.items()])
+    student_time2take_solve = solution["student_time2take"]
+    day2works_solve = solution["day2works"]
+    day2t_s_solve = solution["day2t_s"]
     
     total_days = int(sum(day2works_solve.values()))
     lesson_length_hrs = conf.lesson_length.total_seconds() / 3600
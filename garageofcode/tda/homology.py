@@ -0,0 +1,168 @@
+"""
+Vietoris-Rips persistent homology in dimensions 0 and 1,
+on the flag complex of a sparse distance graph from tda.metrics.
+
+H0 comes from union-find over the edges in filtration order.
+H1 is computed as persistent cohomology (same pairs as homology):
+edge columns are reduced in reverse filtration order, and the edges
+that already killed a component in H0 are cleared, i.e. never reduced.
+Coboundaries are generated from the adjacency lists when needed,
+and only the reduction (which edges were added to a column) is stored,
+so triangles are never held in memory all at once.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+class UnionFind:
+    """
+    Disjoint sets over 0..n-1 with path halving and union by size
+    """
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, a):
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a, b):
+        """
+        Returns False if a and b were already in the same set
+        """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+def edge_filtration(G):
+    """
+    Edges i < j of the symmetric sparse graph G,
+    sorted by length (ties by vertices).
+    Returns (E, 2) vertex array and lengths
+    """
+    G = sp.triu(sp.csr_matrix(G), k=1).tocoo()
+    order = np.lexsort([G.col, G.row, G.data])
+    edges = np.stack([G.row[order], G.col[order]], axis=1).astype(np.int64)
+    return edges, G.data[order].astype(float)
+
+def persistence_h0(N, edges, weights):
+    """
+    All vertices are born at 0, and an edge that joins
+    two components kills one of them.
+    Returns the (N, 2) diagram, with death inf for the surviving components,
+    and a mask of the killing edges (a spanning forest)
+    """
+    uf = UnionFind(N)
+    forest = np.zeros(len(edges), dtype=bool)
+    deaths = []
+    for e, (i, j) in enumerate(edges.tolist()):
+        if uf.union(i, j):
+            forest[e] = True
+            deaths.append(weights[e])
+            if len(deaths) == N - 1:
+                break
+    deaths += [np.inf] * (N - len(deaths))
+    dgm = np.zeros([N, 2])
+    dgm[:, 1] = deaths
+    return dgm, forest
+
+class _Coboundary:
+    """
+    Triangles containing an edge. A triangle is keyed by its edge indices
+    in decreasing order, which sorts triangles in filtration order:
+    first by diameter (the largest edge), then by the remaining edges
+    """
+    def __init__(self, N, edges):
+        self.edges = edges.tolist()
+        # adjacency in CSR form: neighbours of i sorted, with the edge to each
+        E = len(edges)
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+        ids = np.concatenate([np.arange(E), np.arange(E)])
+        order = np.lexsort([dst, src])
+        self.nbrs = dst[order]
+        self.nbr_edges = ids[order]
+        self.indptr = np.searchsorted(src[order], np.arange(N + 1))
+
+    def __call__(self, e):
+        i, j = self.edges[e]
+        sl_i = slice(self.indptr[i], self.indptr[i+1])
+        sl_j = slice(self.indptr[j], self.indptr[j+1])
+        _, ii, jj = np.intersect1d(self.nbrs[sl_i], self.nbrs[sl_j], 
+                                   assume_unique=True, return_indices=True)
+        if not len(ii):
+            return set()
+        a = self.nbr_edges[sl_i][ii]
+        b = self.nbr_edges[sl_j][jj]
+        T = np.sort(np.stack([np.full(len(a), e), a, b]), axis=0)[::-1]
+        return set(zip(*T.tolist()))
+
+def persistence_h1(N, edges, weights, forest=None):
+    """
+    Returns the (n, 2) diagram of the 1-cycles.
+    forest: the killing edges of persistence_h0, which are cleared
+    """
+    if forest is None:
+        _, forest = persistence_h0(N, edges, weights)
+    cob = _Coboundary(N, edges)
+    pivot2edge = {}
+    edge2reduction = {}
+    pairs = []
+    for e in range(len(edges) - 1, -1, -1):
+        if forest[e]:
+            continue # clearing: e is paired in H0, so its column reduces to zero
+        col = cob(e)
+        reduction = [e]
+        while col:
+            pivot = min(col)
+            other = pivot2edge.get(pivot)
+            if other is None:
+                break
+            for f in edge2reduction[other]:
+                col ^= cob(f)
+            reduction.extend(edge2reduction[other])
+        if col:
+            pivot2edge[pivot] = e
+            # repeated edges cancel over Z/2
+            edge2reduction[e] = [f for f, n in _counts(reduction).items() if n % 2]
+            death = weights[pivot[0]]
+        else:
+            death = np.inf
+        if death > weights[e]:
+            pairs.append((weights[e], death))
+    return np.array(pairs).reshape(-1, 2)
+
+def _counts(items):
+    item2count = {}
+    for item in items:
+        item2count[item] = item2count.get(item, 0) + 1
+    return item2count
+
+def persistence(G):
+    """
+    H0 and H1 diagrams of the flag complex of the distance graph G,
+    e.g. metrics.knn_graph(sliding_windows(Y, dim), k).
+    Zero length pairs are left out of H1
+    """
+    N = G.shape[0]
+    edges, weights = edge_filtration(G)
+    dgm0, forest = persistence_h0(N, edges, weights)
+    dgm1 = persistence_h1(N, edges, weights, forest)
+    return {0: dgm0, 1: dgm1}
+
+def lifetimes(dgm, threshold=np.inf):
+    """
+    death - birth per pair, sorted in decreasing order.
+    Deaths are capped at threshold, e.g. the eps of an epsilon graph,
+    beyond which the filtration is not known
+    """
+    if not len(dgm):
+        return np.zeros(0)
+    return np.sort(np.minimum(dgm[:, 1], threshold) - dgm[:, 0])[::-1]
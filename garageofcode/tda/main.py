@@ -11,6 +11,8 @@ import networkx as nx
 from sklearn.manifold import MDS
 
 from garageofcode.common.utils import get_fn
+from garageofcode.tda.metrics import pairwise, sliding_windows, relative, knn_graph
+from garageofcode.tda.homology import persistence
 
 gif_dir = get_fn("tda/gif")
 
@@ -18,9 +20,32 @@ SpectralType = namedtuple("SpectralType", ["metal", "type_short", "type_full"])
 
 def get_mds(X, metric, dim=2):
     mds = MDS(n_components=dim, dissimilarity='precomputed')
-    M = [[metric(xi, xj) for xj in X] for xi in X]
+    M = pairwise(X, metric)
     return mds.fit_transform(M), mds  
 
+def get_persistence(Y, dim, k=10):
+    """
+    H0 and H1 diagrams of the sliding windows of the series Y,
+    on the k nearest neighbour graph of the windows
+    """
+    X = sliding_windows(Y, dim)
+    return persistence(knn_graph(X, k))
+
+def draw_persistence(dgms):
+    fig, ax = plt.subplots()
+
+    finite = np.concatenate([dgm[np.isfinite(dgm[:, 1])] for dgm in dgms.values()])
+    top = finite.max() if len(finite) else 1
+    for d, dgm in sorted(dgms.items()):
+        deaths = np.where(np.isfinite(dgm[:, 1]), dgm[:, 1], top * 1.1)
+        ax.scatter(dgm[:, 0], deaths, label="H{}".format(d))
+    ax.plot([0, top * 1.1], [0, top * 1.1], color='k')
+    ax.set_xlabel("birth")
+    ax.set_ylabel("death")
+    ax.legend()
+
+    plt.show()
+
 def load_spectrum(fn):
     wavelength_col = 0
     val_col = 1
@@ -87,13 +112,6 @@ def read_custom(N):
 def load_data(N):
     return list(read_custom(N))
 
-def sliding_windows(Y, dim):
-    X = []
-    for i in range(len(Y)-dim+1):
-        X.append(Y[i:i+dim])
-
-    return X    
-
 def random_data(N):
     Y = [0]
     for _ in range(N):
@@ -119,23 +137,6 @@ def periodic_data(N):
 
     return Y[1:]
 
-def euclidean(xi, xj):
-    xi = np.array(xi)
-    xj = np.array(xj)
-    return np.linalg.norm(xi - xj)
-
-def corr(xi, xj):
-    xi = np.array(xi)
-    xj = np.array(xj)
-    xi -= np.mean(xi)
-    xj -= np.mean(xj)
-    return np.linalg.norm(xi - xj)
-
-def relative(xi, xj):
-    xi = xi / np.sum(xi)
-    xj = xj / np.sum(xj)
-    return np.linalg.norm(xi - xj)
-
 def draw_graph(G):
     fig, ax = plt.subplots()
 
@@ -196,8 +197,9 @@ def graph_gif(X):
 
     print("MDS complete")
 
-    M = [(metric(xi, xj), xi_t, xj_t) for i, (xi, xi_t) in enumerate(zip(X, X_transformed)) 
-                                  for xj, xj_t in zip(X[i+1:], X_transformed[i+1:])]
+    D = pairwise(X, metric)
+    I, J = np.triu_indices(len(X), 1)
+    M = [(D[i, j], X_transformed[i], X_transformed[j]) for i, j in zip(I, J)]
 
     plt.axis('off')
 
@@ -230,6 +232,9 @@ def main():
     #X = periodic_data(N)
     #X = load_data(N)
     #X = sliding_windows(X, 5)
+    #dgms = get_persistence(periodic_data(N), 11)
+    #print("H1 lifetimes:", lifetimes(dgms[1])[:3])
+    #draw_persistence(dgms)
     name2spectrum = load_stars(131)
 
     #print(name2spectrum.keys())
@@ -0,0 +1,175 @@
+"""
+Pairwise distances for whole matrices of points,
+and sparse neighbourhood graphs built a block at a time.
+Rows of X are points.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+BLOCK = 2048 # rows (and columns) of the distance matrix computed at a time
+
+def sliding_windows(Y, dim):
+    """
+    All windows Y[i:i+dim] as rows of a read-only view, without copying
+    """
+    return np.lib.stride_tricks.sliding_window_view(np.asarray(Y), dim)
+
+def center(X):
+    """
+    Subtracts the mean of every row, the preprocessing of corr
+    """
+    X = np.asarray(X, dtype=float)
+    return X - X.mean(axis=1, keepdims=True)
+
+def normalize(X):
+    """
+    Divides every row by its sum, the preprocessing of relative
+    """
+    X = np.asarray(X, dtype=float)
+    return X / X.sum(axis=1, keepdims=True)
+
+def euclidean(xi, xj):
+    xi = np.array(xi)
+    xj = np.array(xj)
+    return np.linalg.norm(xi - xj)
+
+def corr(xi, xj):
+    xi = np.array(xi, dtype=float)
+    xj = np.array(xj, dtype=float)
+    xi -= np.mean(xi)
+    xj -= np.mean(xj)
+    return np.linalg.norm(xi - xj)
+
+def relative(xi, xj):
+    xi = xi / np.sum(xi)
+    xj = xj / np.sum(xj)
+    return np.linalg.norm(xi - xj)
+
+# every metric is the euclidean distance after a row transform
+metric2transform = {"euclidean": lambda X: np.asarray(X, dtype=float),
+                    "corr": center,
+                    "relative": normalize}
+for _name, _func in [("euclidean", euclidean), ("corr", corr), ("relative", relative)]:
+    metric2transform[_func] = metric2transform[_name]
+
+def get_transform(metric):
+    try:
+        return metric2transform[metric]
+    except KeyError:
+        raise ValueError("Unknown metric: {}".format(metric))
+
+def _sq_norms(X):
+    return np.einsum("ij,ij->i", X, X)
+
+def _block_dist(A, a2, B, b2, squared=False):
+    """
+    Euclidean distances between the rows of A and B,
+    given their squared norms, with one matrix product
+    """
+    D = a2[:, None] + b2[None, :] - 2 * (A @ B.T)
+    np.maximum(D, 0, out=D)
+    if squared:
+        return D
+    return np.sqrt(D, out=D)
+
+def pairwise(X, metric="euclidean", Y=None, block=BLOCK):
+    """
+    Distance matrix between the rows of X and the rows of Y (default X).
+    metric is a name in metric2transform, one of the pair functions above,
+    or any other function of two rows, which is called pair by pair
+    """
+    if callable(metric) and metric not in metric2transform:
+        Y = X if Y is None else Y
+        return np.array([[metric(xi, yj) for yj in Y] for xi in X], dtype=float)
+    transform = get_transform(metric)
+    X = transform(X)
+    Y = X if Y is None else transform(Y)
+    x2 = _sq_norms(X)
+    y2 = x2 if Y is X else _sq_norms(Y)
+    D = np.zeros([len(X), len(Y)])
+    for i0 in range(0, len(X), block):
+        D[i0:i0+block] = _block_dist(X[i0:i0+block], x2[i0:i0+block], Y, y2)
+    if Y is X:
+        # exact zeros and symmetry, which the matrix product loses
+        D = (D + D.T) / 2
+        np.fill_diagonal(D, 0)
+    return D
+
+def _blocks(X, metric, block, upper=False, squared=False):
+    """
+    Yields (i0, j0, distance block) over the whole N x N matrix,
+    or only the blocks on and above the diagonal if upper,
+    never holding more than block x block distances
+    """
+    X = get_transform(metric)(X)
+    x2 = _sq_norms(X)
+    N = len(X)
+    for i0 in range(0, N, block):
+        A, a2 = X[i0:i0+block], x2[i0:i0+block]
+        for j0 in range(i0 if upper else 0, N, block):
+            yield i0, j0, _block_dist(A, a2, X[j0:j0+block], x2[j0:j0+block], squared)
+
+def _to_graph(rows, cols, vals, N, symmetric):
+    """
+    Sparse N x N matrix that keeps zero distances as explicit entries.
+    If symmetric, (i, j) is mirrored to (j, i) unless already there
+    """
+    if symmetric:
+        rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+        vals = np.concatenate([vals, vals])
+        _, first = np.unique(rows * N + cols, return_index=True)
+        rows, cols, vals = rows[first], cols[first], vals[first]
+    return sp.csr_matrix((vals, (rows, cols)), shape=(N, N))
+
+def knn_graph(X, k, metric="euclidean", symmetric=True, block=BLOCK):
+    """
+    Sparse N x N matrix with the distance from every point
+    to its k nearest neighbours (itself excluded).
+    If symmetric, an edge is kept if either end has the other among its k nearest.
+    Zero distances are stored explicitly
+    """
+    N = len(X)
+    k = min(k, N - 1)
+    # running k nearest per block of rows, merged over the column blocks
+    best_ids = {}
+    best_dist = {}
+    for i0, j0, D in _blocks(X, metric, block, squared=True):
+        if i0 == j0:
+            np.fill_diagonal(D, np.inf)
+        kb = min(k, D.shape[1])
+        idx = np.argpartition(D, kb-1, axis=1)[:, :kb]
+        ids = np.concatenate([best_ids.get(i0, idx[:, :0]), idx + j0], axis=1)
+        dist = np.concatenate([best_dist.get(i0, D[:, :0]), np.take_along_axis(D, idx, axis=1)], axis=1)
+        if ids.shape[1] > k:
+            keep = np.argpartition(dist, k-1, axis=1)[:, :k]
+            ids = np.take_along_axis(ids, keep, axis=1)
+            dist = np.take_along_axis(dist, keep, axis=1)
+        best_ids[i0] = ids
+        best_dist[i0] = dist
+
+    keys = sorted(best_ids)
+    cols = np.concatenate([best_ids[i0] for i0 in keys]).ravel() if keys else np.zeros(0, dtype=np.int64)
+    vals = np.concatenate([best_dist[i0] for i0 in keys]).ravel() if keys else np.zeros(0)
+    rows = np.repeat(np.arange(N), k)
+    return _to_graph(rows, cols, np.sqrt(vals), N, symmetric)
+
+def epsilon_graph(X, eps, metric="euclidean", block=BLOCK):
+    """
+    Sparse N x N matrix with the distance between every pair
+    of distinct points closer than eps.
+    Zero distances are stored explicitly
+    """
+    N = len(X)
+    rows, cols, vals = [], [], []
+    for i0, j0, D in _blocks(X, metric, block, upper=True):
+        r, c = np.nonzero(D < eps)
+        if i0 == j0:
+            upper = r < c
+            r, c = r[upper], c[upper]
+        vals.append(D[r, c])
+        rows.append(r + i0)
+        cols.append(c + j0)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    vals = np.concatenate(vals) if vals else np.zeros(0)
+    return _to_graph(rows, cols, vals, N, symmetric=True)
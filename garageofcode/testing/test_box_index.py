@@ -0,0 +1,80 @@
+"""
+Leaf queries of BoxTree through its BoxIndex against
+testing every leaf with Box.contains, on random subdivisions
+"""
+import random
+
+import numpy as np
+
+from garageofcode.common.box import Box, BoxTree
+
+def split(T, box, rng, depth):
+    """
+    Subdivides box into children along a random dimension, on integer cuts
+    """
+    if depth == 0:
+        return
+    dim = rng.choice(list(box))
+    i, j = box[dim]
+    if j - i < 2:
+        return
+    cuts = sorted(rng.sample(range(i + 1, j), min(j - i - 1, rng.randint(1, 3))))
+    for i0, i1 in zip([i] + cuts, cuts + [j]):
+        child = Box({d: (i0, i1) if d == dim else ij for d, ij in box.items()})
+        T.add_edge(box, child)
+        split(T, child, rng, depth - 1)
+
+def random_tree(rng, num_dims=2, size=16, depth=4):
+    T = BoxTree()
+    root = Box({dim: (0, size) for dim in range(num_dims)})
+    T.add_node(root)
+    split(T, root, rng, depth)
+    return T
+
+def brute_force(T, dim2val):
+    return set(leaf for leaf in T.get_leafs() if leaf.contains(dim2val))
+
+def check(T, rng, num_points=50):
+    num_dims = len(T.get_root())
+    # points on the cuts, between them, and outside the root
+    X = [[rng.choice([rng.randint(-1, 17), rng.uniform(-1, 17)]) for _ in range(num_dims)]
+         for _ in range(num_points)]
+    for dims in [list(range(num_dims)), [0], [num_dims - 1, 0]]:
+        X_dims = [[x[dim] for dim in dims] for x in X]
+        row2leafs = T.profile_many(X_dims, dims=dims)
+        for x, leafs in zip(X_dims, row2leafs):
+            dim2val = dict(zip(dims, x))
+            expected = brute_force(T, dim2val)
+            assert len(leafs) == len(set(leafs))
+            assert set(leafs) == expected, (dim2val, leafs, expected)
+            assert set(T.profile(dim2val)) == expected, dim2val
+
+def test_random(num_instances=30, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_instances):
+        check(random_tree(rng, num_dims=rng.randint(1, 3)), rng)
+
+def test_changes():
+    # the index is rebuilt when the tree changes
+    rng = random.Random(1)
+    T = random_tree(rng)
+    check(T, rng)
+    leaf = max(T.get_leafs(), key=lambda leaf: leaf.volume())
+    split(T, leaf, rng, 2)
+    check(T, rng)
+    T.remove_subtree(next(iter(T[T.get_root()])))
+    check(T, rng)
+
+def test_unknown_dims():
+    T = random_tree(random.Random(2))
+    assert list(T.profile({"z": 0})) == []
+    assert T.profile_many(np.zeros([3, 1]), dims=["z"]) == [[], [], []]
+
+def main():
+    test_random()
+    test_changes()
+    test_unknown_dims()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Round trips of the CNF cache: the flat .npy format, DIMACS,
+and cached encodings, which must give the same clauses and variables
+as running the generator, and must be redone when the generator changes
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+import importlib
+
+import numpy as np
+
+from garageofcode.sat import cnf_cache
+from garageofcode.sat.solver import SugarRush
+
+def random_clauses(rng, num_vars, num_clauses):
+    return [[rng.choice([-1, 1]) * rng.randint(1, num_vars) for _ in range(rng.randint(1, 5))]
+            for _ in range(num_clauses)]
+
+def to_clauses(lits, offsets):
+    return [clause for clauses in cnf_cache.iter_batches(lits, offsets, batch_size=7)
+            for clause in clauses]
+
+def test_npy_round_trip():
+    rng = random.Random(0)
+    d = tempfile.mkdtemp()
+    for num_clauses in [0, 1, 100]:
+        clauses = random_clauses(rng, 20, num_clauses)
+        path = os.path.join(d, "cnf{}".format(num_clauses))
+        cnf_cache.write_cnf(path, clauses)
+        for mmap in [True, False]:
+            assert to_clauses(*cnf_cache.read_cnf(path, mmap)) == clauses
+
+def test_dimacs_round_trip():
+    rng = random.Random(1)
+    d = tempfile.mkdtemp()
+    clauses = random_clauses(rng, 30, 200)
+    lits, offsets = cnf_cache.to_arrays(clauses)
+    fn = os.path.join(d, "cnf.dimacs")
+    cnf_cache.write_dimacs(fn, lits, offsets, num_vars=31)
+    lits2, offsets2, num_vars = cnf_cache.read_dimacs(fn)
+    assert num_vars == 31
+    assert to_clauses(lits2, offsets2) == clauses
+
+    # comments, and clauses over several lines
+    fn = os.path.join(d, "split.dimacs")
+    with open(fn, "w") as f:
+        f.write("c comment\np cnf 3 2\n1 -2\n3 0 -1\n0\n")
+    lits, offsets, num_vars = cnf_cache.read_dimacs(fn)
+    assert num_vars == 3
+    assert to_clauses(lits, offsets) == [[1, -2, 3], [-1]]
+
+def encode(solver, n):
+    X = [solver.var() for _ in range(n)]
+    solver.add([X[i:i+3] for i in range(n - 2)])
+    solver.add(solver.atmost(X, bound=2))
+    return X
+
+def count_models(generate, cache_dir, keep_clauses):
+    with SugarRush(keep_clauses=keep_clauses) as solver:
+        solver.var() # the key depends on top_id
+        X = cnf_cache.cached(solver, "encode", {"n": 6}, generate, cache_dir)
+        clauses = None if solver.clauses is None else list(solver.clauses)
+        return X, solver.top_id(), solver.count_models(X), clauses
+
+def test_cached():
+    d = tempfile.mkdtemp()
+    generate = lambda solver: encode(solver, 6)
+    first = count_models(generate, d, True)
+    assert len(os.listdir(d)) == 3
+    second = count_models(generate, d, True)
+    assert first[:3] == second[:3]
+    # the clauses of a cache hit are kept like generated ones
+    assert first[3] == second[3] and first[3]
+    assert count_models(generate, d, False)[:3] == first[:3]
+
+def test_xors_refused():
+    d = tempfile.mkdtemp()
+    def generate(solver):
+        X = encode(solver, 4)
+        solver.add_xor(X, 1)
+        return X
+    with SugarRush() as solver:
+        try:
+            cnf_cache.cached(solver, "xor", {}, generate, d)
+            assert False, "XORs are not cached"
+        except ValueError:
+            pass
+    assert not os.listdir(d)
+
+def test_source_change():
+    d = tempfile.mkdtemp()
+    cache_dir = os.path.join(d, "cache")
+    os.makedirs(cache_dir)
+    root_dir = cnf_cache.ROOT_DIR
+    cnf_cache.ROOT_DIR = d
+    sys.path.insert(0, d)
+    try:
+        counts = []
+        for bound in [1, 2, 2]:
+            with open(os.path.join(d, "cache_encoder.py"), "w") as f:
+                f.write("def encode(solver):\n"
+                        "    X = [solver.var() for _ in range(4)]\n"
+                        "    solver.add(solver.atmost(X, bound={}))\n"
+                        "    return X\n".format(bound))
+            # same size and mtime second, so the .pyc would pass as fresh
+            shutil.rmtree(os.path.join(d, "__pycache__"), ignore_errors=True)
+            importlib.invalidate_caches()
+            module = importlib.reload(importlib.import_module("cache_encoder"))
+            with SugarRush() as solver:
+                X = cnf_cache.cached(solver, "edited", {}, lambda solver: module.encode(solver),
+                                     cache_dir)
+                counts.append(solver.count_models(X))
+        assert counts == [5, 11, 11], counts
+        # one entry per version of the encoder
+        assert len(os.listdir(cache_dir)) == 6
+    finally:
+        cnf_cache.ROOT_DIR = root_dir
+        sys.path.remove(d)
+        sys.modules.pop("cache_encoder", None)
+
+def main():
+    test_npy_round_trip()
+    test_dimacs_round_trip()
+    test_cached()
+    test_xors_refused()
+    test_source_change()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
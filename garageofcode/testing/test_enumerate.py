@@ -0,0 +1,81 @@
+"""
+Model enumeration and counting in SugarRush against brute force,
+projected onto all or some of the variables
+"""
+import random
+from itertools import product
+
+from garageofcode.sat.solver import SugarRush
+
+def brute_force_models(num_vars, clauses, variables):
+    models = set()
+    for bits in product([0, 1], repeat=num_vars):
+        value = lambda lit: bits[abs(lit)-1] ^ (lit < 0)
+        if all(any(value(lit) for lit in clause) for clause in clauses):
+            models.add(tuple(var if bits[var-1] else -var for var in variables))
+    return models
+
+def random_cnf(rng, num_vars):
+    return [[rng.choice([-1, 1]) * rng.randint(1, num_vars) for _ in range(rng.randint(1, 3))]
+            for _ in range(rng.randint(0, 3 * num_vars))]
+
+def check(num_vars, clauses, variables=None):
+    with SugarRush() as solver:
+        X = [solver.var() for _ in range(num_vars)]
+        solver.add(clauses)
+        expected = brute_force_models(num_vars, clauses, variables or X)
+        models = [tuple(model) for model in solver.enumerate_models(variables)]
+        assert len(models) == len(set(models)), clauses
+        assert set(models) == expected, (clauses, variables)
+        # earlier calls leave activation literals behind, which must not count
+        for _ in range(2):
+            assert solver.count_models(variables) == len(expected), (clauses, variables)
+        assert len(list(solver.enumerate_models(variables, limit=3))) == min(3, len(expected))
+        assert solver.count_models(variables, limit=3) == min(3, len(expected))
+
+def test_random(num_instances=200, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_instances):
+        num_vars = rng.randint(1, 6)
+        clauses = random_cnf(rng, num_vars)
+        variables = None
+        if rng.random() < 0.5:
+            variables = sorted(rng.sample(range(1, num_vars + 1), rng.randint(1, num_vars)))
+        check(num_vars, clauses, variables)
+
+def test_free_variables():
+    # variables in no clause give two models each
+    check(3, [[1, 2]])
+    check(3, [])
+
+def test_call_history():
+    # activation literals of earlier or unfinished enumerations
+    # are not part of the default projection
+    with SugarRush() as solver:
+        X = [solver.var() for _ in range(3)]
+        solver.add([X[:2]])
+        expected = brute_force_models(3, [[1, 2]], X)
+        assert solver.count_models() == len(expected)
+        unfinished = solver.enumerate_models()
+        next(unfinished)
+        assert solver.count_models() == len(expected)
+        assert set(tuple(model) for model in solver.enumerate_models()) == expected
+        unfinished.close()
+        assert solver.user_vars() == X
+
+def test_assumptions():
+    with SugarRush() as solver:
+        X = [solver.var() for _ in range(3)]
+        solver.add([X])
+        assert solver.count_models(assumptions=[-X[0]]) == 3
+        assert solver.count_models() == 7
+
+def main():
+    test_free_variables()
+    test_call_history()
+    test_assumptions()
+    test_random()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
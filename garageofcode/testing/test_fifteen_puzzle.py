@@ -0,0 +1,85 @@
+"""
+Bounded model checking of the sliding puzzle: every step of the path
+is a legal move, and the path is as short as breadth first search says
+"""
+import random
+from collections import deque
+
+from garageofcode.sat.fifteen_puzzle import bmc, scramble
+
+def neighbours(board, n):
+    """
+    Boards one move of the empty square away, boards as tuples in row order
+    """
+    e = board.index(0)
+    i, j = divmod(e, n)
+    for di, dj in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+        if 0 <= i + di < n and 0 <= j + dj < n:
+            k = (i + di) * n + j + dj
+            nb = list(board)
+            nb[e], nb[k] = nb[k], nb[e]
+            yield tuple(nb)
+
+def distance(start, goal, n):
+    dist = {start: 0}
+    queue = deque([start])
+    while queue:
+        board = queue.popleft()
+        if board == goal:
+            return dist[board]
+        for nb in neighbours(board, n):
+            if nb not in dist:
+                dist[nb] = dist[board] + 1
+                queue.append(nb)
+    return None
+
+def to_board(ij2k, n):
+    return tuple(ij2k[(i, j)] for i in range(n) for j in range(n))
+
+def solution_board(solver, Xr):
+    return tuple([solver.solution_value(x) for x in tile].index(1)
+                 for row in Xr for tile in row)
+
+def check(start, goal, n, max_steps):
+    solver, X = bmc(start, goal, max_steps=max_steps, n=n)
+    expected = distance(to_board(start, n), to_board(goal, n), n)
+    if expected is None or expected > max_steps:
+        assert X is None
+        return
+    assert X is not None and len(X) - 1 == expected
+    path = [solution_board(solver, Xr) for Xr in X]
+    assert path[0] == to_board(start, n)
+    assert path[-1] == to_board(goal, n)
+    for b0, b1 in zip(path, path[1:]):
+        assert b1 in set(neighbours(b0, n)), (b0, b1)
+
+def test_scrambled(num_instances=10, seed=0):
+    random.seed(seed)
+    n = 3
+    solved = {(i, j): i * n + j for j in range(n) for i in range(n)}
+    for _ in range(num_instances):
+        check(scramble(random.randint(0, 12), n), solved, n, max_steps=12)
+
+def test_unreachable():
+    # swapping two numbers changes the parity, so no path exists
+    n = 2
+    start = {(0, 0): 0, (0, 1): 1, (1, 0): 2, (1, 1): 3}
+    goal = {(0, 0): 0, (0, 1): 2, (1, 0): 1, (1, 1): 3}
+    check(start, goal, n, max_steps=6)
+
+def test_max_steps():
+    n = 3
+    solved = {(i, j): i * n + j for j in range(n) for i in range(n)}
+    random.seed(1)
+    start = scramble(20, n)
+    steps = distance(to_board(start, n), to_board(solved, n), n)
+    check(start, solved, n, max_steps=steps - 1)
+
+def main():
+    test_scrambled()
+    test_unreachable()
+    test_max_steps()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
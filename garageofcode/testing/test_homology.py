@@ -0,0 +1,82 @@
+"""
+Persistent homology of tda/homology against the textbook reduction
+of the full boundary matrix of the flag complex, on small random point clouds
+"""
+import numpy as np
+
+from garageofcode.tda import homology, metrics
+
+def brute_force(G):
+    """
+    Diagrams in dimension 0 and 1 from the boundary matrix
+    of all vertices, edges and triangles, reduced over Z/2
+    """
+    N = G.shape[0]
+    D = G.toarray()
+    edges = [(i, j) for i in range(N) for j in range(i + 1, N) if G[i, j] or G[j, i]]
+    edge_set = set(edges)
+    triangles = [(i, j, k) for i, j in edges for k in range(j + 1, N)
+                 if (i, k) in edge_set and (j, k) in edge_set]
+    simplices = [((0.0, 0), (i,)) for i in range(N)] + \
+                [((D[i, j], 1), e) for e in edges for i, j in [e]] + \
+                [((max(D[i, j], D[i, k], D[j, k]), 2), t) for t in triangles for i, j, k in [t]]
+    simplices.sort(key=lambda s: s[0])
+    idx = {s: n for n, (_, s) in enumerate(simplices)}
+    value = [v for (v, _), _ in simplices]
+    dim = [d for (_, d), _ in simplices]
+
+    low2col = {}
+    paired = set()
+    dgms = {0: [], 1: []}
+    for c, (_, s) in enumerate(simplices):
+        col = set(idx[f] for f in ([s[:m] + s[m+1:] for m in range(len(s))] if len(s) > 1 else []))
+        while col and max(col) in low2col:
+            col ^= low2col[max(col)]
+        if col:
+            low = max(col)
+            low2col[low] = col
+            paired.update([low, c])
+            if dim[low] <= 1:
+                dgms[dim[low]].append((value[low], value[c]))
+    for c in range(len(simplices)):
+        if c not in paired and dim[c] <= 1:
+            dgms[dim[c]].append((value[c], np.inf))
+    return dgms
+
+def nonzero_pairs(dgm):
+    return sorted((b, d) for b, d in np.asarray(dgm).reshape(-1, 2).tolist() if d > b)
+
+def check(G):
+    dgms = homology.persistence(G)
+    expected = brute_force(G)
+    assert np.allclose(sorted(map(tuple, dgms[0].tolist())), sorted(expected[0]))
+    pairs, expected_pairs = nonzero_pairs(dgms[1]), nonzero_pairs(expected[1])
+    assert len(pairs) == len(expected_pairs), (pairs, expected_pairs)
+    assert np.allclose(pairs, expected_pairs), (pairs, expected_pairs)
+
+def test_random(num_instances=30, seed=0):
+    rng = np.random.RandomState(seed)
+    for _ in range(num_instances):
+        X = rng.rand(rng.randint(3, 16), 2)
+        check(metrics.knn_graph(X, rng.randint(1, 5)))
+        check(metrics.epsilon_graph(X, rng.uniform(0.2, 0.8)))
+
+def test_circle():
+    # one long lived loop, born at the side and killed by the diagonals
+    t = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    X = np.stack([np.cos(t), np.sin(t)], axis=1)
+    dgms = homology.persistence(metrics.knn_graph(X, 11))
+    lifetimes = homology.lifetimes(dgms[1])
+    assert len(lifetimes) == 1
+    side = 2 * np.sin(np.pi / 12)
+    assert np.isclose(dgms[1][0, 0], side)
+    assert np.isclose(dgms[1][0, 1], 2 * np.sin(4 * np.pi / 12))
+    assert np.isinf(homology.lifetimes(dgms[0])[0])
+
+def main():
+    test_circle()
+    test_random()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+CNF preprocessing against brute force on random small formulas:
+the simplified formula has the same models on the core variables,
+and every one of its models is extended to a model of the original
+"""
+import random
+from itertools import product
+
+from garageofcode.sat.preprocess import preprocess
+
+def satisfies(var2val, cnf):
+    return all(any(var2val.get(abs(lit), 0) == (lit > 0) for lit in clause) for clause in cnf)
+
+def assignments(num_vars):
+    for bits in product([0, 1], repeat=num_vars):
+        yield dict(zip(range(1, num_vars + 1), bits))
+
+def random_cnf(rng, num_vars):
+    return [[rng.choice([-1, 1]) * rng.randint(1, num_vars) for _ in range(rng.randint(1, 4))]
+            for _ in range(rng.randint(0, 4 * num_vars))]
+
+def check(cnf, num_vars, core):
+    cnf_simple, reconstruction = preprocess(cnf, core=core)
+    assert all(abs(lit) <= num_vars for clause in cnf_simple for lit in clause)
+    projections, projections_simple = set(), set()
+    for var2val in assignments(num_vars):
+        projection = tuple(var2val[var] for var in core)
+        if satisfies(var2val, cnf):
+            projections.add(projection)
+        if satisfies(var2val, cnf_simple):
+            projections_simple.add(projection)
+            # whatever the removed variables are, the extended model is one
+            model = [var if val else -var for var, val in var2val.items()]
+            assert satisfies(reconstruction.extend(model), cnf), (cnf, core, var2val)
+    assert projections == projections_simple, (cnf, core)
+    return len(reconstruction)
+
+def test_random(num_instances=500, seed=0):
+    rng = random.Random(seed)
+    num_removed = 0
+    for _ in range(num_instances):
+        num_vars = rng.randint(1, 8)
+        core = sorted(rng.sample(range(1, num_vars + 1), rng.randint(0, num_vars)))
+        num_removed += check(random_cnf(rng, num_vars), num_vars, core)
+    assert num_removed
+
+def test_elimination():
+    # 2 and 3 only connect 1 and 4, and are eliminated
+    cnf = [[1, 2], [-2, 3], [-3, 4], [-1, -4, 5], [-5, 1]]
+    cnf_simple, reconstruction = preprocess(cnf, core=[1, 4, 5])
+    assert not any(abs(lit) in [2, 3] for clause in cnf_simple for lit in clause)
+    check(cnf, 5, [1, 4, 5])
+
+def test_input_unchanged():
+    cnf = [[1, 2], [1], [-2, 3]]
+    copy = [list(clause) for clause in cnf]
+    preprocess(cnf, core=[3])
+    assert cnf == copy
+
+def test_unsat():
+    cnf_simple, _ = preprocess([[1, 2], [-1], [-2]])
+    assert cnf_simple == [[]]
+
+def main():
+    test_elimination()
+    test_input_unchanged()
+    test_unsat()
+    test_random()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
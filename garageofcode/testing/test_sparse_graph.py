@@ -0,0 +1,77 @@
+"""
+Dinic's max flow and the Laplacian resistor network solver
+in networkx/sparse_graph against networkx on random graphs
+"""
+import random
+
+import numpy as np
+import networkx as nx
+
+from garageofcode.networkx import sparse_graph
+
+def random_digraph(rng, n, p):
+    G = nx.DiGraph()
+    G.add_nodes_from(range(n))
+    for u in range(n):
+        for v in range(n):
+            if u != v and rng.random() < p:
+                G.add_edge(u, v, capacity=rng.randint(1, 10))
+    return G
+
+def test_max_flow(num_instances=100, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_instances):
+        n = rng.randint(2, 12)
+        G = random_digraph(rng, n, rng.uniform(0.1, 0.6))
+        nodes, node2idx, tails, heads, caps = sparse_graph.to_arrays(G, "capacity")
+        value, flows = sparse_graph.max_flow(n, tails, heads, caps, 0, n - 1)
+        assert abs(value - nx.maximum_flow_value(G, 0, n - 1)) < 1e-9
+        # the flows are feasible, and conserved except at s and t
+        assert np.all(flows >= 0) and np.all(flows <= caps + 1e-9)
+        net = np.bincount(heads, flows, n) - np.bincount(tails, flows, n)
+        assert np.allclose(net[1:-1], 0)
+        assert abs(net[-1] - value) < 1e-9
+
+def test_resistance(num_instances=50, seed=1):
+    rng = random.Random(seed)
+    for _ in range(num_instances):
+        n = rng.randint(2, 12)
+        G = nx.connected_watts_strogatz_graph(n, min(n - 1, 2), 0.5, seed=rng.randint(0, 1000)) \
+            if n > 2 else nx.path_graph(2)
+        for u, v in G.edges:
+            G.edges[u, v]["r"] = rng.uniform(0.5, 2)
+        s, t = rng.sample(range(n), 2)
+        for method in ["direct", "cg"]:
+            R = sparse_graph.effective_resistance(G, s, t, "r", method=method)
+            assert abs(R - nx.resistance_distance(G, s, t, weight="r", invert_weight=True)) < 1e-6
+
+def test_potentials():
+    # two paths of resistance 2 in parallel, and a node off to the side
+    G = nx.Graph([(0, 1), (1, 3), (0, 2), (2, 3)])
+    G.add_node(4)
+    potentials, currents, R = sparse_graph.get_potentials(G, 0, 3, U=2.0)
+    assert abs(R - 1) < 1e-9
+    assert np.allclose([potentials[i] for i in range(4)], [2, 1, 1, 0])
+    assert np.isnan(potentials[4])
+    assert np.allclose(np.abs(list(currents.values())), 1)
+
+def test_same_terminals():
+    G = nx.path_graph(3)
+    for call in [lambda: sparse_graph.get_potentials(G, 1, 1),
+                 lambda: sparse_graph.max_flow(3, np.array([0, 1]), np.array([1, 2]),
+                                               np.ones(2), 1, 1)]:
+        try:
+            call()
+            assert False, "s == t is refused"
+        except ValueError:
+            pass
+
+def main():
+    test_max_flow()
+    test_resistance()
+    test_potentials()
+    test_same_terminals()
+    print("ok")
+
+if __name__ == '__main__':
+    main()
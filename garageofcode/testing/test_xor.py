@@ -0,0 +1,88 @@
+"""
+XOR constraints in SugarRush against brute force,
+on random mixes of clauses (unit clauses included) and XORs
+"""
+import random
+from itertools import product
+
+from garageofcode.sat.solver import SugarRush
+
+def satisfies(assignment, clauses, xors):
+    value = lambda lit: assignment[abs(lit)] ^ (lit < 0)
+    return all(any(value(lit) for lit in clause) for clause in clauses) and \
+           all(sum(value(lit) for lit in lits) % 2 == parity for lits, parity in xors)
+
+def brute_force(num_vars, clauses, xors):
+    for bits in product([0, 1], repeat=num_vars):
+        if satisfies(dict(zip(range(1, num_vars + 1), bits)), clauses, xors):
+            return True
+    return False
+
+def random_lits(rng, num_vars, size):
+    return [rng.choice([-1, 1]) * rng.randint(1, num_vars) for _ in range(size)]
+
+def random_instance(rng, num_vars):
+    clauses = [random_lits(rng, num_vars, rng.randint(1, 3))
+               for _ in range(rng.randint(0, 2 * num_vars))]
+    xors = [(random_lits(rng, num_vars, rng.randint(1, num_vars)), rng.randint(0, 1))
+            for _ in range(rng.randint(1, num_vars))]
+    return clauses, xors
+
+def check(clauses, xors, num_vars, portfolio=False):
+    with SugarRush(keep_clauses=portfolio) as solver:
+        X = [solver.var() for _ in range(num_vars)]
+        solver.add(clauses)
+        for lits, parity in xors:
+            solver.add_xor(lits, parity)
+        if portfolio:
+            satisfiable = solver.solve_portfolio(configs=[("glucose4", 0), ("minisat22", 0)])
+        else:
+            satisfiable = solver.solve()
+        assert satisfiable == brute_force(num_vars, clauses, xors), (clauses, xors)
+        if satisfiable:
+            # variables in no clause are free, and left out of the model
+            assignment = {var: solver.var2val.get(var, 0) if portfolio else 0 for var in X}
+            if not portfolio:
+                model = solver.get_model()
+                assert model is not None
+                assignment.update({abs(lit): (lit > 0) * 1 for lit in model})
+            assert satisfies(assignment, clauses, xors), (clauses, xors)
+
+def test_unit_clauses():
+    # pysat does not count unit clauses in nof_clauses
+    check([[1]], [([-1], 1)], 1)
+    check([[1], [2], [3], [-1]], [([1, 2], 0)], 3)
+
+def test_pure_xor():
+    # answered by elimination alone, with a model and no clauses added
+    with SugarRush() as solver:
+        X = [solver.var() for _ in range(4)]
+        xors = [([1, 2, 3], 1), ([2, 3], 0), ([3, -4], 1)]
+        for lits, parity in xors:
+            solver.add_xor(lits, parity)
+        assert solver.solve()
+        assert not solver.has_clauses
+        model = {abs(lit): (lit > 0) * 1 for lit in solver.get_model()}
+        assert satisfies(model, [], xors)
+        assert solver.solution_values(X) == [model[x] for x in X]
+    check([], [([1, 2], 1), ([1, 2], 0)], 2)
+
+def test_portfolio_xors():
+    check([[1, 2]], [([1, 2], 0)], 2, portfolio=True)
+    check([[1, 2], [-1, -2]], [([1, 2], 0)], 2, portfolio=True)
+
+def test_random(num_instances=300, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_instances):
+        num_vars = rng.randint(1, 6)
+        check(*random_instance(rng, num_vars), num_vars)
+
+def main():
+    test_unit_clauses()
+    test_pure_xor()
+    test_portfolio_xors()
+    test_random()
+    print("ok")
+
+if __name__ == '__main__':
+    main()